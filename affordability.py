@@ -0,0 +1,80 @@
+# affordability.py
+"""
+Affordability finder: which ZIPs can a household afford?
+
+A household with income I, a down payment D and a price-to-income limit T
+can borrow up to T·I, so its budget is T·I + D and it can afford every ZIP
+whose median sale price is at most that budget. Its own PTI in a ZIP is
+then (price - D) / I, which is <= T exactly for those ZIPs.
+
+AffordabilityIndex holds one year's ZIPs sorted by median sale price (from
+the cube's ZIP tables, with each ZIP's local PTI alongside), so the ZIPs a
+household can afford are always a prefix of the arrays: one
+np.searchsorted for the budget, then a slice. A metro filter is a boolean
+mask over that prefix. House rows are never re-read and compute_pti is
+not re-run per query.
+
+    index = cube.affordability(2023)
+    index.query(income=95_000, down_payment=60_000, max_pti=4.5)
+"""
+
+import numpy as np
+import pandas as pd
+
+RESULT_COLUMNS = [
+    "zip_code_str", "city", "city_full", "price", "local_pti", "user_pti", "headroom",
+    "rank", "rank_total", "lat", "lon",
+]
+
+
+def max_price(income: float, down_payment: float, max_pti: float) -> float:
+    """Highest affordable sale price: max_pti × income + down payment."""
+    if income <= 0:
+        raise ValueError("income must be positive")
+    if max_pti <= 0:
+        raise ValueError("max_pti must be positive")
+    return float(max_pti) * float(income) + max(float(down_payment), 0.0)
+
+
+class AffordabilityIndex:
+    """
+    One year's ZIPs sorted by median sale price. `frame` has
+    zip_code_str, city, city_full, price, local_pti, lat, lon; rows
+    without a price are dropped.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        frame = frame[frame["price"].notna()]
+        order = np.argsort(frame["price"].to_numpy(dtype=np.float64), kind="stable")
+        self.frame = frame.iloc[order].reset_index(drop=True)
+        self.price = self.frame["price"].to_numpy(dtype=np.float64)
+        self.city = self.frame["city"].astype(str).to_numpy()
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def count(self, budget: float) -> int:
+        """Number of ZIPs priced at or below `budget` (binary search)."""
+        return int(np.searchsorted(self.price, budget, side="right"))
+
+    def query(self, income: float, down_payment: float, max_pti: float, metros=None) -> pd.DataFrame:
+        """
+        Every affordable ZIP (optionally only in `metros`), most affordable
+        first (RESULT_COLUMNS): the household's PTI there, how much of the
+        budget is left (headroom) and the rank among the results.
+        """
+        budget = max_price(income, down_payment, max_pti)
+        n = self.count(budget)
+        found = self.frame.iloc[:n]
+        price = self.price[:n]
+        if metros is not None:
+            mask = np.isin(self.city[:n], [str(m) for m in metros])
+            found, price = found[mask], price[mask]
+        found = found.assign(
+            user_pti=np.maximum(price - max(float(down_payment), 0.0), 0.0) / float(income),
+            headroom=budget - price,
+            # Sorted by price, so ties share the first position (method="min")
+            rank=np.searchsorted(price, price, side="left") + 1,
+            rank_total=len(price),
+        )
+        return found[RESULT_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,566 @@
+# api_server.py
+"""
+Read-only HTTP/JSON API over the metric cube.
+
+Serves the numbers the app shows — metro and ZIP values, ranks,
+percentiles, YoY and history — to other tools, from the same cube and
+config_data.compute_rankings as the app:
+
+    GET  /v1/meta                                   years, metrics, data version
+    GET  /v1/metros?year=&metric=                   every metro, ranked nationally
+    GET  /v1/metros/{city}?year=&metric=            one metro + its ZIPs ranked within it
+    GET  /v1/metros/{city}/history?metric=          the metro's value for every year
+    GET  /v1/zips?zips=02139,10001&year=&metric=    batch: ZIP values, ranks and YoY
+    POST /v1/zips  {"zips": [...], "year": ..., "metric": ...}
+    GET  /v1/zips/history?zips=...&metric=&resolution=Y|Q|M
+    GET  /v1/percentile?value=450000&state=NE&year=&metric=   where a value sits
+
+`year` defaults to the latest year and `metric` to the median sale price;
+windowed metrics are named with their window ("Price CAGR (5y)").
+
+Every (year, metric) is indexed once per cube version: a ZIP table ranked
+within each metro, its state and the nation (cube.percentiles) with its
+YoY, and a metro table ranked nationally. A
+request is then a lookup plus JSON encoding, and the encoded body is kept
+in an LRU cache keyed by the cube version, so repeated requests are served
+from bytes. Responses carry a content ETag (If-None-Match → 304),
+Cache-Control, and are gzipped for clients that accept it. Connections are
+kept alive (HTTP/1.1). The cube is refreshed in the background; a new data
+version changes every ETag.
+
+Usage (from the repository root):
+
+    python api_server.py                      # http://127.0.0.1:8770
+    python api_server.py --host 0.0.0.0 --port 9000
+    curl 'localhost:8770/v1/zips?zips=10001,10002&metric=Price-to-Income%20Ratio%20(PTI)'
+"""
+
+import argparse
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import config_data as cd
+import instrumentation
+from metric_cube import WARM_HOTSPOTS_ENV, get_metric_cube
+from metrics import PRICE_METRIC, concrete_metrics, get_metric
+
+API_VERSION = "v1"
+MAX_BATCH_ZIPS = 1000
+MAX_BODY_BYTES = 64 * 1024
+CACHE_ENTRIES = 4096           # encoded responses kept per process
+INDEX_ENTRIES = 256            # (year, metric) lookup tables kept per process
+MAX_AGE = 60                   # Cache-Control max-age (seconds)
+GZIP_MIN_BYTES = 1024
+
+
+class ApiError(Exception):
+    """A request error answered with `status` and {"error": message}."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ============================================================
+# 1. Lookup tables
+# ============================================================
+
+def _records(df: pd.DataFrame) -> list:
+    """Rows as JSON-ready dicts (NaN → null, numpy scalars → Python)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+class CubeIndex:
+    """
+    Per-(year, metric) lookup tables built from the cube for one data
+    version; rebuilt lazily after the cube refreshes.
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        self._tables = OrderedDict()
+        self._version = cube.version
+        self._lock = threading.Lock()
+        self._building = {}    # key → lock held while that table is built
+
+    def _table(self, kind: str, year: int, metric: str, build):
+        key = (kind, year, metric)
+        with self._lock:
+            if self._version != self.cube.version:
+                self._tables.clear()
+                self._version = self.cube.version
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+            build_lock = self._building.setdefault(key, threading.Lock())
+        # Built once per key; other keys build concurrently
+        with build_lock:
+            with self._lock:
+                table = self._tables.get(key)
+            if table is not None:
+                return table
+            version = self.cube.version
+            try:
+                table = build(year, metric)
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+            with self._lock:
+                if self._version == version:
+                    self._tables[key] = table
+                    if len(self._tables) > INDEX_ENTRIES:
+                        self._tables.popitem(last=False)
+        return table
+
+    def zips(self, year: int, metric: str) -> pd.DataFrame:
+        """Every ZIP of the year, ranked within its metro, with YoY; indexed by ZIP."""
+        return self._table("zip", year, metric, self._build_zips)
+
+    def metros(self, year: int, metric: str) -> pd.DataFrame:
+        """Every metro of the year, ranked nationally, with YoY; indexed by metro key."""
+        return self._table("metro", year, metric, self._build_metros)
+
+    def _build_zips(self, year, metric):
+        spec = get_metric(metric)
+        df = self.cube.zip_metric(year, metric)
+        df = pd.DataFrame({
+            "zip": df["zip_code_str"].astype(str).to_numpy(),
+            "city": df["city"].astype(str).to_numpy(),
+            "city_full": df["city_full"].astype(str).to_numpy(),
+            "value": df["metric_value"].astype("float64").to_numpy(),
+        })
+        df = df[df["value"].notna()]
+        df = cd.compute_rankings(df, "value", "zip", group_col="city")
+        context = self.cube.percentiles(year, metric).table()
+        context = context.drop(columns=["city_full", "metric_value"]).rename(columns={"zip_code_str": "zip"})
+        df = df.merge(context.drop_duplicates(["city", "zip"]), on=["city", "zip"], how="left")
+        if year - 1 in self.cube.years():
+            prev = self.cube.zip_metric(year - 1, metric)
+            prev = pd.DataFrame({
+                "zip": prev["zip_code_str"].astype(str).to_numpy(),
+                "city": prev["city"].astype(str).to_numpy(),
+                "prev_value": prev["metric_value"].astype("float64").to_numpy(),
+            }).drop_duplicates(["city", "zip"])
+            df = df.merge(prev, on=["city", "zip"], how="left")
+        else:
+            df["prev_value"] = np.nan
+        df["yoy_change"] = df["value"] - df["prev_value"]
+        df["yoy_pct"] = (df["value"] / df["prev_value"] - 1) * 100
+        df["yoy"] = spec.yoy(df["yoy_pct"], df["yoy_change"])
+        return df.set_index(df["zip"].to_numpy()).sort_index(kind="stable")
+
+    def _build_metros(self, year, metric):
+        spec = get_metric(metric)
+        df = self.cube.city_metric(year, metric)
+        df = df[df["avg_metric_value"].notna()]
+        df = pd.DataFrame({
+            "city": df["city"].astype(str).to_numpy(),
+            "city_full": df["city_full"].astype(str).to_numpy(),
+            "n_zips": df["n"].astype(int).to_numpy(),
+            "value": df["avg_metric_value"].astype("float64").to_numpy(),
+        })
+        df = cd.compute_rankings(df, "value", "city")
+        # The app's metro YoY (config_data.compute_yoy)
+        yoy = self.cube.metro_yoy(year, metric)
+        prev_col = next((c for c in yoy.columns if c.endswith("_prev")), None)
+        if prev_col is not None:
+            yoy = pd.DataFrame({
+                "city": yoy["city"].astype(str).to_numpy(),
+                "prev_value": yoy[prev_col].astype("float64").to_numpy(),
+                "yoy_change": yoy["yoy_change"].astype("float64").to_numpy(),
+                "yoy_pct": yoy["yoy_pct"].astype("float64").to_numpy(),
+            })
+            df = df.merge(yoy, on="city", how="left")
+        else:
+            df[["prev_value", "yoy_change", "yoy_pct"]] = np.nan
+        df["yoy"] = spec.yoy(df["yoy_pct"], df["yoy_change"])
+        df = df.sort_values("rank", kind="stable")
+        return df.set_index(df["city"].to_numpy())
+
+
+# ============================================================
+# 2. Endpoints
+# ============================================================
+
+_ZIP_RE = re.compile(r"^\d{5}$")
+_ZIP_FIELDS = ["zip", "city", "city_full", "state", "value", "rank", "rank_total", "percentile",
+               "state_rank", "state_total", "state_percentile",
+               "national_rank", "national_total", "national_percentile",
+               "prev_value", "yoy_change", "yoy_pct", "yoy"]
+_METRO_FIELDS = ["city", "city_full", "n_zips", "value", "rank", "rank_total", "percentile",
+                 "prev_value", "yoy_change", "yoy_pct", "yoy"]
+
+
+def _metric(params: dict) -> str:
+    name = params.get("metric") or PRICE_METRIC
+    try:
+        spec = get_metric(name)
+    except KeyError:
+        raise ApiError(400, f"unknown metric {name!r}; see /{API_VERSION}/meta")
+    if spec.windows and spec.window is None:
+        raise ApiError(400, f"{spec.name!r} needs a window, e.g. {spec.with_window(spec.windows[0]).name!r}")
+    return spec.name
+
+
+def _year(cube, params: dict) -> int:
+    years = cube.years()
+    if not years:
+        raise ApiError(503, "no data loaded")
+    raw = params.get("year")
+    if raw in (None, ""):
+        return years[-1]
+    try:
+        year = int(raw)
+    except ValueError:
+        raise ApiError(400, f"bad year {raw!r}")
+    if year not in years:
+        raise ApiError(404, f"no data for {year} (years {years[0]}–{years[-1]})")
+    return year
+
+
+def _zip_list(params: dict) -> list:
+    raw = params.get("zips") or ""
+    zips = [z.strip() for z in raw.split(",") if z.strip()]
+    zips = list(dict.fromkeys(z.zfill(5) if z.isdigit() else z for z in zips))
+    if not zips:
+        raise ApiError(400, "pass one or more ZIPs: zips=02139,10001")
+    if len(zips) > MAX_BATCH_ZIPS:
+        raise ApiError(400, f"at most {MAX_BATCH_ZIPS} ZIPs per request")
+    bad = [z for z in zips if not _ZIP_RE.match(z)]
+    if bad:
+        raise ApiError(400, f"bad ZIP codes: {', '.join(bad[:10])}")
+    return zips
+
+
+def _metric_info(metric: str) -> dict:
+    spec = get_metric(metric)
+    return {"name": spec.name, "label": spec.label, "unit": spec.unit, "kind": spec.kind,
+            "change": spec.change}
+
+
+def get_meta(index: CubeIndex, params: dict) -> dict:
+    cube = index.cube
+    return {
+        "data_version": cube.version,
+        "years": cube.years(),
+        "resolutions": cube.resolutions(),
+        "default_metric": PRICE_METRIC,
+        "metrics": [_metric_info(m) for m in concrete_metrics()],
+    }
+
+
+def get_metros(index: CubeIndex, params: dict) -> dict:
+    year, metric = _year(index.cube, params), _metric(params)
+    table = index.metros(year, metric)
+    return {"year": year, "metric": metric, "metros": _records(table[_METRO_FIELDS])}
+
+
+def get_metro(index: CubeIndex, params: dict, city: str) -> dict:
+    year, metric = _year(index.cube, params), _metric(params)
+    metros = index.metros(year, metric)
+    if city not in metros.index:
+        raise ApiError(404, f"no {year} data for metro {city!r}")
+    zips = index.zips(year, metric)
+    zips = zips[zips["city"] == city].sort_values(["rank", "zip"], kind="stable")
+    return {
+        "year": year,
+        "metric": metric,
+        "metro": _records(metros.loc[[city], _METRO_FIELDS])[0],
+        "zips": _records(zips[_ZIP_FIELDS]),
+    }
+
+
+def get_metro_history(index: CubeIndex, params: dict, city: str) -> dict:
+    metric = _metric(params)
+    cube = index.cube
+    history = []
+    for year in cube.years():
+        metros = index.metros(year, metric)
+        if city in metros.index:
+            row = metros.loc[city]
+            history.append({"year": year, "value": row["value"], "rank": row["rank"],
+                            "rank_total": row["rank_total"]})
+    if not history:
+        raise ApiError(404, f"no data for metro {city!r}")
+    return {"city": city, "metric": metric, "history": _records(pd.DataFrame(history))}
+
+
+def get_zips(index: CubeIndex, params: dict) -> dict:
+    zips = _zip_list(params)
+    year, metric = _year(index.cube, params), _metric(params)
+    table = index.zips(year, metric)
+    found = table[table.index.isin(zips)]
+    missing = sorted(set(zips) - set(found.index))
+    return {"year": year, "metric": metric, "zips": _records(found[_ZIP_FIELDS]), "missing": missing}
+
+
+def get_percentile(index: CubeIndex, params: dict) -> dict:
+    year, metric = _year(index.cube, params), _metric(params)
+    raw = params.get("value")
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        value = np.nan
+    if not np.isfinite(value):
+        raise ApiError(400, f"pass a finite numeric value, e.g. value=450000 (got {raw!r})")
+    state = (params.get("state") or "").strip().upper() or None
+    pctl = index.cube.percentiles(year, metric)
+    if state is not None and state not in pctl.states():
+        raise ApiError(404, f"no {year} data for state {state!r}")
+    rank, total = pctl.rank(value, state)
+    return {
+        "year": year,
+        "metric": metric,
+        "value": value,
+        "state": state,
+        "rank": int(rank),
+        "rank_total": int(total),
+        "percentile": round(float(pctl.percentile(value, state)), 1),
+    }
+
+
+def get_zip_history(index: CubeIndex, params: dict) -> dict:
+    zips = _zip_list(params)
+    year, metric = _year(index.cube, params), _metric(params)
+    resolution = params.get("resolution") or "Y"
+    if resolution not in index.cube.resolutions():
+        raise ApiError(400, f"resolution must be one of {', '.join(index.cube.resolutions())}")
+    table = index.zips(year, metric)
+    found = table[table.index.isin(zips)]
+    # All requested ZIPs in one pass over the cube's series, then split
+    rows = index.cube.zip_series_many(zip(found["city"], found["zip"]), metric, resolution)
+    rows = pd.DataFrame({
+        "city": rows["city"].astype(str).to_numpy(),
+        "zip": rows["zip_code_str"].astype(str).to_numpy(),
+        "period": rows["period"].dt.strftime("%Y-%m-%d").to_numpy(),
+        "year": rows["year"].astype(int).to_numpy(),
+        "value": rows["metric_value"].astype("float64").to_numpy(),
+    })
+    history = {}
+    for key, record in zip(zip(rows["city"], rows["zip"]), _records(rows[["period", "year", "value"]])):
+        history.setdefault(key, []).append(record)
+    series = [
+        {"zip": zip_code, "city": city, "history": history.get((city, zip_code), [])}
+        for zip_code, city in zip(found["zip"], found["city"])
+    ]
+    missing = sorted(set(zips) - set(found.index))
+    return {"metric": metric, "resolution": resolution, "zips": series, "missing": missing}
+
+
+# (method, path pattern, handler); path groups are passed as arguments
+ROUTES = [
+    ("GET", re.compile(r"^/v1/meta$"), get_meta),
+    ("GET", re.compile(r"^/v1/metros$"), get_metros),
+    ("GET", re.compile(r"^/v1/metros/([^/]+)$"), get_metro),
+    ("GET", re.compile(r"^/v1/metros/([^/]+)/history$"), get_metro_history),
+    ("GET", re.compile(r"^/v1/zips$"), get_zips),
+    ("POST", re.compile(r"^/v1/zips$"), get_zips),
+    ("GET", re.compile(r"^/v1/zips/history$"), get_zip_history),
+    ("POST", re.compile(r"^/v1/zips/history$"), get_zip_history),
+    ("GET", re.compile(r"^/v1/percentile$"), get_percentile),
+]
+
+
+# ============================================================
+# 3. Server
+# ============================================================
+
+class Response:
+    """An encoded JSON response: body, its gzip form and a content ETag."""
+
+    __slots__ = ("status", "body", "gzipped", "etag")
+
+    def __init__(self, status: int, payload):
+        self.status = status
+        self.body = json.dumps(payload, separators=(",", ":"), allow_nan=False).encode()
+        self.gzipped = gzip.compress(self.body, 5) if len(self.body) >= GZIP_MIN_BYTES else None
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    server_version = "MetricApi/1.0"
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, every kept-alive
+    # response would wait out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._answer("GET", url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._send(Response(413, {"error": "request body too large"}))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError
+        except ValueError:
+            return self._send(Response(400, {"error": "body must be a JSON object"}))
+        params = dict(parse_qsl(url.query))
+        for key, value in body.items():
+            params[key] = ",".join(map(str, value)) if isinstance(value, list) else str(value)
+        self._answer("POST", url.path, params)
+
+    def _answer(self, method, path, params):
+        start = time.perf_counter()
+        response = self.server.respond(method, path, params)
+        if response.status == 200 and self.headers.get("If-None-Match") == response.etag:
+            self._send(response, not_modified=True)
+        else:
+            self._send(response)
+        self.server.count(response.status, time.perf_counter() - start)
+
+    def _send(self, response, not_modified=False):
+        accepts_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "")
+        body = response.gzipped if accepts_gzip and response.gzipped else response.body
+        self.send_response(304 if not_modified else response.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Vary", "Accept-Encoding")
+        if response.status == 200:
+            self.send_header("ETag", response.etag)
+            self.send_header("Cache-Control", f"public, max-age={MAX_AGE}")
+        if not_modified:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if body is response.gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Threaded API server over one cube. Encoded responses are cached per
+    (data version, method, path, parameters); a background thread keeps
+    the cube refreshed.
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, cube, host: str = cd.API_SERVER_HOST, port: int = cd.API_SERVER_PORT):
+        super().__init__((host, port), _ApiHandler)
+        self.index = CubeIndex(cube)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._building = {}    # cache key → lock held while it is built
+        self.stats = {"requests": 0, "errors": 0, "cache_hits": 0, "seconds": 0.0}
+
+    def respond(self, method: str, path: str, params: dict) -> Response:
+        params = {k: v for k, v in params.items() if v != ""}
+        path = unquote(path).rstrip("/") or "/"
+        key = (self.index.cube.version, method, path, tuple(sorted(params.items())))
+        with self._cache_lock:
+            response = self._cache.get(key)
+            if response is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return response
+            build_lock = self._building.setdefault(key, threading.Lock())
+        # Coalesced per key: a burst on one cold key computes it once, while
+        # requests for other keys build concurrently
+        with build_lock:
+            with self._cache_lock:
+                response = self._cache.get(key)
+            if response is not None:
+                return response
+            try:
+                response = self._build(method, path, params)
+            finally:
+                with self._cache_lock:
+                    self._building.pop(key, None)
+                    if response is not None and response.status < 500:
+                        self._cache[key] = response
+                        if len(self._cache) > CACHE_ENTRIES:
+                            self._cache.popitem(last=False)
+        return response
+
+    def _build(self, method, path, params) -> Response:
+        allowed = False
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                return Response(200, handler(self.index, params, *match.groups()))
+            except ApiError as e:
+                return Response(e.status, {"error": str(e)})
+            except Exception as e:  # a bad request must not take the server down
+                instrumentation.logger.exception("api %s %s failed", method, path)
+                return Response(500, {"error": f"{type(e).__name__}: {e}"})
+        if allowed:
+            return Response(405, {"error": f"{method} not supported on {path}"})
+        return Response(404, {"error": f"no such endpoint {path}; see /{API_VERSION}/meta"})
+
+    def count(self, status: int, seconds: float):
+        with self._cache_lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += status >= 400
+            self.stats["seconds"] += seconds
+
+    def _refresh_loop(self):
+        cube = self.index.cube
+        while True:
+            time.sleep(max(cube.refresh_interval, 1.0))
+            try:
+                cube.maybe_refresh()
+            except Exception:
+                instrumentation.logger.exception("api cube refresh failed")
+
+    def start(self) -> "ApiServer":
+        threading.Thread(target=self._refresh_loop, name="api-refresh", daemon=True).start()
+        threading.Thread(target=self.serve_forever, name="api-server", daemon=True).start()
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the metric cube as a read-only JSON API.")
+    parser.add_argument("--host", default=cd.API_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=cd.API_SERVER_PORT)
+    args = parser.parse_args(argv)
+
+    instrumentation.logger.setLevel(logging.WARNING)
+    # The API serves no hotspot layer: don't spend the refreshes warming it
+    os.environ[WARM_HOTSPOTS_ENV] = "0"
+    start = time.perf_counter()
+    cube = inspect.unwrap(get_metric_cube)()
+    server = ApiServer(cube, args.host, args.port)
+    print(f"Cube loaded in {time.perf_counter() - start:.1f}s · serving http://{args.host}:{args.port}/{API_VERSION}/meta")
+    threading.Thread(target=server._refresh_loop, name="api-refresh", daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
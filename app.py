@@ -1,4 +1,5 @@
 # app.py
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -9,18 +10,85 @@ import streamlit.components.v1 as components
 from config_data import (
     get_dynamic_css,
     get_colorscale,
-    load_all_data,
-    compute_pti,
     compute_rankings,
-    get_metro_yoy,
+    LOCAL_HOUSE_FILE,
     US_BOUNDS,
     US_CENTER_LAT,
     US_CENTER_LON,
     US_ZOOM_LEVEL,
+    TILE_PUBLIC_URL,
+)
+from geo_utils import (
+    load_cbsa_shapes,
+    load_zcta_shapes,
+    zcta_store_available,
+    get_zip_polygons_for_metro,
+    get_zip_neighbors,
+)
+from metric_cube import (
+    get_metric_cube,
+    choose_resolution,
+    RESOLUTIONS,
+    HISTORY_CHART_WIDTH_PX,
+)
+from metrics import get_metric, metric_names, concrete_metrics, PRICE_METRIC, PTI_METRIC
+from charts import (
+    create_city_choropleth,
+    create_zip_choropleth,
+    create_history_chart,
+    create_radius_map,
+    create_hotspot_choropleth,
+    create_affordability_map,
+    add_forecast_traces,
+)
+from forecast import (
+    HORIZONS,
+    INTERVAL,
+    series_matrix,
+    fit_trends,
+    forecast_table,
+    projection_path,
 )
-from geo_utils import load_cbsa_shapes, load_zcta_shapes, get_zip_polygons_for_metro
-from charts import create_city_choropleth, create_zip_choropleth, create_history_chart
 from events import extract_city_from_event, extract_zip_from_event
+from vector_tiles import get_tile_server, national_zip_map_html, tiles_available
+from exports import ExportRequest, export_bytes, get_export_manager, BACKGROUND_ROWS
+from affordability import max_price
+from instrumentation import (
+    timed,
+    track_cache,
+    mark_cache_miss,
+    start_rerun,
+    render_debug_panel,
+)
+
+def format_projections(fit, metric_name):
+    """One-line summary of a forecast row: growth + 1/3/5-year projections."""
+    fmt = get_metric(metric_name).format
+    if fit["model"] == "loglinear":
+        trend = f"{fit['annual_change']:+.1f}%/yr"
+    else:
+        trend = f"{fmt(fit['annual_change'])}/yr"
+        trend = trend if trend.startswith("-") else "+" + trend
+    parts = [
+        f"{int(fit['last_year']) + h}: {fmt(fit[f'proj_{h}y'])} "
+        f"({fmt(fit[f'lo_{h}y'])}–{fmt(fit[f'hi_{h}y'])})"
+        for h in HORIZONS
+    ]
+    return (
+        f"Trend {trend} over {int(fit['n_points'])} years · projected "
+        + " · ".join(parts)
+        + f" · {INTERVAL:.0%} prediction intervals"
+    )
+
+
+@track_cache("app.forecast_metro_pti")
+@st.cache_data(show_spinner=False)
+def forecast_metro_pti(ratio_agg):
+    """Linear PTI trend + projections for every metro of ratio_agg, in one batch."""
+    mark_cache_miss()
+    keys, years, values = series_matrix(ratio_agg, ["city_full"], "year", "Price_Income_Ratio")
+    return forecast_table(keys, fit_trends(years, values, "linear"))
+
 
 def render_single_metro_trend(metro_name, ratio_agg, is_dark_mode, selected_year):
 
@@ -29,6 +97,14 @@ def render_single_metro_trend(metro_name, ratio_agg, is_dark_mode, selected_year
         st.info("No affordability data available for this metro.")
         return
 
+    with timed("app.forecast_metro_pti"):
+        metro_fits = forecast_metro_pti(ratio_agg)
+    metro_fit = metro_fits[metro_fits["city_full"] == metro_name]
+    if metro_fit.empty or not np.isfinite(metro_fit["slope"].iloc[0]):
+        metro_fit = None
+    else:
+        metro_fit = metro_fit.iloc[0]
+
     fig = px.line(
         df_metro,
         x="year",
@@ -63,6 +139,14 @@ def render_single_metro_trend(metro_name, ratio_agg, is_dark_mode, selected_year
         )
     # -----------------------------
 
+    if metro_fit is not None:
+        add_forecast_traces(
+            fig,
+            projection_path(metro_fit),
+            "PTI: %{y:.2f}x (%{customdata[0]:.2f}–%{customdata[1]:.2f})",
+            "#636EFA",
+        )
+
     fig.update_layout(
         yaxis_title="Price to Income Ratio",
         xaxis_title="Year",
@@ -72,12 +156,426 @@ def render_single_metro_trend(metro_name, ratio_agg, is_dark_mode, selected_year
         showlegend=False
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    with timed("app.plotly_chart.metro_trend"):
+        st.plotly_chart(fig, use_container_width=True)
+    if metro_fit is not None:
+        st.caption(format_projections(metro_fit, PTI_METRIC))
+
+
+def render_hotspot_layer(cube, selected_year, metric_type, selected_city, gdf_merge, zip_df_city,
+                         scope, variable, map_style, is_dark_mode):
+    """Hotspot cluster map for the metro's ZIPs, from the cube's cached statistics."""
+    with st.spinner("Computing hotspot statistics..."), timed("app.cube.hotspots"):
+        hot = cube.hotspots(selected_year, metric_type, scope, variable)
+    hot_city = hot[hot["city"] == selected_city][
+        ["zip_code_str", "metric_value", "cluster", "p_value", "gi_z"]
+    ]
+    if hot_city.empty:
+        st.warning(
+            f"⚠️ No {'YoY growth' if variable == 'growth' else metric_type} values "
+            f"to analyse for {selected_year}."
+        )
+        return None, None
+
+    gdf_hot = gdf_merge.drop(columns=["metric_value"]).astype({"zip_code_str": str}).merge(
+        hot_city, on="zip_code_str", how="inner"
+    )
+    if variable == "growth":
+        value_hover = "YoY: %{customdata[2]:+.1f}%"
+    else:
+        value_hover = get_metric(metric_type).hover("%{customdata[2]}")
+    fig, gdf_zip = create_hotspot_choropleth(gdf_hot, map_style, zip_df_city, value_hover, is_dark_mode)
+
+    counts = hot_city["cluster"].value_counts()
+    found = [f"{label}: {int(n)}" for label, n in counts.items() if n and label != "Not significant"]
+    where = "within this metro" if scope == "metro" else "across all ZIPs nationally"
+    st.caption(
+        f"Local Moran's I clusters (p < 0.05, {where}) · "
+        + (" · ".join(found) if found else "no significant clusters in this metro")
+    )
+    return fig, gdf_zip
+
+
+def render_neighbor_comparison(cube, selected_year, metric_type, active_zip, active_value, neighbor_zips):
+    """Bordering ZIPs (any metro): value, YoY and difference vs the selected ZIP."""
+    st.markdown("#### 🧭 Neighboring ZIPs")
+    if not neighbor_zips:
+        st.caption("No adjacent ZIP codes found.")
+        return
+
+    with timed("app.cube.zip_compare"):
+        df_nb = cube.zip_compare(selected_year, metric_type, neighbor_zips)
+    missing = len(neighbor_zips) - len(df_nb)
+    if df_nb.empty:
+        st.caption(f"{len(neighbor_zips)} bordering ZIPs, none with {selected_year} data.")
+        return
+
+    spec = get_metric(metric_type)
+    value_label = spec.label
+    # Levels compare in %, rates / years (change="diff") as differences
+    relative = spec.change == "pct"
+    diff_format = "%+d yrs" if spec.unit == "years" else "%+.1f"
+    if relative:
+        df_nb["delta"] = (df_nb["metric_value"] / active_value - 1) * 100 if active_value else np.nan
+        delta_label, delta_format = f"vs {active_zip} %", "%+.1f%%"
+        yoy_label, yoy_format = "YoY %", "%+.1f%%"
+    else:
+        df_nb["delta"] = df_nb["metric_value"] - active_value
+        delta_label, delta_format = f"vs {active_zip}", diff_format
+        yoy_label, yoy_format = "YoY", diff_format
+    df_nb["yoy"] = spec.yoy(df_nb["yoy_pct"], df_nb["yoy_change"])
+    columns = ["zip_code_str", "metric_value", "yoy", "delta", "city_full"]
+    table = df_nb.sort_values("metric_value", ascending=False)[columns].rename(
+        columns={
+            "zip_code_str": "ZIP",
+            "metric_value": value_label,
+            "yoy": yoy_label,
+            "delta": delta_label,
+            "city_full": "Metro",
+        }
+    )
+    st.dataframe(
+        table,
+        hide_index=True,
+        column_config={
+            value_label: st.column_config.NumberColumn(format=spec.column_format),
+            yoy_label: st.column_config.NumberColumn(format=yoy_format),
+            delta_label: st.column_config.NumberColumn(format=delta_format),
+        },
+    )
+    cheaper = int((df_nb["metric_value"] < active_value).sum())
+    note = f"{cheaper} of {len(df_nb)} neighbors are below ZIP {active_zip} · in-metro neighbors are outlined on the map"
+    if missing:
+        note += f" · {missing} without {selected_year} data"
+    st.caption(note)
+
+
+def render_radius_search(cube, selected_year, metric_type, anchor_zip, map_style, is_dark_mode):
+    """
+    "ZIPs within N miles" of a ZIP or a coordinate, across metro borders.
+    Follows the selected ZIP until the user picks another center; clicking
+    a point on the mini-map re-centers the search on it.
+    """
+    # Re-center on the map ZIP when it changes, or on a mini-map click
+    if st.session_state.get("radius_anchor") != anchor_zip:
+        st.session_state["radius_anchor"] = anchor_zip
+        st.session_state["radius_zip"] = anchor_zip or ""
+    pending = st.session_state.pop("radius_zip_pending", None)
+    if pending:
+        st.session_state["radius_zip"] = pending
+
+    points = cube.zip_points(selected_year, metric_type)
+    if len(points) == 0:
+        st.caption("No ZIP coordinates available for this year.")
+        return
+
+    col_center, col_miles = st.columns([1.4, 1])
+    with col_miles:
+        miles = st.slider("Radius (miles)", 1, 100, 10, key="radius_miles")
+    with col_center:
+        center_mode = st.radio(
+            "Center on", ["ZIP", "Coordinates"], horizontal=True, key="radius_mode"
+        )
+        if center_mode == "ZIP":
+            center_zip = st.text_input("ZIP code", key="radius_zip").strip().zfill(5)
+            center = points.centroid(center_zip)
+            if center is None:
+                st.warning(f"⚠️ No {selected_year} data for ZIP {center_zip}")
+                return
+        else:
+            default = points.centroid(anchor_zip) or (float(points.lon[0]), float(points.lat[0]))
+            c_lat, c_lon = st.columns(2)
+            lat = c_lat.number_input("Latitude", value=round(default[1], 4), format="%.4f")
+            lon = c_lon.number_input("Longitude", value=round(default[0], 4), format="%.4f")
+            center = (float(lon), float(lat))
+
+    with timed("app.cube.zips_within"):
+        df_radius = cube.zips_within(selected_year, metric_type, center[0], center[1], miles)
+    if df_radius.empty:
+        st.info(f"No ZIPs with data within {miles} miles.")
+        return
+
+    spec = get_metric(metric_type)
+    value_label = spec.label
+    n_metros = df_radius["city_full"].nunique()
+    avg_text = spec.format(df_radius["metric_value"].mean())
+    n_zips = len(df_radius)
+    st.caption(
+        f"{n_zips} ZIP{'s' if n_zips != 1 else ''} in {n_metros} metro{'s' if n_metros != 1 else ''} "
+        f"within {miles} mi · avg {avg_text} · rank is within this radius"
+    )
+
+    col_list, col_mini = st.columns([1.2, 1])
+    with col_list:
+        table = df_radius[
+            ["zip_code_str", "city_full", "metric_value", "distance_miles", "rank"]
+        ].rename(
+            columns={
+                "zip_code_str": "ZIP",
+                "city_full": "Metro",
+                "metric_value": value_label,
+                "distance_miles": "Miles",
+                "rank": "Rank",
+            }
+        )
+        st.dataframe(
+            table,
+            hide_index=True,
+            height=340,
+            column_config={
+                value_label: st.column_config.NumberColumn(format=spec.column_format),
+                "Miles": st.column_config.NumberColumn(format="%.1f"),
+            },
+        )
+    with col_mini:
+        fig_radius = create_radius_map(df_radius, center, miles, map_style, metric_type, is_dark_mode)
+        if fig_radius is not None:
+            with timed("app.plotly_chart.radius_map"):
+                event = st.plotly_chart(
+                    fig_radius,
+                    width="stretch",
+                    on_select="rerun",
+                    selection_mode="points",
+                    key=f"radius_map_{selected_year}_{metric_type}_{map_style}",
+                    config={"scrollZoom": True, "displayModeBar": False},
+                )
+            clicked = extract_zip_from_event(event)
+            if (
+                center_mode == "ZIP"
+                and clicked
+                and clicked != st.session_state.get("radius_zip")
+                and clicked in set(df_radius["zip_code_str"].astype(str))
+            ):
+                st.session_state["radius_zip_pending"] = clicked
+                st.rerun()
+
+
+def render_national_zip_map(df_zip_metric, selected_year, metric_type, map_style):
+    """
+    Every ZIP nationwide, drawn from the local vector tiles and colored in
+    the browser; only this year's {zip: value} table goes with the page.
+    """
+    get_tile_server()
+    spec = get_metric(metric_type)
+    with timed("app.national_zip_values"):
+        values = df_zip_metric.groupby(
+            df_zip_metric["zip_code_str"].astype(str), observed=True
+        )["metric_value"].mean()
+        html = national_zip_map_html(
+            values.to_dict(), spec, get_colorscale(spec.palette), map_style, TILE_PUBLIC_URL
+        )
+    with timed("app.iframe.national_zip_map"):
+        st.iframe(html, height=640)
+    st.caption(
+        f"{len(values):,} ZIPs with {selected_year} data · shapes stream as vector tiles "
+        f"(only the tiles in view) · switch to Metros to drill into a metro"
+    )
+
+
+@st.fragment
+def render_affordability_finder(cube, selected_year, map_style, is_dark_mode):
+    """
+    ZIPs a household can afford in the selected year, nationwide or in
+    chosen metros: a budget query against the cube's price-sorted ZIP index.
+    A fragment, so changing the inputs reruns only the finder.
+    """
+    col_income, col_down, col_pti = st.columns(3)
+    with col_income:
+        income = st.number_input(
+            "Household income ($/yr)", min_value=1000, value=85000, step=5000, key="afford_income"
+        )
+    with col_down:
+        down_payment = st.number_input(
+            "Down payment ($)", min_value=0, value=40000, step=5000, key="afford_down"
+        )
+    with col_pti:
+        max_pti = st.slider(
+            "Max price-to-income", 1.0, 10.0, 4.0, 0.5, key="afford_pti",
+            help="Highest (price − down payment) / income you would take on",
+        )
+
+    index = cube.affordability(selected_year)
+    metro_names = dict(zip(index.frame["city"].astype(str), index.frame["city_full"].astype(str)))
+    scope = st.radio("Where", ["Nationwide", "Selected metros"], horizontal=True, key="afford_scope")
+    metros = None
+    if scope == "Selected metros":
+        metros = st.multiselect(
+            "Metros",
+            sorted(metro_names, key=metro_names.get),
+            format_func=lambda c: metro_names.get(c, c),
+            key="afford_metros",
+        )
+        if not metros:
+            st.caption("Pick one or more metros.")
+            return
+
+    price, pti = get_metric(PRICE_METRIC), get_metric(PTI_METRIC)
+    with timed("app.cube.affordability_query") as t:
+        found = index.query(income, down_payment, max_pti, metros)
+    budget = max_price(income, down_payment, max_pti)
+    st.caption(
+        f"Budget up to **{price.format(budget)}** · {len(found):,} affordable ZIP"
+        f"{'s' if len(found) != 1 else ''} in {selected_year} · answered in {t.ms:.1f} ms"
+    )
+    if found.empty:
+        st.info("No ZIP's median sale price fits this budget. Try a higher income, down payment or PTI.")
+        return
+
+    col_map, col_list = st.columns([1.3, 1])
+    with col_map:
+        fig = create_affordability_map(found, map_style, is_dark_mode)
+        if fig is not None:
+            with timed("app.plotly_chart.affordability_map"):
+                st.plotly_chart(
+                    fig,
+                    width="stretch",
+                    key=f"afford_map_{selected_year}_{map_style}",
+                    config={"scrollZoom": True, "displayModeBar": False},
+                )
+    with col_list:
+        table = found[
+            ["rank", "zip_code_str", "city_full", "price", "user_pti", "local_pti", "headroom"]
+        ].rename(
+            columns={
+                "rank": "Rank",
+                "zip_code_str": "ZIP",
+                "city_full": "Metro",
+                "price": "Price",
+                "user_pti": "Your PTI",
+                "local_pti": "Local PTI",
+                "headroom": "Left over",
+            }
+        )
+        st.dataframe(
+            table,
+            hide_index=True,
+            height=420,
+            column_config={
+                "Price": st.column_config.NumberColumn(format=price.column_format),
+                "Your PTI": st.column_config.NumberColumn(format=pti.column_format),
+                "Local PTI": st.column_config.NumberColumn(format=pti.column_format),
+                "Left over": st.column_config.NumberColumn(format=price.column_format),
+            },
+        )
+    st.caption(
+        "Your PTI: (median sale price − down payment) / your income. "
+        "Local PTI: median sale price / local per-capita income. Most affordable first."
+    )
+
+
+def render_export_panel(cube, selected_year, metric_type, current_city=None):
+    """
+    Export any scope — this metro, chosen metros or the nation, one year or
+    all — as CSV or Parquet. Small exports are written when the download
+    button is clicked; larger ones run as a background job whose progress
+    is polled without blocking the page.
+    """
+    df_city = cube.city_metric(selected_year, metric_type)
+    metro_names = dict(zip(df_city["city"].astype(str), df_city["city_full"].astype(str)))
+
+    # Scope and metro picks are per view, so drilling into a metro starts
+    # from "This metro" rather than the nationwide choice
+    view = current_city or "nation"
+    col_scope, col_years, col_level = st.columns(3)
+    with col_scope:
+        scopes = (["This metro"] if current_city else []) + ["Nationwide", "Selected metros"]
+        scope = st.radio("Scope", scopes, key=f"export_scope_{view}")
+    with col_years:
+        years_mode = st.radio("Years", [str(selected_year), "All years"], key="export_years")
+    with col_level:
+        level = st.radio("Rows", ["ZIP codes", "Metros"], key="export_level")
+
+    metros = None
+    if scope == "This metro":
+        metros = [current_city]
+    elif scope == "Selected metros":
+        metros = st.multiselect(
+            "Metros",
+            sorted(metro_names, key=metro_names.get),
+            default=[current_city] if current_city in metro_names else [],
+            format_func=lambda c: metro_names.get(c, c),
+            key=f"export_metros_{view}",
+        )
+        if not metros:
+            st.caption("Pick one or more metros.")
+            return
+    col_metrics, col_format = st.columns([3, 1])
+    with col_metrics:
+        metrics = st.multiselect(
+            "Metrics", concrete_metrics(), default=[metric_type], key="export_metrics"
+        )
+    with col_format:
+        fmt = st.radio("Format", ["csv", "parquet"], format_func=str.upper, key="export_format")
+    if not metrics:
+        st.caption("Pick one or more metrics.")
+        return
+
+    request = ExportRequest(
+        metrics,
+        [selected_year] if years_mode != "All years" else None,
+        metros,
+        "zip" if level == "ZIP codes" else "metro",
+        fmt,
+    )
+    estimate = request.estimate_rows(cube)
+    if estimate <= BACKGROUND_ROWS:
+        st.download_button(
+            label=f"📥 Download {request.file_name()}",
+            data=lambda: export_bytes(request, cube),
+            file_name=request.file_name(),
+            mime=request.mime,
+            width="stretch",
+        )
+        st.caption(f"~{estimate:,} rows · written when you click")
+        return
+
+    manager = get_export_manager()
+    st.caption(f"~{estimate:,} rows · runs in the background, you can keep exploring")
+    if st.button(f"▶️ Start export: {request.file_name()}", width="stretch"):
+        st.session_state["export_job"] = manager.submit(request, cube).id
+    job_id = st.session_state.get("export_job")
+    job = manager.get(job_id)
+    if job is None:
+        if job_id is not None:
+            st.caption("⌛ Your last export has expired. Start it again to download it.")
+        return
+    if job.active:
+        render_export_progress(job.id)
+    elif job.available:
+        size_mb = os.path.getsize(job.path) / 1e6
+        st.download_button(
+            label=f"📥 Download {job.request.file_name()} ({job.rows:,} rows, {size_mb:.1f} MB)",
+            data=job.read,
+            file_name=job.request.file_name(),
+            mime=job.request.mime,
+            width="stretch",
+            key=f"export_download_{job.id}",
+        )
+        st.caption(f"Finished in {job.elapsed:.1f}s · saved as `{job.path}`")
+    elif job.status in ("done", "expired"):
+        st.caption("⌛ Your last export has expired. Start it again to download it.")
+    elif job.status == "failed":
+        st.error(f"❌ Export failed: {job.error}")
+    else:
+        st.caption("Export cancelled.")
+
+
+@st.fragment(run_every=1.0)
+def render_export_progress(job_id):
+    """Polls a running export; reruns the page once it has finished."""
+    job = get_export_manager().get(job_id)
+    if job is None or not job.active:
+        st.rerun(scope="app")
+    st.progress(job.fraction, text=f"Exporting {job.request.file_name()} · {job.done}/{job.total} chunks")
+    if st.button("✖ Cancel", key=f"export_cancel_{job_id}"):
+        job.cancel()
 
 
+@track_cache("app.load_affordability_data")
 @st.cache_data(show_spinner="Loading required data...")
 def load_affordability_data():
-    df = pd.read_csv("data/house_ts_agg.csv")
+    mark_cache_miss()
+    df = pd.read_csv(LOCAL_HOUSE_FILE)
     df = df.fillna(0)
 
     # Price to Income Data Preparation
@@ -348,7 +846,8 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
     # ====================================
     col1, col2 = st.columns([5, 2], vertical_alignment="center")
     with col1:
-        st.plotly_chart(price_income_fig, use_container_width=True)
+        with timed("app.plotly_chart.dashboard_pti"):
+            st.plotly_chart(price_income_fig, use_container_width=True)
         st.write(
             "*Affordability levels were provided by the Center for Demographics and Policy ([Demographia International Housing Affordability, 2025 Edition](https://www.chapman.edu/communication/_files/Demographia-International-Housing-Affordability-2025-Edition.pdf)).*"
         )
@@ -357,7 +856,15 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
             "During the COVID-19 pandemic, U.S. cities experienced sharp increases in housing prices. "
             "The bar graph below illustrates the percent change in housing prices from 2020 to 2021 in selected cities."
         )
-        st.plotly_chart(covid_change_fig, use_container_width=True)
+        with timed("app.plotly_chart.dashboard_covid"):
+            st.plotly_chart(covid_change_fig, use_container_width=True)
+
+
+def stop_rerun():
+    """st.stop() that still logs the rerun summary and shows the debug panel."""
+    with st.sidebar:
+        render_debug_panel()
+    st.stop()
 
 
 # =========================================================================
@@ -368,6 +875,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+start_rerun()
 
 # =========================================================================
 # 2. Session state init
@@ -382,18 +890,22 @@ if "selected_zip" not in st.session_state:
 # =========================================================================
 # 3. Load data
 # =========================================================================
+# The metric cube holds one partition per year plus the precomputed metric /
+# ranking / YoY tables; it picks up new data incrementally (only changed
+# years are reloaded), so a data refresh never cold-starts every session.
 try:
-    df_all = load_all_data()
+    cube = get_metric_cube()
+    cube.maybe_refresh()
+    year_bounds = cube.year_bounds()
 except Exception as e:
     st.error(f"❌ Failed to read Databricks tables: {e}")
-    st.stop()
+    stop_rerun()
 
-if df_all.empty:
+if year_bounds is None:
     st.warning("⚠️ No data loaded from database.")
-    st.stop()
+    stop_rerun()
 
-min_year = int(df_all["year"].min())
-max_year = int(df_all["year"].max())
+min_year, max_year = year_bounds
 
 ratio_agg, city_order, prices_year = load_affordability_data()
 
@@ -415,10 +927,29 @@ with st.sidebar:
 
         metric_type = st.radio(
             "Metric",
-            ["Median Sale Price", "Price-to-Income Ratio (PTI)"],
+            metric_names(),
             index=0,
-            help="Price: median home sale price\nPTI: affordability (lower = more affordable)",
+            help="\n".join(get_metric(name).help for name in metric_names()),
         )
+        spec = get_metric(metric_type)
+        if spec.windows:
+            windows = [w for w in spec.windows if w <= max_year - min_year] or [1]
+            window = st.select_slider(
+                f"{spec.label} window (years)",
+                options=windows,
+                value=5 if 5 in windows else windows[-1],
+            )
+            metric_type = spec.with_window(window).name
+
+        # Only offered when the data has monthly rows
+        history_resolution = "Auto"
+        if cube.has_monthly:
+            history_resolution = st.selectbox(
+                "Trend resolution",
+                ["Auto"] + [RESOLUTIONS[r][0] for r in cube.resolutions()],
+                index=0,
+                help="Auto picks the finest resolution that fits the chart width",
+            )
 
         st.markdown("### 🗺 Basemap Style")
 
@@ -448,10 +979,10 @@ with st.sidebar:
             st.markdown("---")
             st.markdown("### 🔍 Quick Metro Search")
 
-            df_filtered_sidebar = df_all[df_all["year"] == selected_year].copy()
+            df_filtered_sidebar = cube.year_frame(selected_year)
             if not df_filtered_sidebar.empty:
                 df_city_sidebar = (
-                    df_filtered_sidebar.groupby(["city", "city_full"], as_index=False)
+                    df_filtered_sidebar.groupby(["city", "city_full"], as_index=False, observed=True)
                     .agg(avg_median_sale_price=("median_sale_price", "mean"))
                 )
                 metro_list = (
@@ -497,66 +1028,26 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-df_year = df_all[df_all["year"] == selected_year].copy()
+df_year = cube.year_frame(selected_year)
 if df_year.empty:
     st.warning(f"### ⚠️ No data available for {selected_year}")
-    st.stop()
+    stop_rerun()
 
-if metric_type == "Price-to-Income Ratio (PTI)":
-    df_year = compute_pti(df_year)
-    value_source_col = "PTI"
-    if df_year.empty:
-        st.warning(f"⚠️ PTI values out of range for {selected_year}.")
-        st.stop()
-
-    df_zip_metric = (
-        df_year.groupby(
-            ["city", "city_full", "city_clean", "zip_code_str", "year"], as_index=False
-        ).agg(
-            metric_value=("PTI", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
-    )
+# ZIP metric values, metro rankings and YoY come precomputed from the cube
+spec = get_metric(metric_type)
+with timed("app.cube.year_metric"):
+    df_zip_metric = cube.zip_metric(selected_year, metric_type)
+    df_city_map = cube.city_metric(selected_year, metric_type)
+    metro_yoy = cube.metro_yoy(selected_year, metric_type)
 
-    df_city = (
-        df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
-            n=("zip_code_str", "count"),
-            avg_metric_value=("metric_value", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
-    )
-else:
-    df_year = df_year[df_year["median_sale_price"].notna()].copy()
-    value_source_col = "median_sale_price"
-    if df_year.empty:
+if df_zip_metric.empty:
+    if metric_type == PTI_METRIC:
+        st.warning(f"⚠️ PTI values out of range for {selected_year}.")
+    elif spec.is_panel:
+        st.warning(f"⚠️ Not enough price history before {selected_year} for {metric_type}.")
+    else:
         st.warning(f"⚠️ No valid price data for {selected_year}.")
-        st.stop()
-
-    df_zip_metric = (
-        df_year.groupby(
-            ["city", "city_full", "city_clean", "zip_code_str", "year"], as_index=False
-        ).agg(
-            metric_value=("median_sale_price", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
-    )
-
-    df_city = (
-        df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
-            n=("zip_code_str", "count"),
-            avg_metric_value=("metric_value", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
-    )
-
-df_city_map = df_city.copy().reset_index(drop=True)
-df_city_map = compute_rankings(df_city_map, "avg_metric_value", "city")
-
-metro_yoy = get_metro_yoy(df_all, selected_year, metric_type)
+    stop_rerun()
 
 st.title("🏙️ Metro → ZIP Sale Price/PTI Explorer")
 st.caption(f"Year: **{selected_year}** · Metric: **{metric_type}**")
@@ -613,36 +1104,33 @@ if st.session_state["view_mode"] == "city":
 
     with col_s2:
         avg_val = df_city_map["avg_metric_value"].mean()
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Avg PTI", f"{avg_val:.2f}x")
-        else:
-            st.metric("Avg Price", f"${avg_val:,.0f}")
+        st.metric(f"Avg {spec.label}", spec.format(avg_val))
 
     with col_s3:
         top_metro = df_city_map.loc[df_city_map["avg_metric_value"].idxmax()]
         metro_label_high = top_metro["city_full"]
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Highest PTI", f"{top_metro['avg_metric_value']:.2f}x")
-        else:
-            st.metric("Highest Price", f"${top_metro['avg_metric_value']:,.0f}")
+        st.metric(
+            f"Highest {spec.label}",
+            spec.format(top_metro["avg_metric_value"]),
+        )
         st.caption(f"Metro: **{metro_label_high}**")
 
     with col_s4:
         bottom_metro = df_city_map.loc[df_city_map["avg_metric_value"].idxmin()]
         metro_label_low = bottom_metro["city_full"]
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Lowest PTI", f"{bottom_metro['avg_metric_value']:.2f}x")
-        else:
-            st.metric("Lowest Price", f"${bottom_metro['avg_metric_value']:,.0f}")
+        st.metric(
+            f"Lowest {spec.label}",
+            spec.format(bottom_metro["avg_metric_value"]),
+        )
         st.caption(f"Metro: **{metro_label_low}**")
 
     with col_s5:
         if not metro_yoy.empty and "yoy_pct" in metro_yoy.columns:
-            avg_yoy = metro_yoy["yoy_pct"].mean()
+            avg_yoy = spec.yoy(metro_yoy["yoy_pct"], metro_yoy["yoy_change"]).mean()
             if not pd.isna(avg_yoy):
                 st.metric(
                     "Avg YoY Change",
-                    f"{avg_yoy:+.1f}%",
+                    spec.format_change(avg_yoy),
                     delta="vs last year",
                     delta_color="off",
                 )
@@ -653,31 +1141,48 @@ if st.session_state["view_mode"] == "city":
 
     st.markdown("---")
 
-    fig_city = None
-    gdf_metro = None
-    try:
-        cbsa_shapes = load_cbsa_shapes()
-        fig_city, gdf_metro = create_city_choropleth(
-            df_city_map, cbsa_shapes, map_style, metric_type, is_dark_mode
+    # ZCTA vector tiles (built offline) make a nationwide ZIP map possible
+    map_level = "Metros"
+    if tiles_available():
+        map_level = st.radio(
+            "Map level", ["Metros", "ZIP codes (nationwide)"], horizontal=True, key="map_level"
         )
-    except Exception as e:
-        st.error(f"❌ Shapefile Error: {e}")
 
-    if fig_city is not None and gdf_metro is not None:
-        event = st.plotly_chart(
-            fig_city,
-            width="stretch",
-            on_select="rerun",
-            selection_mode="points",
-            key=f"metro_map_{selected_year}_{metric_type}_{map_style}",
-            config={"scrollZoom": True},
-        )
-        clicked_city = extract_city_from_event(event)
-        if clicked_city and clicked_city != st.session_state["selected_city"]:
-            st.session_state["selected_city"] = clicked_city
-            st.session_state["selected_zip"] = None
-            st.session_state["view_mode"] = "zip"
-            st.rerun()
+    if map_level != "Metros":
+        render_national_zip_map(df_zip_metric, selected_year, metric_type, map_style)
+    else:
+        fig_city = None
+        gdf_metro = None
+        try:
+            cbsa_shapes = load_cbsa_shapes()
+            fig_city, gdf_metro = create_city_choropleth(
+                df_city_map, cbsa_shapes, map_style, metric_type, is_dark_mode
+            )
+        except Exception as e:
+            st.error(f"❌ Shapefile Error: {e}")
+
+        if fig_city is not None and gdf_metro is not None:
+            with timed("app.plotly_chart.metro_map"):
+                event = st.plotly_chart(
+                    fig_city,
+                    width="stretch",
+                    on_select="rerun",
+                    selection_mode="points",
+                    key=f"metro_map_{selected_year}_{metric_type}_{map_style}",
+                    config={"scrollZoom": True},
+                )
+            clicked_city = extract_city_from_event(event)
+            if clicked_city and clicked_city != st.session_state["selected_city"]:
+                st.session_state["selected_city"] = clicked_city
+                st.session_state["selected_zip"] = None
+                st.session_state["view_mode"] = "zip"
+                st.rerun()
+
+    with st.expander("🏷️ Affordability Finder", expanded=False):
+        render_affordability_finder(cube, selected_year, map_style, is_dark_mode)
+
+    with st.expander("📥 Export data", expanded=False):
+        render_export_panel(cube, selected_year, metric_type)
 
     st.markdown("---")
 
@@ -691,7 +1196,7 @@ else:
     selected_city = st.session_state["selected_city"]
     if not selected_city:
         st.warning("⚠️ No metro selected. Please use the sidebar search to select a metro.")
-        st.stop()
+        stop_rerun()
 
     st.markdown(f"### 🗺️ `USA` → `{current_metro_name or selected_city}` → `ZIP Codes`")
     st.markdown("---")
@@ -703,7 +1208,8 @@ else:
     )
 
     try:
-        zcta_shapes = load_zcta_shapes()
+        # With the memory-mapped store, decode only this metro's ZCTAs
+        zcta_shapes = None if zcta_store_available() else load_zcta_shapes()
         zip_df_city, gdf_merge = get_zip_polygons_for_metro(
             selected_city, zcta_shapes, df_zip_metric
         )
@@ -730,25 +1236,57 @@ else:
             if st.session_state.get("selected_zip") is None and not zip_df_city.empty:
                 st.session_state["selected_zip"] = zip_df_city["zip_code_str"].iloc[0]
 
+            # Bordering ZIPs (precomputed adjacency), outlined on the map
+            neighbor_zips = get_zip_neighbors(st.session_state.get("selected_zip"))
+
+            col_layer, col_var = st.columns([2, 1])
+            with col_layer:
+                zip_layer = st.radio(
+                    "Map layer",
+                    ["Values", "Hotspots · metro", "Hotspots · national"],
+                    horizontal=True,
+                    key="zip_layer",
+                )
+            with col_var:
+                hotspot_var = st.radio(
+                    "Clusters of",
+                    ["Level", "YoY growth"],
+                    horizontal=True,
+                    key="hotspot_var",
+                    disabled=zip_layer == "Values",
+                )
+
             col_map, col_detail = st.columns([2.2, 1])
 
             with col_map:
                 city_coords = None
-                fig_zip, gdf_zip = create_zip_choropleth(
-                    gdf_merge, map_style, city_coords, zip_df_city, metric_type, is_dark_mode
-                )
-                if fig_zip is not None and gdf_zip is not None:
-                    event = st.plotly_chart(
-                        fig_zip,
-                        width="stretch",
-                        on_select="rerun",
-                        selection_mode="points",
-                        key=f"zip_map_{selected_city}_{selected_year}_{metric_type}_{map_style}",
-                        config={"scrollZoom": True},
+                if zip_layer == "Values":
+                    fig_zip, gdf_zip = create_zip_choropleth(
+                        gdf_merge, map_style, city_coords, zip_df_city, metric_type, is_dark_mode,
+                        highlight_zips=neighbor_zips,
+                    )
+                else:
+                    fig_zip, gdf_zip = render_hotspot_layer(
+                        cube, selected_year, metric_type, selected_city, gdf_merge, zip_df_city,
+                        scope="metro" if zip_layer == "Hotspots · metro" else "national",
+                        variable="growth" if hotspot_var == "YoY growth" else "level",
+                        map_style=map_style,
+                        is_dark_mode=is_dark_mode,
                     )
+                if fig_zip is not None and gdf_zip is not None:
+                    with timed("app.plotly_chart.zip_map"):
+                        event = st.plotly_chart(
+                            fig_zip,
+                            width="stretch",
+                            on_select="rerun",
+                            selection_mode="points",
+                            key=f"zip_map_{selected_city}_{selected_year}_{metric_type}_{map_style}_{zip_layer}",
+                            config={"scrollZoom": True},
+                        )
                     clicked_zip = extract_zip_from_event(event, gdf_zip)
-                    if clicked_zip:
+                    if clicked_zip and clicked_zip != st.session_state.get("selected_zip"):
                         st.session_state["selected_zip"] = clicked_zip
+                        st.rerun()  # redraw the neighbor outlines
 
             with col_detail:
                 st.subheader("📋 ZIP Details")
@@ -772,40 +1310,43 @@ else:
                         st.markdown(f"### ZIP `{active_zip}`")
                         st.caption(metro_name)
 
-                        # YoY for this ZIP
-                        if metric_type == "Price-to-Income Ratio (PTI)":
-                            zip_prev_raw = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                                & (df_all["year"] == selected_year - 1)
-                            ].copy()
-                            zip_prev_raw = compute_pti(zip_prev_raw) if not zip_prev_raw.empty else pd.DataFrame()
-                            if not zip_prev_raw.empty:
-                                prev_val = zip_prev_raw["PTI"].mean()
-                                yoy_change = ((metric_val - prev_val) / prev_val * 100)
-                                main_value = f"{metric_val:.2f}x"
-                                delta_text = f"{yoy_change:+.1f}% YoY"
-                            else:
-                                main_value = f"{metric_val:.2f}x"
-                                delta_text = "No prior year"
+                        # YoY for this ZIP from the cube's previous-year table
+                        main_value = spec.format(metric_val)
+                        prev = cube.zip_compare(selected_year, metric_type, [active_zip])
+                        prev = prev[prev["city_full"] == metro_name]
+                        if not prev.empty and pd.notna(prev["prev_value"].iloc[0]):
+                            yoy_val = spec.yoy(prev["yoy_pct"].iloc[0], prev["yoy_change"].iloc[0])
+                            delta_text = f"{spec.format_change(yoy_val)} YoY"
+                            if spec.change == "diff":
+                                delta_text += f" ({spec.format(prev['prev_value'].iloc[0])} in {selected_year - 1})"
                         else:
-                            zip_prev = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                                & (df_all["year"] == selected_year - 1)
-                                & df_all["median_sale_price"].notna()
+                            delta_text = "No prior year"
+
+                        # National / state context from the cube's sorted value arrays
+                        with timed("app.cube.percentiles"):
+                            context = cube.percentiles(selected_year, metric_type).lookup(active_zip, metro_name)
+                        scopes = [("In metro", rank, rank_total, percentile)]
+                        if context is not None:
+                            scopes += [
+                                (f"In {context['state'] or 'state'}", context["state_rank"],
+                                 context["state_total"], context["state_percentile"]),
+                                ("Nationally", context["national_rank"],
+                                 context["national_total"], context["national_percentile"]),
                             ]
-                            if not zip_prev.empty:
-                                prev_val = zip_prev["median_sale_price"].mean()
-                                yoy_change = ((metric_val - prev_val) / prev_val * 100)
-                                main_value = f"${metric_val:,.0f}"
-                                delta_text = f"{yoy_change:+.1f}% YoY"
-                            else:
-                                main_value = f"${metric_val:,.0f}"
-                                delta_text = "No prior year"
-
-                        rank_percentile = 100 - percentile
-                        if pct_diff > 5:
+                        context_cells = "".join(
+                            f"""<div style="flex: 1; text-align: center;">
+                                    <div style="font-size: 0.7rem; text-transform: uppercase; color: #6b7280;">{label}</div>
+                                    <div style="font-size: 1.05rem; font-weight: 600;">Top {100 - pct:.0f}%</div>
+                                    <div style="font-size: 0.75rem; color: #6b7280;">#{r:,} of {n:,}</div>
+                                </div>"""
+                            for label, r, n, pct in scopes
+                        )
+                        if spec.change == "diff":
+                            diff_label = (
+                                f"{spec.format_change(diff)} vs metro avg "
+                                f"({spec.format(metro_avg_now)})"
+                            )
+                        elif pct_diff > 5:
                             diff_label = f"{pct_diff:+.1f}% above metro avg"
                         elif pct_diff < -5:
                             diff_label = f"{pct_diff:+.1f}% below metro avg"
@@ -816,7 +1357,7 @@ else:
                             f"""
                             <div class="metric-card">
                                 <div style="font-size: 0.8rem; text-transform: uppercase; color: #6b7280; margin-bottom: 0.25rem;">
-                                    {'PTI Ratio' if 'PTI' in metric_type else 'Median Sale Price'}
+                                    {spec.card_title}
                                 </div>
                                 <div style="font-size: 1.6rem; font-weight: 600; margin-bottom: 0.1rem;">
                                     {main_value}
@@ -824,8 +1365,10 @@ else:
                                 <div style="font-size: 0.85rem; color: #6b7280; margin-bottom: 0.6rem;">
                                     {delta_text}
                                 </div>
+                                <div style="display: flex; gap: 0.5rem; margin-bottom: 0.6rem;">
+                                    {context_cells}
+                                </div>
                                 <div style="font-size: 0.9rem;">
-                                    <b>Rank:</b> #{rank} of {rank_total} · Top {rank_percentile:.0f}% in this metro<br>
                                     <b>Relative to metro:</b> {diff_label}
                                 </div>
                             </div>
@@ -833,69 +1376,69 @@ else:
                             unsafe_allow_html=True,
                         )
 
+                        render_neighbor_comparison(
+                            cube, selected_year, metric_type, active_zip, metric_val, neighbor_zips
+                        )
+
                         st.markdown("#### 📈 Trend")
-                        if metric_type == "Price-to-Income Ratio (PTI)":
-                            zip_hist_raw = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                            ].copy()
-                            zip_hist_raw = compute_pti(zip_hist_raw)
-                            if not zip_hist_raw.empty:
-                                zip_hist = (
-                                    zip_hist_raw.groupby("year", as_index=False)
-                                    .agg(PTI=("PTI", "mean"))
-                                    .sort_values("year")
-                                )
-                                if not zip_hist.empty:
-                                    fig_hist = create_history_chart(
-                                        zip_hist, metro_avg_now, metric_type, is_dark_mode
-                                    )
-                                    if fig_hist:
-                                        st.plotly_chart(
-                                            fig_hist,
-                                            width="stretch",
-                                            config={"displayModeBar": False},
-                                        )
-                                else:
-                                    st.caption("No historical data for this ZIP.")
-                            else:
-                                st.caption("No historical data for this ZIP.")
+                        if history_resolution == "Auto":
+                            resolution = choose_resolution(
+                                max_year - min_year + 1, HISTORY_CHART_WIDTH_PX, cube.resolutions()
+                            )
                         else:
-                            zip_hist = (
-                                df_all[
-                                    (df_all["city"] == selected_city)
-                                    & (df_all["zip_code_str"] == active_zip)
-                                    & df_all["median_sale_price"].notna()
-                                ]
-                                .groupby("year", as_index=False)
-                                .agg(price=("median_sale_price", "mean"))
-                                .sort_values("year")
+                            resolution = next(
+                                r for r, (label, _) in RESOLUTIONS.items() if label == history_resolution
                             )
-                            if not zip_hist.empty:
-                                fig_hist = create_history_chart(
-                                    zip_hist, metro_avg_now, metric_type, is_dark_mode
-                                )
-                                if fig_hist:
+                        with timed("app.cube.zip_series"):
+                            zip_hist = cube.zip_series(selected_city, active_zip, metric_type, resolution)
+                        with timed("app.cube.zip_forecast"):
+                            zip_fit = cube.zip_forecast(selected_city, active_zip, metric_type)
+                        if not zip_hist.empty:
+                            fig_hist = create_history_chart(
+                                zip_hist,
+                                metro_avg_now,
+                                metric_type,
+                                is_dark_mode,
+                                forecast_path=projection_path(zip_fit) if zip_fit is not None else None,
+                            )
+                            if fig_hist:
+                                with timed("app.plotly_chart.zip_history"):
                                     st.plotly_chart(
                                         fig_hist,
                                         width="stretch",
                                         config={"displayModeBar": False},
                                     )
-                            else:
-                                st.caption("No historical data for this ZIP.")
+                            if cube.has_monthly:
+                                st.caption(f"{RESOLUTIONS[resolution][0]} averages")
+                            if zip_fit is not None:
+                                st.caption(format_projections(zip_fit, metric_type))
+                        else:
+                            st.caption("No historical data for this ZIP.")
 
                         st.markdown("---")
-                        csv = zip_df_city[
-                            ["zip_code_str", "year", "metric_value", "city_full", "rank"]
-                        ].to_csv(index=False)
+                        metro_export = ExportRequest([metric_type], [selected_year], [selected_city])
                         st.download_button(
                             label="📥 Download ZIP-level data (CSV)",
-                            data=csv,
-                            file_name=f"{selected_city.replace(',', '_')}_{selected_year}_zipdata.csv",
-                            mime="text/csv",
-                            use_container_width=True,
+                            data=lambda: export_bytes(metro_export, cube),
+                            file_name=metro_export.file_name(),
+                            mime=metro_export.mime,
+                            width="stretch",
                         )
 
+            st.markdown("---")
+            with st.expander("📍 ZIPs within a radius", expanded=False):
+                render_radius_search(
+                    cube,
+                    selected_year,
+                    metric_type,
+                    st.session_state.get("selected_zip"),
+                    map_style,
+                    is_dark_mode,
+                )
+
+            with st.expander("📥 Export data", expanded=False):
+                render_export_panel(cube, selected_year, metric_type, selected_city)
+
             st.markdown("---")
             st.markdown("#### 📊 Metro Summary")
             col_m1, col_m2, col_m3, col_m4, col_m5 = st.columns(5)
@@ -910,48 +1453,31 @@ else:
             )
 
             values = zip_df_city["metric_value"]
-            nonzero_values = values[values > 0]
+            # Rates and drawdowns can be zero or negative; levels cannot
+            nonzero_values = values[values > 0] if spec.positive else values.dropna()
 
             with col_m1:
                 st.metric("ZIP Codes (on map)", len(zip_df_city))
 
             with col_m2:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric("Metro Avg", f"{values.mean():.2f}x")
-                else:
-                    st.metric("Metro Avg", f"${values.mean():,.0f}")
+                st.metric("Metro Avg", spec.format(values.mean()))
 
+            high_low = ("Max", "Min") if spec.positive else ("Highest", "Lowest")
             with col_m3:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric(
-                        "Max PTI",
-                        f"{nonzero_values.max():.2f}x"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
-                else:
-                    st.metric(
-                        "Max Price",
-                        f"${nonzero_values.max():,.0f}"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
+                st.metric(
+                    f"{high_low[0]} {spec.label}",
+                    spec.format(nonzero_values.max())
+                    if not nonzero_values.empty
+                    else "N/A",
+                )
 
             with col_m4:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric(
-                        "Min PTI",
-                        f"{nonzero_values.min():.2f}x"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
-                else:
-                    st.metric(
-                        "Min Price",
-                        f"${nonzero_values.min():,.0f}"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
+                st.metric(
+                    f"{high_low[1]} {spec.label}",
+                    spec.format(nonzero_values.min())
+                    if not nonzero_values.empty
+                    else "N/A",
+                )
 
             with col_m5:
                 metro_row = (
@@ -960,10 +1486,16 @@ else:
                     else pd.DataFrame()
                 )
                 if not metro_row.empty and "yoy_pct" in metro_row.columns:
-                    yoy_val = metro_row["yoy_pct"].iloc[0]
+                    yoy_val = spec.yoy(metro_row["yoy_pct"].iloc[0], metro_row["yoy_change"].iloc[0])
                     if not pd.isna(yoy_val):
-                        st.metric("YoY Change", f"{yoy_val:+.1f}%")
+                        st.metric("YoY Change", spec.format_change(yoy_val))
                     else:
                         st.metric("YoY Change", "N/A")
                 else:
                     st.metric("YoY Change", "N/A")
+
+# =========================================================================
+# 9. Debug: per-rerun timings (opt-in via ?debug=1)
+# =========================================================================
+with st.sidebar:
+    render_debug_panel()
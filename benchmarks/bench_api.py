@@ -0,0 +1,189 @@
+# benchmarks/bench_api.py
+"""
+Load benchmark for the read-only JSON API (api_server.py).
+
+Starts the API over the data folder (or targets a running one with --url)
+and drives it from several client processes, each on one kept-alive
+connection, with a fixed request mix:
+
+  - metro rankings                       GET /v1/metros
+  - one metro with its ranked ZIPs       GET /v1/metros/{city}
+  - batched ZIP lookups (25 ZIPs)        GET /v1/zips?zips=...
+  - conditional re-requests              If-None-Match → 304
+
+over every year and a few metrics, so the run covers both cold responses
+(index + encoding) and cached ones. Reports requests per second, latency
+percentiles and status counts.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_api --data-dir data --seconds 10 --clients 4
+    python -m benchmarks.bench_api --url http://127.0.0.1:8770
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPORT = os.path.join(REPO_ROOT, "benchmarks", "results", "api_report.json")
+BATCH_ZIPS = 25
+
+
+# ============================================================
+# 1. Request mix
+# ============================================================
+
+def _get(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.getheader("ETag"), response.read()
+
+
+def build_paths(base_url: str, seed: int = 0) -> list:
+    """The request mix, from the server's own /v1/meta and metro list."""
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    meta = json.loads(_get(conn, "/v1/meta")[2])
+    rng = random.Random(seed)
+    metrics = [m["name"] for m in meta["metrics"]][:3]
+    paths = []
+    for year in meta["years"]:
+        for metric in metrics:
+            q = f"year={year}&metric={quote(metric)}"
+            metros = json.loads(_get(conn, f"/v1/metros?{q}")[2])["metros"]
+            paths.append(f"/v1/metros?{q}")
+            for metro in rng.sample(metros, min(5, len(metros))):
+                paths.append(f"/v1/metros/{quote(metro['city'])}?{q}")
+            zips = [
+                z["zip"] for m in metros[:20]
+                for z in json.loads(_get(conn, f"/v1/metros/{quote(m['city'])}?{q}")[2])["zips"]
+            ]
+            for _ in range(5 if zips else 0):
+                batch = rng.sample(zips, min(BATCH_ZIPS, len(zips)))
+                paths.append(f"/v1/zips?zips={','.join(batch)}&{q}")
+    conn.close()
+    return paths
+
+
+def _client(base_url, paths, seconds, seed, queue):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    rng = random.Random(seed)
+    etags = {}
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths)
+        headers = {"Accept-Encoding": "gzip"}
+        if path in etags and rng.random() < 0.3:
+            headers["If-None-Match"] = etags[path]
+        start = time.perf_counter()
+        status, etag, _ = _get(conn, path, headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        if etag:
+            etags[path] = etag
+    conn.close()
+    queue.put((latencies, statuses))
+
+
+# ============================================================
+# 2. Run
+# ============================================================
+
+def run_load(base_url: str, paths: list, clients: int, seconds: float) -> dict:
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    queue = context.Queue()
+    procs = [
+        context.Process(target=_client, args=(base_url, paths, seconds, i, queue))
+        for i in range(clients)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for lat, _ in results for l in lat)
+    statuses = {}
+    for _, counts in results:
+        for status, n in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + n
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3) if latencies else None
+
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 2),
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "statuses": statuses,
+        "distinct_paths": len(paths),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for the JSON API.")
+    parser.add_argument("--url", default=None, help="Running API (default: start one in-process)")
+    parser.add_argument("--data-dir", default=None, help="Data folder (default: data/)")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--report", default=DEFAULT_REPORT)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DATA511_PERF_LOG", "0")
+    # No background hotspot warm-up competing with the measured clients
+    os.environ.setdefault("DATA511_WARM_HOTSPOTS", "0")
+    if args.data_dir:
+        os.environ["DATA511_DATA_DIR"] = os.path.abspath(args.data_dir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.common import environment_info, write_report
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        import inspect
+        import warnings
+
+        warnings.filterwarnings("ignore")
+        from api_server import ApiServer
+        from metric_cube import get_metric_cube
+
+        server = ApiServer(inspect.unwrap(get_metric_cube)(), "127.0.0.1", 0).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    paths = build_paths(base_url)
+    print(f"{len(paths)} distinct requests · {args.clients} clients · {args.seconds:.0f}s", file=sys.stderr)
+    result = run_load(base_url, paths, args.clients, args.seconds)
+    print(
+        f"  {result['requests_per_second']:>10,.0f} req/s   p50 {result['p50_ms']:.2f} ms   "
+        f"p90 {result['p90_ms']:.2f} ms   p99 {result['p99_ms']:.2f} ms   {result['statuses']}",
+        file=sys.stderr,
+    )
+    if server is not None:
+        result["server_cache_hits"] = server.stats["cache_hits"]
+        server.shutdown()
+
+    write_report(
+        {"benchmark": "api", "environment": environment_info(), "url": args.url, "results": result},
+        args.report,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# benchmarks/bench_app.py
+"""
+Headless interaction benchmark for app.py.
+
+Drives the real Streamlit script through streamlit.testing.v1.AppTest,
+replaying a realistic session:
+
+    cold load → year scrub → metric toggle → metro drill-down
+    → ten ZIP clicks → back → multi-metro dashboard with 20 metros
+
+For every step it records wall time, peak RSS, current RSS and the size
+of the rendered payload (all element protos, plus Plotly specs alone),
+and writes a JSON report. Everything runs offline on the local data
+folder (or DATA511_DATA_DIR).
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_app
+    python -m benchmarks.bench_app --data-dir data --budgets benchmarks/latency_budgets.json
+
+Exit status is 1 when a step raises or exceeds its latency budget,
+so the script can gate a release.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+DEFAULT_BUDGETS = os.path.join(REPO_ROOT, "benchmarks", "latency_budgets.json")
+DEFAULT_REPORT = os.path.join(REPO_ROOT, "benchmarks", "results", "app_report.json")
+
+METRIC_PRICE = "Median Sale Price"
+METRIC_PTI = "Price-to-Income Ratio (PTI)"
+
+
+# ============================================================
+# 1. AppTest helpers
+# ============================================================
+
+def _widget(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"Widget '{label}' not found in the current run")
+
+
+def _payload_bytes(at):
+    """Serialized size of every element in the current tree (+ plotly only)."""
+    total = 0
+    plotly = 0
+    for node in at._tree:
+        proto = getattr(node, "proto", None)
+        if proto is None or not hasattr(proto, "ByteSize"):
+            continue
+        size = proto.ByteSize()
+        total += size
+        if getattr(node, "type", "") == "plotly_chart":
+            plotly += size
+    return total, plotly
+
+
+def _session_inputs():
+    """
+    Pick the metro / ZIPs / dashboard metros the scripted session uses,
+    straight from the local dataset so the run is deterministic.
+    """
+    import config_data
+
+    df = config_data._load_all_data_local()
+    max_year = int(df["year"].max())
+    df_year = df[df["year"] == max_year]
+
+    zip_counts = (
+        df_year.groupby("city")["zip_code_str"].nunique().sort_values(ascending=False)
+    )
+    metro_city = str(zip_counts.index[0])
+    metro_zips = (
+        df_year[df_year["city"] == metro_city]["zip_code_str"]
+        .drop_duplicates()
+        .head(10)
+        .tolist()
+    )
+    dashboard_metros = sorted(df["city_full"].dropna().unique())[:20]
+    years = sorted(int(y) for y in df["year"].unique())
+    return {
+        "metro_city": metro_city,
+        "metro_zips": metro_zips,
+        "dashboard_metros": dashboard_metros,
+        "years": years,
+    }
+
+
+# ============================================================
+# 2. Scripted session
+# ============================================================
+
+def run_session(timeout: float = 600.0):
+    """Replay the scripted session and return a list of step dicts."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.common import current_rss_mb, peak_rss_mb, reset_peak_rss
+
+    inputs = _session_inputs()
+    steps = []
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def step(name, detail, action):
+        reset_peak_rss()
+        start = time.perf_counter()
+        error = None
+        try:
+            action()
+        except Exception as e:  # keep going, the report records the failure
+            error = f"{type(e).__name__}: {e}"
+        wall_ms = (time.perf_counter() - start) * 1000.0
+        if error is None and len(at.exception):
+            error = at.exception[0].message
+        total_bytes, plotly_bytes = _payload_bytes(at)
+        record = {
+            "name": name,
+            "detail": detail,
+            "wall_ms": round(wall_ms, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "rss_mb": round(current_rss_mb(), 1),
+            "payload_bytes": total_bytes,
+            "plotly_bytes": plotly_bytes,
+            "error": error,
+        }
+        steps.append(record)
+        print(
+            f"  {name:<16} {detail:<28} {wall_ms:>10,.0f} ms  "
+            f"peak {record['peak_rss_mb']:>8,.0f} MB  "
+            f"payload {total_bytes / 1024:>9,.0f} KB"
+            + (f"  ERROR {error}" if error else ""),
+            file=sys.stderr,
+        )
+
+    # 1. Cold load (caches were cleared above)
+    step("cold_load", "", lambda: at.run())
+
+    # 2. Warm reload, same inputs
+    step("warm_load", "", lambda: at.run())
+
+    # 3. Year scrub: walk the slider back through every year
+    for year in reversed(inputs["years"][:-1]):
+        step(
+            "year_scrub",
+            f"year={year}",
+            lambda y=year: _widget(at.slider, "Year").set_value(y).run(),
+        )
+    # Back to the latest year (recorded like the other moves, so a failure
+    # here doesn't abort the remaining steps)
+    step(
+        "year_scrub",
+        f"year={inputs['years'][-1]}",
+        lambda: _widget(at.slider, "Year").set_value(inputs["years"][-1]).run(),
+    )
+
+    # 4. Metric toggle: PTI and back to price
+    step(
+        "metric_toggle",
+        "PTI",
+        lambda: _widget(at.radio, "Metric").set_value(METRIC_PTI).run(),
+    )
+    step(
+        "metric_toggle",
+        "price",
+        lambda: _widget(at.radio, "Metric").set_value(METRIC_PRICE).run(),
+    )
+
+    # 5. Metro drill-down (same session state a map click sets)
+    def drill_down():
+        at.session_state["selected_city"] = inputs["metro_city"]
+        at.session_state["selected_zip"] = None
+        at.session_state["view_mode"] = "zip"
+        at.run()
+
+    step("metro_drilldown", inputs["metro_city"], drill_down)
+
+    # 6. Ten ZIP clicks
+    for zip_code in inputs["metro_zips"]:
+        def click(z=zip_code):
+            at.session_state["selected_zip"] = z
+            at.run()
+
+        step("zip_click", f"zip={zip_code}", click)
+
+    # 7. Back to all metros
+    step(
+        "back",
+        "",
+        lambda: _widget(at.button, "⬅️ Back to All Metros").click().run(),
+    )
+
+    # 8. Multi-metro dashboard with 20 metros
+    step(
+        "dashboard",
+        f"{len(inputs['dashboard_metros'])} metros",
+        lambda: _widget(at.multiselect, "Metropolitan Areas")
+        .set_value(inputs["dashboard_metros"])
+        .run(),
+    )
+
+    return steps, inputs
+
+
+def summarize(steps):
+    """Per-step-name aggregates (count, mean / max wall time, max peak RSS)."""
+    summary = {}
+    for s in steps:
+        agg = summary.setdefault(
+            s["name"], {"count": 0, "wall_ms_total": 0.0, "wall_ms_max": 0.0,
+                        "peak_rss_mb_max": 0.0, "payload_bytes_max": 0}
+        )
+        agg["count"] += 1
+        agg["wall_ms_total"] += s["wall_ms"]
+        agg["wall_ms_max"] = max(agg["wall_ms_max"], s["wall_ms"])
+        agg["peak_rss_mb_max"] = max(agg["peak_rss_mb_max"], s["peak_rss_mb"])
+        agg["payload_bytes_max"] = max(agg["payload_bytes_max"], s["payload_bytes"])
+    for agg in summary.values():
+        agg["wall_ms_mean"] = round(agg["wall_ms_total"] / agg["count"], 2)
+        agg["wall_ms_total"] = round(agg["wall_ms_total"], 2)
+    return summary
+
+
+# ============================================================
+# 3. CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", default=None, help="Data folder (default: data/)")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="JSON report path")
+    parser.add_argument(
+        "--budgets",
+        default=DEFAULT_BUDGETS,
+        help="Latency budget JSON; pass '' to skip the budget gate",
+    )
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-run timeout (s)")
+    args = parser.parse_args(argv)
+
+    # Must be set before config_data is imported anywhere
+    if args.data_dir:
+        os.environ["DATA511_DATA_DIR"] = os.path.abspath(args.data_dir)
+    os.environ.setdefault("DATA511_PERF_LOG", "0")
+    # No background hotspot warm-up competing with the measured session
+    os.environ.setdefault("DATA511_WARM_HOTSPOTS", "0")
+    os.chdir(REPO_ROOT)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.common import check_budgets, environment_info, write_report
+
+    print(f"Benchmarking {APP_PATH}", file=sys.stderr)
+    steps, inputs = run_session(timeout=args.timeout)
+
+    report = {
+        "benchmark": "app_session",
+        "environment": environment_info(),
+        "data_dir": os.getenv("DATA511_DATA_DIR", "data"),
+        "inputs": {k: v for k, v in inputs.items() if k != "years"},
+        "steps": steps,
+        "summary": summarize(steps),
+    }
+
+    violations = []
+    if args.budgets:
+        if os.path.exists(args.budgets):
+            violations = check_budgets(steps, args.budgets)
+        else:
+            print(f"Budget file not found: {args.budgets}", file=sys.stderr)
+    report["budget_violations"] = violations
+
+    write_report(report, args.report)
+    print(f"Report written to {args.report}", file=sys.stderr)
+
+    if violations:
+        print("Latency budget violations:", file=sys.stderr)
+        for v in violations:
+            print(f"  - {v}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
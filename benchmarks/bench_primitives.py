@@ -0,0 +1,257 @@
+# benchmarks/bench_primitives.py
+"""
+Micro-benchmarks for the config_data / geo_utils primitives.
+
+Each primitive is timed over fixed synthetic inputs (synthetic_data.py) at
+several sizes, pytest-benchmark style: a few warm-up rounds, then N timed
+rounds, reporting min / median / mean / stddev.
+
+Results can be saved as a baseline and later compared against it. A case
+fails when it is both
+
+  - statistically significant: one-sided Mann-Whitney U test on the raw
+    round timings, p < --alpha (default 0.01), and
+  - material: the median slowed down by more than --threshold (default 10%)
+
+so noise on a busy laptop does not fail the run, but real regressions do.
+Cached functions are benchmarked through their undecorated body, so cache
+hits never hide the real cost.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_primitives --save-baseline
+    python -m benchmarks.bench_primitives --compare
+    python -m benchmarks.bench_primitives --sizes small medium --filter yoy
+"""
+
+import argparse
+import inspect
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.stats import mannwhitneyu
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "primitives.json")
+DEFAULT_REPORT = os.path.join(REPO_ROOT, "benchmarks", "results", "primitives_report.json")
+
+# (n_metros, zips_per_metro, n_years)
+SIZES = {
+    "small": (10, 50, 12),
+    "medium": (30, 200, 12),
+    "large": (150, 400, 12),
+}
+
+
+# ============================================================
+# 1. Fixtures
+# ============================================================
+
+def _raw(func):
+    """Undecorated function body (skips @st.cache_data and @timed wrappers)."""
+    return inspect.unwrap(func)
+
+
+def build_fixtures(size: str) -> dict:
+    """Synthetic inputs for one size; built once and shared by every case."""
+    import synthetic_data
+    from config_data import _standardize_house_df
+
+    n_metros, zips_per_metro, n_years = SIZES[size]
+    raw = synthetic_data.generate_house_ts(n_metros, zips_per_metro, n_years, seed=0)
+    df_all = _raw(_standardize_house_df)(raw)
+    cbsa, zcta = synthetic_data.generate_shapes(n_metros, zips_per_metro, seed=0)
+    cbsa["name_lower"] = cbsa["NAME"].astype(str).str.lower()
+    zcta["zip_code_str"] = zcta["ZCTA5CE10"].astype(str).str.zfill(5)
+
+    year = int(df_all["year"].max())
+    df_year = df_all[(df_all["year"] == year) & df_all["median_sale_price"].notna()]
+    df_zip_metric = df_year.groupby(
+        ["city", "city_full", "city_clean", "zip_code_str", "year"], as_index=False
+    ).agg(
+        metric_value=("median_sale_price", "mean"),
+        lat=("lat", "mean"),
+        lon=("lon", "mean"),
+    )
+    df_city = df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
+        avg_metric_value=("metric_value", "mean"),
+        lat=("lat", "mean"),
+        lon=("lon", "mean"),
+    )
+    largest_city = df_zip_metric["city"].value_counts().index[0]
+
+    return {
+        "raw": raw,
+        "df_all": df_all,
+        "cbsa": cbsa,
+        "zcta": zcta,
+        "year": year,
+        "df_zip_metric": df_zip_metric,
+        "df_city": df_city,
+        "city": largest_city,
+        "rows": len(df_all),
+    }
+
+
+def benchmark_cases():
+    """name → callable(fixtures) returning a zero-arg function to time."""
+    import config_data as cd
+    import geo_utils as gu
+
+    return {
+        "config.compute_pti": lambda f: (
+            lambda: _raw(cd.compute_pti)(f["df_all"])
+        ),
+        "config.compute_rankings": lambda f: (
+            lambda: _raw(cd.compute_rankings)(f["df_zip_metric"], "metric_value", "zip_code_str")
+        ),
+        "config.compute_yoy": lambda f: (
+            lambda: _raw(cd.compute_yoy)(
+                f["df_all"], f["year"], ["city", "city_full"], "median_sale_price"
+            )
+        ),
+        "config._standardize_house_df": lambda f: (
+            lambda: _raw(cd._standardize_house_df)(f["raw"])
+        ),
+        "geo.build_city_cbsa_polygons": lambda f: (
+            lambda: _raw(gu.build_city_cbsa_polygons)(f["df_city"], f["cbsa"], "Median Sale Price")
+        ),
+        "geo.get_zip_polygons_for_metro": lambda f: (
+            lambda: _raw(gu.get_zip_polygons_for_metro)(f["city"], f["zcta"], f["df_zip_metric"])
+        ),
+    }
+
+
+# ============================================================
+# 2. Timing
+# ============================================================
+
+def time_case(fn, rounds: int, warmup: int = 1, max_seconds: float = 10.0) -> list:
+    """Return per-round wall times (seconds). Stops early past max_seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    budget_start = time.perf_counter()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        if len(samples) >= 5 and time.perf_counter() - budget_start > max_seconds:
+            break
+    return samples
+
+
+def describe(samples: list) -> dict:
+    arr = np.asarray(samples)
+    return {
+        "rounds": int(arr.size),
+        "min_ms": round(float(arr.min()) * 1000, 4),
+        "median_ms": round(float(np.median(arr)) * 1000, 4),
+        "mean_ms": round(float(arr.mean()) * 1000, 4),
+        "stddev_ms": round(float(arr.std(ddof=1)) * 1000, 4) if arr.size > 1 else 0.0,
+        "samples_ms": [round(float(x) * 1000, 4) for x in arr],
+    }
+
+
+def compare(results: dict, baseline: dict, alpha: float, threshold: float) -> list:
+    """Return a list of regression dicts (empty when nothing regressed)."""
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        if cur["samples_ms"] and base["samples_ms"]:
+            # One-sided: is the current run slower than the baseline?
+            p_value = float(mannwhitneyu(cur["samples_ms"], base["samples_ms"], alternative="greater").pvalue)
+        else:
+            p_value = 1.0
+        cur["baseline_median_ms"] = base["median_ms"]
+        cur["ratio"] = round(ratio, 3)
+        cur["p_value"] = round(p_value, 6)
+        if p_value < alpha and ratio > 1.0 + threshold:
+            regressions.append({"case": key, "ratio": round(ratio, 3), "p_value": p_value})
+    return regressions
+
+
+# ============================================================
+# 3. CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for data/geo primitives.")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small", "medium"])
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Time cap per case")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--report", default=DEFAULT_REPORT)
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline")
+    parser.add_argument("--compare", action="store_true", help="Fail on regressions vs baseline")
+    parser.add_argument("--alpha", type=float, default=0.01)
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    # A gate without a baseline must not pass silently (checked before the
+    # benchmark runs; baselines are per machine and not committed)
+    if args.compare and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"--compare: no baseline at {args.baseline}; run with --save-baseline first")
+
+    os.environ.setdefault("DATA511_PERF_LOG", "0")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    import json
+    import warnings
+    from benchmarks.common import environment_info, write_report
+
+    warnings.filterwarnings("ignore")
+    cases = benchmark_cases()
+    results = {}
+
+    for size in args.sizes:
+        fixtures = build_fixtures(size)
+        print(f"[{size}] {fixtures['rows']:,} rows", file=sys.stderr)
+        for name, make in cases.items():
+            if args.filter and args.filter not in name:
+                continue
+            samples = time_case(make(fixtures), args.rounds, max_seconds=args.max_seconds)
+            stats = describe(samples)
+            stats["rows"] = fixtures["rows"]
+            results[f"{name}[{size}]"] = stats
+            print(
+                f"  {name:<34} median {stats['median_ms']:>10.2f} ms  "
+                f"± {stats['stddev_ms']:.2f}  ({stats['rounds']} rounds)",
+                file=sys.stderr,
+            )
+
+    regressions = []
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh).get("results", {})
+        regressions = compare(results, baseline, args.alpha, args.threshold)
+
+    report = {
+        "benchmark": "primitives",
+        "environment": environment_info(),
+        "alpha": args.alpha,
+        "threshold": args.threshold,
+        "results": results,
+        "regressions": regressions,
+    }
+    write_report(report, args.report)
+    if args.save_baseline:
+        write_report(report, args.baseline)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+
+    if regressions:
+        print("Significant regressions:", file=sys.stderr)
+        for r in regressions:
+            print(f"  - {r['case']}: {r['ratio']:.2f}x slower (p={r['p_value']:.2g})", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
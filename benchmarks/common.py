@@ -0,0 +1,112 @@
+# benchmarks/common.py
+"""
+Shared helpers for the benchmark scripts:
+- process memory readings (current / peak RSS) without extra dependencies
+- machine-readable JSON reports
+- latency-budget checks used to gate releases
+"""
+
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+
+# ============================================================
+# 1. Memory
+# ============================================================
+
+def _read_proc_status(field: str):
+    """Return a /proc/self/status field in MB (Linux only), or None."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process right now."""
+    value = _read_proc_status("VmRSS")
+    if value is not None:
+        return value
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of the resident set size (since the last reset)."""
+    value = _read_proc_status("VmHWM")
+    if value is not None:
+        return value
+    # ru_maxrss is KB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024.0 * 1024.0) if sys.platform == "darwin" else maxrss / 1024.0
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the kernel's peak-RSS counter so the next reading is per step.
+    Works on Linux >= 4.0; elsewhere the peak stays process-wide and
+    False is returned.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# ============================================================
+# 2. Reports & budgets
+# ============================================================
+
+def environment_info() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_report(report: dict, path: str) -> str:
+    """Write a JSON report, creating the parent folder if needed."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2, default=str)
+    return path
+
+
+def check_budgets(steps: list, budget_path: str) -> list:
+    """
+    Compare step results against a budget file of the form:
+
+        {"steps": {"cold_load": {"wall_ms": 15000, "peak_rss_mb": 2500}, ...}}
+
+    Returns a list of human-readable violations (empty = within budget).
+    """
+    with open(budget_path) as fh:
+        budgets = json.load(fh).get("steps", {})
+
+    violations = []
+    for step in steps:
+        limits = budgets.get(step["name"], {})
+        for key, limit in limits.items():
+            value = step.get(key)
+            if value is None:
+                continue
+            if value > limit:
+                violations.append(
+                    f"{step['name']}: {key}={value:,.1f} exceeds budget {limit:,.1f}"
+                )
+        if step.get("error"):
+            violations.append(f"{step['name']}: raised {step['error']}")
+    return violations
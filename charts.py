@@ -15,8 +15,13 @@ from config_data import (
 from config_data import get_colorscale
 from config_data import compute_rankings
 from geo_utils import build_city_cbsa_polygons
+from instrumentation import timed
+from spatial_index import circle_lonlat, EARTH_RADIUS_MILES
+from hotspots import CLUSTER_LABELS
+from metrics import get_metric, PRICE_METRIC, PTI_METRIC
 
 # ----------------- METRO LEVEL -----------------
+@timed("charts.create_city_choropleth")
 def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mode=False):
     if df_city.empty:
         return None, None
@@ -40,30 +45,24 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
     city_polygons_4326["center_lat"] = centroids_4326.y
     city_polygons_4326["center_lon"] = centroids_4326.x
 
-    geojson = json.loads(city_polygons_4326.to_json())
+    with timed("charts.geojson.metro"):
+        geojson = json.loads(city_polygons_4326.to_json())
     vmin = float(city_polygons["avg_metric_value"].min())
     vmax = float(city_polygons["avg_metric_value"].max())
-    colorscale = get_colorscale(metric_name, is_dark_mode)
+    spec = get_metric(metric_name)
+    colorscale = get_colorscale(spec.palette, is_dark_mode)
 
     fig = go.Figure()
 
     hover_texts = []
     for _, row in city_polygons_4326.iterrows():
         rank_text = f"#{int(row['rank'])} of {int(row['rank_total'])}"
-        if "PTI" in metric_name:
-            hover_texts.append(
-                f"<b>{row['metro_name']}</b><br>"
-                f"Primary city: {row['city']}<br>"
-                f"Avg PTI: {row['avg_metric_value']:.2f}x<br>"
-                f"{rank_text}"
-            )
-        else:
-            hover_texts.append(
-                f"<b>{row['metro_name']}</b><br>"
-                f"Primary city: {row['city']}<br>"
-                f"Avg Price: ${row['avg_metric_value']:,.0f}<br>"
-                f"{rank_text}"
-            )
+        hover_texts.append(
+            f"<b>{row['metro_name']}</b><br>"
+            f"Primary city: {row['city']}<br>"
+            f"Avg {spec.label}: {spec.format(row['avg_metric_value'])}<br>"
+            f"{rank_text}"
+        )
 
     fig.add_trace(
         go.Choroplethmapbox(
@@ -81,9 +80,7 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
             else "rgba(15,23,42,0.7)",
             colorbar=dict(
                 title=dict(text=metric_name, side="right"),
-                tickprefix="" if "PTI" in metric_name else "$",
-                tickformat=",.2f" if "PTI" in metric_name else ",",
-                ticksuffix="x" if "PTI" in metric_name else "",
+                **spec.ticks(),
                 thickness=12,
                 len=0.55,
                 y=0.5,
@@ -134,8 +131,10 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
     return fig, city_polygons_4326
 
 # ----------------- ZIP LEVEL -----------------
+@timed("charts.create_zip_choropleth")
 def create_zip_choropleth(
-    gdf, map_style, city_coords, center_df, metric_name, is_dark_mode=False
+    gdf, map_style, city_coords, center_df, metric_name, is_dark_mode=False,
+    highlight_zips=None,
 ):
     if gdf.empty:
         return None, None
@@ -165,7 +164,8 @@ def create_zip_choropleth(
         gdf_4326["center_lat"] = center_df["lat"]
         gdf_4326["center_lon"] = center_df["lon"]
 
-    geojson = json.loads(gdf_4326.to_json())
+    with timed("charts.geojson.zip"):
+        geojson = json.loads(gdf_4326.to_json())
 
     if city_coords:
         center_lat, center_lon = city_coords
@@ -178,7 +178,8 @@ def create_zip_choropleth(
 
     vmin = float(gdf["metric_value"].min())
     vmax = float(gdf["metric_value"].max())
-    colorscale = get_colorscale(metric_name, is_dark_mode)
+    spec = get_metric(metric_name)
+    colorscale = get_colorscale(spec.palette, is_dark_mode)
 
     fig = go.Figure()
     fig.add_trace(
@@ -199,9 +200,7 @@ def create_zip_choropleth(
             unselected=dict(marker=dict(opacity=0.35)),
             colorbar=dict(
                 title=dict(text=metric_name, side="right"),
-                tickprefix="" if "PTI" in metric_name else "$",
-                tickformat=",.2f" if "PTI" in metric_name else ",",
-                ticksuffix="x" if "PTI" in metric_name else "",
+                **spec.ticks(),
                 thickness=12,
                 len=0.55,
                 y=0.5,
@@ -217,11 +216,7 @@ def create_zip_choropleth(
             hovertemplate=(
                 "<b>ZIP %{customdata[0]}</b><br>"
                 "Metro: %{customdata[1]}<br>"
-                + (
-                    "PTI: %{customdata[2]:.2f}x"
-                    if "PTI" in metric_name
-                    else "Price: $%{customdata[2]:,.0f}"
-                )
+                + spec.hover("%{customdata[2]}")
                 + "<br>Rank: #%{customdata[3]} of %{customdata[4]}"
                 + "<extra></extra>"
             ),
@@ -229,6 +224,24 @@ def create_zip_choropleth(
         )
     )
 
+    # Outline highlighted ZIPs (e.g. neighbors of the selected ZIP)
+    if highlight_zips:
+        outlined = gdf_4326[gdf_4326["zip_code_str"].isin(list(highlight_zips))]
+        if not outlined.empty:
+            fig.add_trace(
+                go.Choroplethmapbox(
+                    geojson=geojson,
+                    locations=outlined["id"],
+                    z=np.zeros(len(outlined)),
+                    featureidkey="properties.id",
+                    colorscale=[[0, "rgba(0,0,0,0)"], [1, "rgba(0,0,0,0)"]],
+                    marker_line_width=2.5,
+                    marker_line_color="#f97316" if not is_dark_mode else "#fb923c",
+                    hoverinfo="skip",
+                    showscale=False,
+                )
+            )
+
     fig.update_layout(
         mapbox=dict(
             style=map_style,
@@ -249,12 +262,278 @@ def create_zip_choropleth(
 
     return fig, gdf_4326
 
+# ----------------- HOTSPOT LAYER -----------------
+# Colors per hotspots.CLUSTER_LABELS entry (light, dark)
+CLUSTER_COLORS = [
+    ("#dc2626", "#f87171"),  # hot spot
+    ("#2563eb", "#60a5fa"),  # cold spot
+    ("#f9a8d4", "#f472b6"),  # high outlier
+    ("#93c5fd", "#7dd3fc"),  # low outlier
+    ("#e5e7eb", "#334155"),  # not significant
+]
+
+
+@timed("charts.create_hotspot_choropleth")
+def create_hotspot_choropleth(gdf, map_style, center_df, value_hover, is_dark_mode=False):
+    """
+    ZIP map colored by hotspot cluster. `gdf` is the ZIP GeoDataFrame merged
+    with a hotspots table (cluster, p_value, metric_value); `value_hover`
+    is the hover line for the value, e.g. "PTI: %{customdata[2]:.2f}x".
+    """
+    if gdf.empty:
+        return None, None
+
+    gdf = gdf.reset_index(drop=True)
+    gdf["id"] = gdf.index.astype(str)
+    gdf_4326 = gdf.to_crs(epsg=4326) if gdf.crs and gdf.crs != "EPSG:4326" else gdf.copy()
+    with timed("charts.geojson.hotspots"):
+        geojson = json.loads(gdf_4326[["id", "geometry"]].to_json())
+
+    n = len(CLUSTER_LABELS)
+    codes = pd.Categorical(gdf_4326["cluster"], categories=CLUSTER_LABELS).codes
+    colors = [dark if is_dark_mode else light for light, dark in CLUSTER_COLORS]
+    # Step colorscale: one flat band per cluster code 0..n-1
+    colorscale = []
+    for i, color in enumerate(colors):
+        colorscale += [[i / n, color], [(i + 1) / n, color]]
+
+    fig = go.Figure()
+    fig.add_trace(
+        go.Choroplethmapbox(
+            geojson=geojson,
+            locations=gdf_4326["id"],
+            z=codes,
+            featureidkey="properties.id",
+            colorscale=colorscale,
+            zmin=-0.5,
+            zmax=n - 0.5,
+            marker_opacity=0.85,
+            marker_line_width=0.5,
+            marker_line_color="rgba(248,250,252,0.9)" if not is_dark_mode else "rgba(15,23,42,0.8)",
+            colorbar=dict(
+                tickvals=list(range(n)),
+                ticktext=CLUSTER_LABELS,
+                thickness=12,
+                len=0.55,
+                bgcolor="rgba(255,255,255,0.85)" if not is_dark_mode else "rgba(15,23,42,0.9)",
+            ),
+            customdata=np.column_stack(
+                [
+                    gdf_4326["zip_code_str"].astype(str),
+                    gdf_4326["cluster"].astype(str),
+                    gdf_4326["metric_value"],
+                    gdf_4326["p_value"].fillna(1.0),
+                ]
+            ),
+            hovertemplate=(
+                "<b>ZIP %{customdata[0]}</b><br>"
+                "%{customdata[1]}<br>"
+                + value_hover + "<br>"
+                "p = %{customdata[3]:.3f}"
+                "<extra></extra>"
+            ),
+        )
+    )
+    if center_df is not None and not center_df.empty:
+        center = {"lat": center_df["lat"].mean(), "lon": center_df["lon"].mean()}
+    else:
+        bounds = gdf_4326.total_bounds
+        center = {"lat": (bounds[1] + bounds[3]) / 2, "lon": (bounds[0] + bounds[2]) / 2}
+    fig.update_layout(
+        mapbox=dict(style=map_style, zoom=9, center=center, bounds=US_BOUNDS),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        height=650,
+        clickmode="event+select",
+        dragmode="pan",
+    )
+    return fig, gdf_4326
+
+
+# ----------------- RADIUS SEARCH -----------------
+def radius_zoom(lat: float, miles: float, height_px: int = 340) -> float:
+    """Mapbox zoom at which a `miles` radius around `lat` fits the map height."""
+    # Ground miles covered by one 256px tile at zoom 0
+    tile_miles = 2 * np.pi * EARTH_RADIUS_MILES * np.cos(np.radians(lat))
+    span = max(2.2 * float(miles), 0.5)
+    return float(np.clip(np.log2(tile_miles * height_px / 256 / span), 2, 14))
+
+
+@timed("charts.create_radius_map")
+def create_radius_map(df_radius, center, miles, map_style, metric_name, is_dark_mode=False):
+    """
+    Mini-map for a radius search: ZIPs as points colored by metric value
+    and the search circle. `center` is (lon, lat).
+    """
+    if df_radius.empty:
+        return None
+
+    spec = get_metric(metric_name)
+    lon0, lat0 = center
+    ring_lon, ring_lat = circle_lonlat(lon0, lat0, miles)
+    ring_color = "#2563eb" if not is_dark_mode else "#60a5fa"
+
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scattermapbox(
+            lon=ring_lon,
+            lat=ring_lat,
+            mode="lines",
+            line=dict(color=ring_color, width=2),
+            hoverinfo="skip",
+            showlegend=False,
+        )
+    )
+    fig.add_trace(
+        go.Scattermapbox(
+            lon=df_radius["lon"],
+            lat=df_radius["lat"],
+            mode="markers",
+            marker=dict(
+                size=10,
+                color=df_radius["metric_value"],
+                colorscale=get_colorscale(spec.palette, is_dark_mode),
+                showscale=False,
+            ),
+            customdata=df_radius[
+                ["zip_code_str", "city_full", "metric_value", "distance_miles", "rank", "rank_total"]
+            ].values,
+            hovertemplate=(
+                "<b>ZIP %{customdata[0]}</b><br>"
+                "Metro: %{customdata[1]}<br>"
+                + spec.hover("%{customdata[2]}")
+                + "<br>%{customdata[3]:.1f} mi away"
+                + "<br>Rank: #%{customdata[4]} of %{customdata[5]}"
+                + "<extra></extra>"
+            ),
+            showlegend=False,
+        )
+    )
+    fig.update_layout(
+        mapbox=dict(
+            style=map_style,
+            zoom=radius_zoom(lat0, miles),
+            center={"lat": lat0, "lon": lon0},
+        ),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        height=340,
+        clickmode="event+select",
+        hoverlabel=dict(
+            bgcolor="white" if not is_dark_mode else "#020617",
+            font_size=12,
+        ),
+    )
+    return fig
+
+
+# ----------------- AFFORDABILITY FINDER -----------------
+@timed("charts.create_affordability_map")
+def create_affordability_map(df_afford, map_style, is_dark_mode=False, height=420):
+    """
+    Affordable ZIPs (affordability.RESULT_COLUMNS) as points colored by the
+    household's own PTI there. Results spread over the country are framed
+    on the US, results in a few metros on their points.
+    """
+    df = df_afford[df_afford["lat"].notna() & df_afford["lon"].notna()]
+    if df.empty:
+        return None
+
+    price, pti = get_metric(PRICE_METRIC), get_metric(PTI_METRIC)
+    lat0 = (df["lat"].min() + df["lat"].max()) / 2
+    lon0 = (df["lon"].min() + df["lon"].max()) / 2
+    span_miles = max(
+        (df["lat"].max() - df["lat"].min()) * 69.0,
+        (df["lon"].max() - df["lon"].min()) * 69.0 * np.cos(np.radians(lat0)),
+    )
+    if span_miles > 1500:
+        center, zoom = {"lat": US_CENTER_LAT, "lon": US_CENTER_LON}, US_ZOOM_LEVEL
+    else:
+        center, zoom = {"lat": lat0, "lon": lon0}, radius_zoom(lat0, max(span_miles / 2, 5), height)
+
+    fig = go.Figure(
+        go.Scattermapbox(
+            lon=df["lon"],
+            lat=df["lat"],
+            mode="markers",
+            marker=dict(
+                size=8,
+                color=df["user_pti"],
+                colorscale=get_colorscale(pti.palette, is_dark_mode),
+                showscale=True,
+                colorbar=dict(title="Your PTI", thickness=12, **pti.ticks()),
+            ),
+            customdata=df[
+                ["zip_code_str", "city_full", "price", "user_pti", "local_pti", "rank", "rank_total"]
+            ].values,
+            hovertemplate=(
+                "<b>ZIP %{customdata[0]}</b><br>"
+                "Metro: %{customdata[1]}<br>"
+                + price.hover("%{customdata[2]}")
+                + "<br>Your PTI: " + pti.template("%{customdata[3]}")
+                + "<br>Local PTI: " + pti.template("%{customdata[4]}")
+                + "<br>Rank: #%{customdata[5]} of %{customdata[6]}"
+                + "<extra></extra>"
+            ),
+            showlegend=False,
+        )
+    )
+    fig.update_layout(
+        mapbox=dict(style=map_style, zoom=zoom, center=center),
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        height=height,
+        hoverlabel=dict(
+            bgcolor="white" if not is_dark_mode else "#020617",
+            font_size=12,
+        ),
+    )
+    return fig
+
+
 # ----------------- HISTORY CHART -----------------
-def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name: str, is_dark_mode: bool = False):
+@timed("charts.create_history_chart")
+def add_forecast_traces(fig, path: pd.DataFrame, value_hover: str, color: str, as_dates: bool = False):
+    """
+    Dashed projection line + shaded prediction interval from a
+    forecast.projection_path frame (year, fitted, lower, upper).
+    """
+    if path is None or path.empty:
+        return fig
+    # Yearly projections sit mid-year on a date axis
+    x = pd.to_datetime(dict(year=path["year"], month=7, day=1)) if as_dates else path["year"]
+    band_color = "rgba(148,163,184,0.25)"
+    fig.add_trace(
+        go.Scatter(x=x, y=path["upper"], mode="lines", line=dict(width=0),
+                   hoverinfo="skip", showlegend=False)
+    )
+    fig.add_trace(
+        go.Scatter(x=x, y=path["lower"], mode="lines", line=dict(width=0),
+                   fill="tonexty", fillcolor=band_color, hoverinfo="skip", showlegend=False)
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=path["fitted"],
+            mode="lines",
+            name="Trend projection",
+            line=dict(color=color, width=2, dash="dot"),
+            customdata=path[["lower", "upper"]].to_numpy(),
+            hovertemplate="Projected " + value_hover + "<extra></extra>",
+            showlegend=False,
+        )
+    )
+    return fig
+
+
+def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name: str, is_dark_mode: bool = False,
+                         forecast_path: pd.DataFrame = None):
     if zip_hist.empty:
         return None
 
-    value_col = "PTI" if "PTI" in metric_name else "price"
+    spec = get_metric(metric_name)
+    # Sub-annual series carry a `period` timestamp; yearly ones just `year`
+    sub_annual = "period" in zip_hist.columns and zip_hist["year"].duplicated().any()
+    x_values = zip_hist["period"] if sub_annual else zip_hist["year"]
+    x_label = "Period: %{x|%b %Y}" if sub_annual else "Year: %{x}"
+    many_points = len(zip_hist) > 40
     line_color = "#2563eb" if not is_dark_mode else "#60a5fa"
     avg_line_color = "#ea580c" if not is_dark_mode else "#fb923c"
     grid_color = "rgba(148,163,184,0.35)" if not is_dark_mode else "rgba(148,163,184,0.3)"
@@ -263,19 +542,15 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
     fig = go.Figure()
     fig.add_trace(
         go.Scatter(
-            x=zip_hist["year"],
-            y=zip_hist[value_col],
-            mode="lines+markers",
+            x=x_values,
+            y=zip_hist["metric_value"],
+            mode="lines" if many_points else "lines+markers",
             name="This ZIP",
-            line=dict(color=line_color, width=3),
+            line=dict(color=line_color, width=2 if many_points else 3),
             marker=dict(size=7, color=line_color),
             hovertemplate=(
-                "Year: %{x}<br>"
-                + (
-                    "PTI: %{y:.2f}x"
-                    if "PTI" in metric_name
-                    else "Price: $%{y:,.0f}"
-                )
+                x_label + "<br>"
+                + spec.hover()
                 + "<extra></extra>"
             ),
         )
@@ -291,16 +566,18 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
         y=metro_avg,
         xref="paper",  
         yref="y",
-        text=(
-            f"Metro Avg: {metro_avg:.2f}x"
-            if "PTI" in metric_name
-            else f"Metro Avg: ${metro_avg:,.0f}"
-        ),
+        text=f"Metro Avg: {spec.format(metro_avg)}",
         showarrow=False,
         font=dict(color=avg_line_color, size=12),
         align="left",
         yshift=14  
     )
+    if forecast_path is not None:
+        value_hover = (
+            f"{spec.hover()} ({spec.template('%{customdata[0]}')}"
+            f"–{spec.template('%{customdata[1]}')})"
+        )
+        add_forecast_traces(fig, forecast_path, value_hover, line_color, as_dates=sub_annual)
     fig.update_layout(
         height=280,
         margin=dict(l=0, r=0, t=10, b=0),
@@ -317,8 +594,7 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
             title="",
             gridcolor=grid_color,
             tickfont=dict(color=text_color, size=10),
-            tickprefix="" if "PTI" in metric_name else "$",
-            tickformat=",.1f" if "PTI" in metric_name else ",.0f",
+            **spec.ticks(),
             showline=True,
             linecolor=grid_color,
         ),
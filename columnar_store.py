@@ -0,0 +1,330 @@
+# columnar_store.py
+"""
+Memory-mapped columnar store shared by every Streamlit worker on a node.
+
+The prepared dataset (the output of _standardize_house_df) and the CBSA /
+ZCTA geometry tables are written once as uncompressed Arrow IPC files.
+Each worker opens them with pa.memory_map, so:
+
+  - reading is zero-copy: numeric columns are views over the mapped file
+  - all workers share the same physical pages through the OS page cache
+  - the buffers are read-only, so no worker can mutate shared data
+
+Node memory therefore scales with the data size instead of with the
+number of workers. Files are replaced atomically (write + rename), so a
+rebuild never corrupts a table a running worker still has mapped.
+
+Layout of a store folder (LOCAL_STORE_DIR in config_data):
+
+    house.arrow     standardized house rows; strings dictionary-encoded
+    cbsa.arrow      CBSA attributes + WKB geometry
+    zcta.arrow      ZCTA attributes + WKB geometry, sorted by zip_code
+    zip_cbsa.arrow  ZIP → CBSA assignment (spatial join), sorted by zip_code
+    zcta_adjacency.arrow
+                    ZCTA contiguity in CSR form: one row per zip_code
+                    (sorted) with a list of neighbor row positions
+
+Build it with:
+
+    python columnar_store.py            # uses DATA511_DATA_DIR / data/
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+import geopandas as gpd
+
+STORE_FILES = {
+    "house": "house.arrow",
+    "cbsa": "cbsa.arrow",
+    "zcta": "zcta.arrow",
+    "zip_cbsa": "zip_cbsa.arrow",
+    "zcta_adjacency": "zcta_adjacency.arrow",
+}
+
+# Low-cardinality text columns stored as dictionaries (→ pandas categoricals
+# with sorted categories, so sort_values stays alphabetical)
+HOUSE_DICTIONARY_COLUMNS = ["city", "city_full", "city_clean", "zip_code_str"]
+
+GEOMETRY_COLUMN = "geometry_wkb"
+
+
+# ============================================================
+# 1. Paths & low-level IO
+# ============================================================
+
+def store_path(name: str, store_dir: str) -> str:
+    return os.path.join(store_dir, STORE_FILES[name])
+
+
+def has_store(name: str, store_dir: str) -> bool:
+    return os.path.exists(store_path(name, store_dir))
+
+
+def write_table(table: pa.Table, path: str):
+    """Write an uncompressed Arrow IPC file atomically."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def open_table(name: str, store_dir: str) -> pa.Table:
+    """
+    Memory-map a stored table. The returned Table's buffers point straight
+    into the mapped file (no copy, shared across processes).
+    """
+    source = pa.memory_map(store_path(name, store_dir), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+# ============================================================
+# 2. House table
+# ============================================================
+
+def _dictionary_array(values: pd.Series) -> pa.DictionaryArray:
+    cat = pd.Categorical(values.astype(str), categories=sorted(values.astype(str).unique()))
+    return pa.DictionaryArray.from_arrays(
+        pa.array(cat.codes.astype(np.int32)), pa.array(list(cat.categories), type=pa.string())
+    )
+
+
+def house_table_from_df(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert a standardized house DataFrame to an Arrow table laid out for
+    zero-copy reads:
+      - floats keep NaN as a value (no validity bitmap → no copy on read)
+      - text columns become dictionaries with sorted categories
+    """
+    arrays, names = [], []
+    for col in df.columns:
+        series = df[col]
+        if col in HOUSE_DICTIONARY_COLUMNS:
+            arr = _dictionary_array(series)
+        elif pd.api.types.is_float_dtype(series.dtype):
+            arr = pa.array(series.to_numpy(dtype="float64"), from_pandas=False)
+        elif pd.api.types.is_integer_dtype(series.dtype) and not series.isna().any():
+            arr = pa.array(series.to_numpy(dtype="int64"))
+        else:
+            arr = pa.array(series, from_pandas=True)
+        arrays.append(arr)
+        names.append(col)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def table_to_house_df(table: pa.Table, self_destruct: bool = False) -> pd.DataFrame:
+    """
+    Arrow → pandas without consolidating blocks, so numeric columns stay
+    read-only views over the memory map. Dictionary columns become
+    categoricals (only the small integer codes are materialized).
+
+    Pass self_destruct=True for a table nothing else references (e.g. a
+    fresh query result): Arrow buffers are released column by column as
+    they are converted, so the two copies never coexist in full.
+    """
+    return table.to_pandas(split_blocks=True, self_destruct=self_destruct)
+
+
+# Arrow-native version of config_data._standardize_house_df, applied to
+# each fetched batch so the raw result is never materialized in pandas.
+_HOUSE_FLOAT_COLUMNS = ["median_sale_price", "per_capita_income", "lat", "lon"]
+
+
+def standardize_house_table(table: pa.Table) -> pa.Table:
+    """
+    Same cleaning as config_data._standardize_house_df, as Arrow compute:
+      - zip_code int64, zip_code_str zero-padded ("" when missing)
+      - city_clean = lower/stripped city
+      - year int64, numeric columns float64 with NaN for missing
+      - text columns dictionary-encoded (the compact store schema)
+    Works per batch; combine the batches with sort_dictionaries().
+    """
+    columns = {}
+    for name in table.column_names:
+        col = table.column(name)
+        if name == "zip_code":
+            col = pc.cast(col, pa.int64())
+        elif name == "year":
+            col = pc.cast(col, pa.int64())
+        elif name in _HOUSE_FLOAT_COLUMNS:
+            col = pc.fill_null(pc.cast(col, pa.float64(), safe=False), float("nan"))
+        columns[name] = col
+
+    zip_str = pc.utf8_lpad(pc.cast(columns["zip_code"], pa.string()), width=5, padding="0")
+    columns["zip_code_str"] = pc.fill_null(zip_str, "")
+    city = pc.cast(columns["city"], pa.string())
+    columns["city_clean"] = pc.utf8_trim_whitespace(pc.utf8_lower(city))
+
+    for name in HOUSE_DICTIONARY_COLUMNS:
+        if name in columns:
+            col = columns[name]
+            if not pa.types.is_dictionary(col.type):
+                col = pc.dictionary_encode(pc.cast(col, pa.string()))
+            columns[name] = col
+    return pa.table(columns)
+
+
+def sort_dictionaries(table: pa.Table, columns=None) -> pa.Table:
+    """
+    Give every dictionary column one shared, sorted dictionary (batches are
+    encoded independently). Only the int32 indices are rewritten.
+    """
+    columns = HOUSE_DICTIONARY_COLUMNS if columns is None else columns
+    table = table.unify_dictionaries()
+    for name in columns:
+        if name not in table.column_names:
+            continue
+        col = table.column(name)
+        if not pa.types.is_dictionary(col.type):
+            continue
+        if col.num_chunks == 0:
+            continue
+        arr = col.combine_chunks() if col.num_chunks > 1 else col.chunk(0)
+        order = pc.sort_indices(arr.dictionary)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order.to_numpy()] = np.arange(len(order), dtype=np.int32)
+        indices = pc.take(pa.array(rank), arr.indices)
+        sorted_arr = pa.DictionaryArray.from_arrays(indices, pc.take(arr.dictionary, order))
+        table = table.set_column(table.column_names.index(name), name, sorted_arr)
+    return table
+
+
+# ============================================================
+# 3. Geometry & adjacency tables
+# ============================================================
+
+def geo_table_from_gdf(gdf: gpd.GeoDataFrame, sort_by: str = None) -> pa.Table:
+    """Attributes + WKB geometry; CRS kept in the schema metadata."""
+    if sort_by:
+        gdf = gdf.sort_values(sort_by).reset_index(drop=True)
+    attrs = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+    table = pa.Table.from_pandas(attrs, preserve_index=False)
+    wkb = shapely.to_wkb(np.asarray(gdf.geometry.values))
+    table = table.append_column(GEOMETRY_COLUMN, pa.array(wkb, type=pa.binary()))
+    crs = gdf.crs.to_json() if gdf.crs is not None else ""
+    meta = dict(table.schema.metadata or {})
+    meta[b"data511_crs"] = crs.encode()
+    return table.replace_schema_metadata(meta)
+
+
+def table_to_gdf(table: pa.Table, indices=None) -> gpd.GeoDataFrame:
+    """
+    Decode a geometry table (or only the rows in `indices`) into a
+    GeoDataFrame. Geometry objects are per-process, so decode only what
+    the current view needs when memory matters.
+    """
+    if indices is not None:
+        table = table.take(pa.array(np.asarray(indices, dtype=np.int64)))
+    crs_json = (table.schema.metadata or {}).get(b"data511_crs", b"").decode()
+    geoms = shapely.from_wkb(table.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False))
+    attrs = table.drop_columns([GEOMETRY_COLUMN]).to_pandas()
+    crs = json.loads(crs_json) if crs_json else None
+    return gpd.GeoDataFrame(attrs, geometry=geoms, crs=crs)
+
+
+def lookup_rows(table: pa.Table, key_col: str, values) -> np.ndarray:
+    """
+    Row positions of `values` in a table sorted by `key_col` (binary search,
+    no full scan and no copy of the key column for numeric keys).
+    """
+    keys = table.column(key_col).to_numpy()
+    values = np.asarray(values, dtype=keys.dtype)
+    pos = np.searchsorted(keys, values)
+    pos = np.clip(pos, 0, max(len(keys) - 1, 0))
+    found = len(keys) > 0
+    mask = (keys[pos] == values) if found else np.zeros(len(values), dtype=bool)
+    return np.unique(pos[mask])
+
+
+def adjacency_table(zip_codes, indptr, indices) -> pa.Table:
+    """
+    CSR arrays as an Arrow list column: the list offsets are the CSR
+    indptr and the flattened values its column indices.
+    """
+    neighbors = pa.ListArray.from_arrays(
+        pa.array(np.asarray(indptr, dtype=np.int32)),
+        pa.array(np.asarray(indices, dtype=np.int32)),
+    )
+    return pa.table({"zip_code": pa.array(np.asarray(zip_codes, dtype=np.int64)), "neighbors": neighbors})
+
+
+def table_to_csr_arrays(table: pa.Table):
+    """(zip_codes, indptr, indices) as zero-copy views of an adjacency table."""
+    neighbors = table.column("neighbors").combine_chunks()
+    indptr = neighbors.offsets.to_numpy()
+    indices = neighbors.values.to_numpy()
+    return table.column("zip_code").to_numpy(), indptr, indices
+
+
+# ============================================================
+# 4. Build
+# ============================================================
+
+def build_store(store_dir: str, house_df=None, cbsa_gdf=None, zcta_gdf=None,
+                zip_cbsa_df=None, zcta_adjacency=None) -> dict:
+    """
+    Write whichever tables are given. House rows are sorted by year; ZCTAs
+    get an integer `zip_code` key and are sorted by it so single-metro
+    lookups are a binary search (same for the ZIP → CBSA table).
+    `zcta_adjacency` is a spatial_index.AdjacencyGraph.
+    """
+    written = {}
+    if house_df is not None:
+        # Year-sorted, so each year is a contiguous (zero-copy) row range
+        house_df = house_df.sort_values(["year", "city", "zip_code"], kind="stable")
+        path = store_path("house", store_dir)
+        write_table(house_table_from_df(house_df), path)
+        written["house"] = path
+    if cbsa_gdf is not None:
+        path = store_path("cbsa", store_dir)
+        write_table(geo_table_from_gdf(cbsa_gdf), path)
+        written["cbsa"] = path
+    if zcta_gdf is not None:
+        zcta_gdf = zcta_gdf.copy()
+        zcta_gdf["zip_code"] = pd.to_numeric(zcta_gdf["zip_code_str"], errors="coerce").astype("int64")
+        path = store_path("zcta", store_dir)
+        write_table(geo_table_from_gdf(zcta_gdf, sort_by="zip_code"), path)
+        written["zcta"] = path
+    if zip_cbsa_df is not None:
+        zip_cbsa_df = zip_cbsa_df.sort_values("zip_code").reset_index(drop=True)
+        path = store_path("zip_cbsa", store_dir)
+        write_table(pa.Table.from_pandas(zip_cbsa_df, preserve_index=False), path)
+        written["zip_cbsa"] = path
+    if zcta_adjacency is not None:
+        matrix = zcta_adjacency.matrix
+        path = store_path("zcta_adjacency", store_dir)
+        write_table(adjacency_table(zcta_adjacency.zip_codes, matrix.indptr, matrix.indices), path)
+        written["zcta_adjacency"] = path
+    return written
+
+
+def main():
+    """Build the store from the local CSV/Parquet + shapefiles."""
+    import inspect
+    import config_data
+    import geo_utils
+
+    # Bypass the Streamlit caches (and the store itself) while building
+    house = inspect.unwrap(config_data._load_all_data_local)()
+    cbsa = inspect.unwrap(geo_utils._read_cbsa_shapefile)()
+    zcta = inspect.unwrap(geo_utils._read_zcta_shapefile)()
+    zip_cbsa = geo_utils.build_zip_cbsa_table(zcta, cbsa)
+    adjacency = geo_utils.build_zcta_adjacency(zcta)
+
+    written = build_store(config_data.LOCAL_STORE_DIR, house, cbsa, zcta, zip_cbsa, adjacency)
+    for name, path in written.items():
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{name:<14} → {path} ({size_mb:,.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,22 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 
+from instrumentation import timed, track_cache, mark_cache_miss
+from columnar_store import (
+    table_to_house_df,
+    standardize_house_table,
+    sort_dictionaries,
+)
+from query_backend import DatabricksBackend, DuckDBBackend
+from sql_pool import ConnectionPool, PooledExecutor, ResultCache
+
 # Only needed if you still use Databricks
-#from databricks import sql
-#from databricks.sdk.core import Config
+try:
+    from databricks import sql
+    from databricks.sdk.core import Config
+except ImportError:  # local / DuckDB modes do not need the connector
+    sql = None
+    Config = None
 
 # ============================================================
 # 1. Global flags
@@ -30,10 +43,34 @@ import streamlit as st
 # instead of from Databricks.
 USE_LOCAL_DATA = True
 
+# Folder holding the local data files. Override with DATA511_DATA_DIR to
+# point the app (or the benchmarks) at another dataset, e.g. synthetic data.
+DATA_DIR = os.getenv("DATA511_DATA_DIR", "data")
+
 # Local file paths (you can change these later)
-LOCAL_HOUSE_FILE = "data/house_ts_agg.csv"   # or .csv
+LOCAL_HOUSE_FILE = os.path.join(DATA_DIR, "house_ts_agg.csv")   # or .csv
 #LOCAL_ZIP_GEO_FILE = "data/zip_geo.parquet"      # or .csv
 
+# Parquet copies read by the DuckDB backend when present
+# (export with `python -c "import config_data; config_data.export_local_parquet()"`)
+LOCAL_HOUSE_PARQUET = os.path.join(DATA_DIR, "house_ts.parquet")
+LOCAL_ZIP_GEO_PARQUET = os.path.join(DATA_DIR, "zip_geo.parquet")
+
+# Query engine:
+#   "pandas"     : load the local files (or the columnar store) in full
+#   "duckdb"     : embedded DuckDB over the local files, same SQL as Databricks
+#   "databricks" : Databricks SQL warehouse
+# duckdb / databricks push the year and metro filters down to the engine.
+DATA_BACKEND = os.getenv(
+    "DATA511_BACKEND", "pandas" if USE_LOCAL_DATA else "databricks"
+).lower()
+
+# Memory-mapped Arrow store (see columnar_store.py). When it exists, every
+# Streamlit worker on the node maps the same files instead of loading its
+# own copy. Build it with `python columnar_store.py`.
+LOCAL_STORE_DIR = os.path.join(DATA_DIR, "store")
+USE_COLUMNAR_STORE = os.getenv("DATA511_USE_STORE", "1").lower() not in ("0", "false", "no")
+
 # ============================================================
 # 2. Constants: tables, shapefiles, map settings
 # ============================================================
@@ -42,11 +79,32 @@ LOCAL_HOUSE_FILE = "data/house_ts_agg.csv"   # or .csv
 HOUSE_TABLE = "workspace.data511.house_ts"
 ZIP_GEO_TABLE = "workspace.data511.zip_geo"
 
+# Databricks connection pool + on-disk result cache (see sql_pool.py).
+# A TTL of 0 turns the result cache off.
+SQL_POOL_SIZE = int(os.getenv("DATA511_SQL_POOL_SIZE", "4"))
+SQL_CACHE_DIR = os.getenv("DATA511_SQL_CACHE_DIR", os.path.join(DATA_DIR, "cache", "sql"))
+SQL_CACHE_TTL = float(os.getenv("DATA511_SQL_CACHE_TTL", "3600"))
+# Rows per Arrow batch when streaming query results
+SQL_BATCH_ROWS = int(os.getenv("DATA511_SQL_BATCH_ROWS", "100000"))
+
 # Shapefile paths
-CBSA_SHP_PATH = "data/cb_2018_us_cbsa_500k.shp"
-ZCTA_SHP_PATH = "data/cb_2018_us_zcta510_500k.shp"
-CBSA_ZIP_PATH = "data/cbsa_shapes.zip"
-ZCTA_ZIP_PATH = "data/zcta_shapes.zip"
+CBSA_SHP_PATH = os.path.join(DATA_DIR, "cb_2018_us_cbsa_500k.shp")
+ZCTA_SHP_PATH = os.path.join(DATA_DIR, "cb_2018_us_zcta510_500k.shp")
+CBSA_ZIP_PATH = os.path.join(DATA_DIR, "cbsa_shapes.zip")
+ZCTA_ZIP_PATH = os.path.join(DATA_DIR, "zcta_shapes.zip")
+
+# ZCTA vector tiles (MBTiles) for the nationwide ZIP map, built offline
+# from the ZCTA shapefile with `python vector_tiles.py build`, and the
+# local endpoint serving them. Set DATA511_TILE_URL when the browser
+# reaches the endpoint under another address (e.g. behind a proxy).
+ZCTA_TILES_PATH = os.path.join(DATA_DIR, "tiles", "zcta.mbtiles")
+TILE_SERVER_HOST = os.getenv("DATA511_TILE_HOST", "127.0.0.1")
+TILE_SERVER_PORT = int(os.getenv("DATA511_TILE_PORT", "8765"))
+TILE_PUBLIC_URL = os.getenv("DATA511_TILE_URL", f"http://localhost:{TILE_SERVER_PORT}")
+
+# Read-only HTTP/JSON API over the metric cube (`python api_server.py`)
+API_SERVER_HOST = os.getenv("DATA511_API_HOST", "127.0.0.1")
+API_SERVER_PORT = int(os.getenv("DATA511_API_PORT", "8770"))
 
 
 # Map center & zoom
@@ -215,55 +273,105 @@ def get_dynamic_css(is_dark_mode: bool) -> str:
         </style>
         """
 
-def get_colorscale(metric_type: str, is_dark_mode: bool = False):
+# Warm, bright palettes; each metric names one (metrics.Metric.palette)
+COLORSCALES = {
+    # Peach → orange → red
+    "orange": [
+        [0.0, "#fff7ed"],   # very light peach
+        [0.25, "#fed7aa"],  # soft orange
+        [0.5, "#fdba74"],   # mid orange
+        [0.75, "#fb923c"],  # vivid orange
+        [1.0, "#c2410c"],   # deep warm red-brown
+    ],
+    # Light yellow → gold → deep orange
+    "gold": [
+        [0.0, "#fefce8"],   # very light yellow
+        [0.25, "#fde68a"],  # light gold
+        [0.5, "#fbbf24"],   # gold
+        [0.75, "#f97316"],  # bright orange
+        [1.0, "#b45309"],   # deep orange-brown
+    ],
+}
+
+
+def get_colorscale(palette: str, is_dark_mode: bool = False):
     """
-    Return a warm, bright colorscale for the given metric.
-    Both metrics use warm palettes; PTI is a bit more red-ish,
-    price is more gold / orange.
+    Return the warm colorscale named `palette` (see COLORSCALES). PTI uses
+    the more red-ish "orange", price the gold / orange "gold".
     """
-    if "PTI" in metric_type:
-        # Peach → orange → red
-        return [
-            [0.0, "#fff7ed"],   # very light peach
-            [0.25, "#fed7aa"],  # soft orange
-            [0.5, "#fdba74"],   # mid orange
-            [0.75, "#fb923c"],  # vivid orange
-            [1.0, "#c2410c"],   # deep warm red-brown
-        ]
-    else:
-        # Light yellow → gold → deep orange
-        return [
-            [0.0, "#fefce8"],   # very light yellow
-            [0.25, "#fde68a"],  # light gold
-            [0.5, "#fbbf24"],   # gold
-            [0.75, "#f97316"],  # bright orange
-            [1.0, "#b45309"],   # deep orange-brown
-        ]
+    return COLORSCALES.get(palette, COLORSCALES["gold"])
 
 # ============================================================
 # 4. Databricks SQL helper (only used when USE_LOCAL_DATA = False)
 # ============================================================
 
-def _sql_query(query: str) -> pd.DataFrame:
-    """Execute SQL query against Databricks SQL warehouse."""
+def _databricks_connect():
+    """Open one authenticated connection to the Databricks SQL warehouse."""
+    if sql is None:
+        raise RuntimeError("databricks-sql-connector is not installed")
     warehouse_id = os.getenv("DATABRICKS_WAREHOUSE_ID")
     if not warehouse_id:
         raise RuntimeError("DATABRICKS_WAREHOUSE_ID is not configured")
 
     cfg = Config()
-    with sql.connect(
+    return sql.connect(
         server_hostname=cfg.host,
         http_path=f"/sql/1.0/warehouses/{warehouse_id}",
         credentials_provider=lambda: cfg.authenticate,
-    ) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall_arrow().to_pandas()
+    )
+
+
+@st.cache_resource
+def get_sql_executor() -> PooledExecutor:
+    """
+    Process-wide Databricks executor: pooled connections (TLS / auth /
+    session setup paid once per connection, not per query) behind the
+    on-disk result cache.
+    """
+    pool = ConnectionPool(_databricks_connect, max_size=SQL_POOL_SIZE)
+    cache = ResultCache(SQL_CACHE_DIR, ttl_seconds=SQL_CACHE_TTL)
+    return PooledExecutor(
+        pool, cache, tables=[HOUSE_TABLE, ZIP_GEO_TABLE], batch_rows=SQL_BATCH_ROWS
+    )
+
+
+def _sql_query(query: str, params: dict = None) -> pd.DataFrame:
+    """
+    Execute SQL query against Databricks SQL warehouse.
+    `params` are bound server-side to `:name` markers in the query.
+    """
+    return get_sql_executor()(query, params)
+
+
+@st.cache_resource
+def get_query_backend():
+    """
+    The SQL backend selected by DATA_BACKEND ("duckdb" or "databricks").
+    One instance per process; both run the same parameterized queries.
+    """
+    if DATA_BACKEND == "duckdb":
+        return DuckDBBackend(
+            LOCAL_HOUSE_FILE,
+            house_parquet=LOCAL_HOUSE_PARQUET,
+            zip_geo_parquet=LOCAL_ZIP_GEO_PARQUET,
+            batch_rows=SQL_BATCH_ROWS,
+        )
+    if DATA_BACKEND == "databricks":
+        return DatabricksBackend(get_sql_executor(), HOUSE_TABLE, ZIP_GEO_TABLE)
+    raise RuntimeError(f"DATA_BACKEND '{DATA_BACKEND}' has no SQL engine")
+
+
+def export_local_parquet():
+    """Write the Parquet files the DuckDB backend reads from the local CSV."""
+    from query_backend import export_local_parquet as _export
+
+    _export(LOCAL_HOUSE_FILE, LOCAL_HOUSE_PARQUET, LOCAL_ZIP_GEO_PARQUET)
 
 # ============================================================
 # 5. Data loading (Databricks vs local)
 # ============================================================
 
+@timed("config._standardize_house_df")
 def _standardize_house_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Apply common cleaning and derived columns:
@@ -287,32 +395,22 @@ def _standardize_house_df(df: pd.DataFrame) -> pd.DataFrame:
     df["per_capita_income"] = pd.to_numeric(df["per_capita_income"], errors="coerce")
     return df
 
-def _load_all_data_databricks() -> pd.DataFrame:
+@timed("config._fetch_house_sql")
+def _fetch_house_sql(**filters) -> pd.DataFrame:
     """
-    Original implementation: query Databricks and aggregate
-    to city/zip/year level.
+    House rows from the SQL backend, kept in Arrow end to end: batches are
+    standardized as they stream in (standardize_house_table), dictionaries
+    are unified once, and pandas conversion happens a single time into the
+    compact schema (text columns as categoricals).
     """
-    query = f"""
-        SELECT
-            h.city,
-            h.city_full,
-            h.zip_code,
-            h.year,
-            AVG(h.median_sale_price) AS median_sale_price,
-            AVG(h.per_capita_income) AS per_capita_income,
-            AVG(g.lat) AS lat,
-            AVG(g.lon) AS lon
-        FROM {HOUSE_TABLE} h
-        LEFT JOIN {ZIP_GEO_TABLE} g
-          ON CAST(h.zip_code AS INT) = CAST(g.zip_code AS INT)
-        WHERE h.median_sale_price IS NOT NULL
-          AND h.median_sale_price > 0
-        GROUP BY
-            h.city, h.city_full, h.zip_code, h.year
-    """
-    raw = _sql_query(query)
-    return _standardize_house_df(raw)
+    table = get_query_backend().fetch_house_arrow(
+        transform=standardize_house_table, **filters
+    )
+    table = sort_dictionaries(table)
+    return table_to_house_df(table, self_destruct=True)
+
 
+@timed("config._load_all_data_local")
 def _load_all_data_local() -> pd.DataFrame:
     """
     Local loading version.
@@ -343,33 +441,32 @@ def _load_all_data_local() -> pd.DataFrame:
 
     return _standardize_house_df(house)
 
-@st.cache_data(show_spinner="📊 Loading housing data...")
-def load_all_data() -> pd.DataFrame:
-    """
-    Public data loading function used by app.py.
-
-    It chooses Databricks or local implementation based on
-    USE_LOCAL_DATA flag above.
+# ------------------------------------------------------------
+# 5b. Sliced loading (lazy SQL sources)
+# ------------------------------------------------------------
+# The metric cube loads whole years itself; with a SQL backend it fetches
+# a metro's history on demand, filtered inside the engine.
 
-    - When USE_LOCAL_DATA = False:
-        data are loaded from Databricks via SQL
-    - When USE_LOCAL_DATA = True:
-        data are loaded from local files
+@track_cache("config.load_metro_slice")
+@st.cache_data(show_spinner="📊 Loading metro history...")
+def load_metro_slice(city: str, data_version: int = 0) -> pd.DataFrame:
     """
-    if USE_LOCAL_DATA:
-        df = _load_all_data_local()
-    else:
-        df = _load_all_data_databricks()
-    return df
+    All years of one metro from the SQL backend. The cube passes its data
+    version, so slices cached before a refresh are not reused.
+    """
+    mark_cache_miss()
+    return _fetch_house_sql(city=str(city))
 
 # ============================================================
 # 6. Metric utilities: PTI, rankings, YoY
 # ============================================================
 
-def compute_pti(df: pd.DataFrame) -> pd.DataFrame:
+@timed("config.compute_pti")
+def compute_pti(df: pd.DataFrame, min_income: float = 5000, pti_range=(0.5, 50)) -> pd.DataFrame:
     """
     Compute Price-to-Income (PTI) ratio for all rows in the input DataFrame.
-    Filters out extreme values and rows with missing/invalid data.
+    Filters out extreme values and rows with missing/invalid data
+    (the PTI metric registration in metrics.py passes its filters).
 
     Expects columns:
         median_sale_price, per_capita_income
@@ -378,14 +475,15 @@ def compute_pti(df: pd.DataFrame) -> pd.DataFrame:
         df["median_sale_price"].notna()
         & df["per_capita_income"].notna()
         & (df["median_sale_price"] > 0)
-        & (df["per_capita_income"] >= 5000)
+        & (df["per_capita_income"] >= min_income)
     ].copy()
     df["PTI"] = df["median_sale_price"] / df["per_capita_income"]
-    df.loc[(df["PTI"] < 0.5) | (df["PTI"] > 50), "PTI"] = np.nan
+    df.loc[(df["PTI"] < pti_range[0]) | (df["PTI"] > pti_range[1]), "PTI"] = np.nan
     df = df[df["PTI"].notna()].copy()
     return df
 
-def compute_rankings(df: pd.DataFrame, value_col: str, id_col: str) -> pd.DataFrame:
+@timed("config.compute_rankings")
+def compute_rankings(df: pd.DataFrame, value_col: str, id_col: str, group_col: str = None) -> pd.DataFrame:
     """
     Add rank, rank_total, and percentile columns based on value_col.
     Higher values get better ranks (1 = highest).
@@ -393,13 +491,21 @@ def compute_rankings(df: pd.DataFrame, value_col: str, id_col: str) -> pd.DataFr
     - value_col: numeric column to rank by
     - id_col: identifier column (city, ZIP, etc.), not used directly but
               helpful for semantic clarity
+    - group_col: rank within each group (e.g. ZIPs within their metro,
+                 for all metros at once) instead of across all rows
     """
     df = df.copy()
-    df["rank"] = df[value_col].rank(ascending=False, method="min").astype(int)
-    df["rank_total"] = len(df)
+    if group_col is None:
+        df["rank"] = df[value_col].rank(ascending=False, method="min").astype(int)
+        df["rank_total"] = len(df)
+    else:
+        values = df.groupby(group_col, observed=True, sort=False)[value_col]
+        df["rank"] = values.rank(ascending=False, method="min").astype(int)
+        df["rank_total"] = values.transform("size").astype(int)
     df["percentile"] = ((df["rank_total"] - df["rank"] + 1) / df["rank_total"] * 100).round(1)
     return df
 
+@timed("config.compute_yoy")
 def compute_yoy(
     df_all: pd.DataFrame, current_year: int, group_cols: list, value_col: str
 ) -> pd.DataFrame:
@@ -426,8 +532,8 @@ def compute_yoy(
         df_current["yoy_pct"] = np.nan
         return df_current
 
-    agg_current = df_current.groupby(group_cols, as_index=False).agg({value_col: "mean"})
-    agg_prev = df_prev.groupby(group_cols, as_index=False).agg({value_col: "mean"})
+    agg_current = df_current.groupby(group_cols, as_index=False, observed=True).agg({value_col: "mean"})
+    agg_prev = df_prev.groupby(group_cols, as_index=False, observed=True).agg({value_col: "mean"})
 
     merged = agg_current.merge(
         agg_prev,
@@ -438,23 +544,3 @@ def compute_yoy(
     merged["yoy_change"] = merged[value_col] - merged[f"{value_col}_prev"]
     merged["yoy_pct"] = (merged["yoy_change"] / merged[f"{value_col}_prev"] * 100).round(1)
     return merged
-
-@st.cache_data
-def get_metro_yoy(df_all_input: pd.DataFrame, current_year: int, metric_type_input: str) -> pd.DataFrame:
-    """
-    Cached helper to compute metro-level year-over-year changes
-    for either PTI or median sale price.
-
-    metric_type_input should be one of:
-        - "Price-to-Income Ratio (PTI)"
-        - "Median Sale Price"
-    """
-    df_all_local = df_all_input.copy()
-    if metric_type_input == "Price-to-Income Ratio (PTI)":
-        df_processed = compute_pti(df_all_local)
-        value_col = "PTI"
-    else:
-        df_processed = df_all_local[df_all_local["median_sale_price"].notna()].copy()
-        value_col = "median_sale_price"
-
-    return compute_yoy(df_processed, current_year, ["city", "city_full"], value_col)
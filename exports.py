@@ -0,0 +1,387 @@
+# exports.py
+"""
+Bulk data exports.
+
+An export is any scope of the metric cube — one metro, several metros or
+the nation; one year or all years; ZIP rows or metro rows; one or more
+metrics — written as CSV or Parquet. Rows are produced one (metric, year)
+chunk at a time straight from the cube tables and appended to the output
+file, so memory stays at one chunk however large the scope is:
+
+    request = ExportRequest([PTI_METRIC], years=None, metros=None, fmt="parquet")
+    write_export(request, cube, "pti_all_years.parquet")
+
+Small scopes (the metro being viewed, one year) are written on demand when
+the download button is clicked. Larger ones run as an ExportJob on a
+background thread of the process-wide ExportManager; the session only
+polls the job's progress and downloads the finished file from
+data/exports/.
+
+Usage (from the repository root):
+
+    python exports.py --metrics "Median Sale Price" --out prices.csv
+    python exports.py --metros "austin" "dallas" --years 2022 2023 --format parquet --out tx.parquet
+    python exports.py --level metro --out metros.csv
+"""
+
+import argparse
+import inspect
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+import config_data as cd
+import instrumentation
+from instrumentation import timed, track_cache
+from metric_cube import get_metric_cube
+from metrics import concrete_metrics
+
+EXPORT_DIR = os.path.join(cd.DATA_DIR, "exports")
+
+# fmt → (extension, MIME type)
+FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+LEVELS = ("zip", "metro")
+
+# Estimated rows above which the app runs an export in the background
+BACKGROUND_ROWS = 100_000
+# Finished jobs (and their files) kept per process
+KEEP_JOBS = 20
+
+ZIP_COLUMNS = ["year", "metric", "city", "city_full", "zip_code_str", "metric_value", "rank", "rank_total"]
+METRO_COLUMNS = ["year", "metric", "city", "city_full", "n_zips", "metric_value", "rank", "rank_total"]
+
+
+# ============================================================
+# 1. Requests + chunks
+# ============================================================
+
+class ExportRequest:
+    """
+    One export scope. None means everything: all years, all metros.
+
+    - metrics: metric names (windowed members like "Price CAGR (5y)" too)
+    - level:   "zip" (one row per ZIP, ranked within its metro) or
+               "metro" (one row per metro, ranked nationally)
+    """
+
+    def __init__(self, metrics, years=None, metros=None, level="zip", fmt="csv"):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown export level: {level!r}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt!r}")
+        if not metrics:
+            raise ValueError("An export needs at least one metric")
+        self.metrics = list(metrics)
+        self.years = sorted(int(y) for y in years) if years else None
+        self.metros = sorted(str(m) for m in metros) if metros else None
+        self.level = level
+        self.fmt = fmt
+
+    def __repr__(self):
+        return (
+            f"ExportRequest({self.metrics!r}, years={self.years!r}, metros={self.metros!r}, "
+            f"level={self.level!r}, fmt={self.fmt!r})"
+        )
+
+    @property
+    def mime(self) -> str:
+        return FORMATS[self.fmt][1]
+
+    def file_name(self) -> str:
+        """e.g. "austin_2023_zip.csv", "3metros_2012-2023_zip.parquet", "national_2023_metro.csv"."""
+        if self.metros is None:
+            scope = "national"
+        elif len(self.metros) == 1:
+            scope = self.metros[0].replace(",", "_").replace(" ", "_")
+        else:
+            scope = f"{len(self.metros)}metros"
+        if self.years is None:
+            span = "all-years"
+        elif len(self.years) == 1:
+            span = str(self.years[0])
+        else:
+            span = f"{self.years[0]}-{self.years[-1]}"
+        return f"{scope}_{span}_{self.level}{FORMATS[self.fmt][0]}"
+
+    def plan(self, cube) -> list:
+        """The (metric, year) chunks of this export, in output order."""
+        years = self.years if self.years is not None else cube.years()
+        available = set(cube.years())
+        return [(metric, year) for metric in self.metrics for year in years if year in available]
+
+    def estimate_rows(self, cube) -> int:
+        """Approximate output rows, from the latest year's ZIP / metro counts."""
+        years = cube.years()
+        if not years:
+            return 0
+        frame = cube.zip_metric(years[-1], self.metrics[0])
+        if self.metros is not None:
+            frame = frame[frame["city"].isin(self.metros)]
+        per_chunk = len(frame) if self.level == "zip" else frame["city"].nunique()
+        return per_chunk * len(self.plan(cube))
+
+
+def export_chunk(cube, metric: str, year: int, metros=None, level: str = "zip") -> pd.DataFrame:
+    """One (metric, year) slice of an export as a frame with the level's columns."""
+    if level == "zip":
+        df = cube.zip_metric(year, metric)
+        if metros is not None:
+            df = df[df["city"].isin(metros)]
+        df = df[df["metric_value"].notna()]
+        out = pd.DataFrame({
+            "year": int(year),
+            "metric": metric,
+            "city": df["city"].astype(str).to_numpy(),
+            "city_full": df["city_full"].astype(str).to_numpy(),
+            "zip_code_str": df["zip_code_str"].astype(str).to_numpy(),
+            "metric_value": df["metric_value"].astype("float64").to_numpy(),
+        }, columns=ZIP_COLUMNS[:-2])
+        # Same ranks as the app's ZIP view: 1 = highest within the metro
+        out = cd.compute_rankings(out, "metric_value", "zip_code_str", group_col="city")
+        out = out[ZIP_COLUMNS].astype({"rank": "int32", "rank_total": "int32"})
+        return out.sort_values(["city", "rank", "zip_code_str"], kind="stable", ignore_index=True)
+
+    # Metro rows keep the national ranking of the metro view
+    df = cube.city_metric(year, metric)
+    df = df[df["avg_metric_value"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=METRO_COLUMNS)
+    df = cd.compute_rankings(df, "avg_metric_value", "city")
+    if metros is not None:
+        df = df[df["city"].isin(metros)]
+    out = pd.DataFrame({
+        "year": int(year),
+        "metric": metric,
+        "city": df["city"].astype(str).to_numpy(),
+        "city_full": df["city_full"].astype(str).to_numpy(),
+        "n_zips": df["n"].astype("int32").to_numpy(),
+        "metric_value": df["avg_metric_value"].astype("float64").to_numpy(),
+        "rank": df["rank"].astype("int32").to_numpy(),
+        "rank_total": df["rank_total"].astype("int32").to_numpy(),
+    }, columns=METRO_COLUMNS)
+    return out.sort_values(["rank", "city"], kind="stable", ignore_index=True)
+
+
+# ============================================================
+# 2. Writers
+# ============================================================
+
+def _schema(level: str) -> pa.Schema:
+    key = ("zip_code_str", pa.string()) if level == "zip" else ("n_zips", pa.int32())
+    return pa.schema([
+        ("year", pa.int32()),
+        ("metric", pa.string()),
+        ("city", pa.string()),
+        ("city_full", pa.string()),
+        key,
+        ("metric_value", pa.float64()),
+        ("rank", pa.int32()),
+        ("rank_total", pa.int32()),
+    ])
+
+
+def write_export(request: ExportRequest, cube, out, progress=None, cancel=None) -> int:
+    """
+    Stream the export into `out` (a path, or a binary file object) chunk by
+    chunk; returns the number of rows. `progress(done, total)` is called
+    after every chunk; a set `cancel` event stops at the next chunk.
+    """
+    plan = request.plan(cube)
+    schema = _schema(request.level)
+    rows = 0
+    writer = pq.ParquetWriter(out, schema, compression="zstd") if request.fmt == "parquet" else None
+    sink = open(out, "wb") if request.fmt == "csv" and isinstance(out, (str, os.PathLike)) else out
+    try:
+        for done, (metric, year) in enumerate(plan, start=1):
+            if cancel is not None and cancel.is_set():
+                raise InterruptedError("export cancelled")
+            with timed("exports.chunk"):
+                chunk = export_chunk(cube, metric, year, request.metros, request.level)
+                if len(chunk):
+                    if writer is not None:
+                        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                    else:
+                        sink.write(chunk.to_csv(index=False, header=rows == 0).encode())
+                    rows += len(chunk)
+            if progress:
+                progress(done, len(plan))
+        if writer is None and rows == 0:
+            sink.write((",".join(schema.names) + "\n").encode())
+    finally:
+        if writer is not None:
+            writer.close()
+        elif sink is not out:
+            sink.close()
+    return rows
+
+
+def export_bytes(request: ExportRequest, cube) -> bytes:
+    """A small export as bytes (for st.download_button's deferred data)."""
+    buffer = io.BytesIO()
+    write_export(request, cube, buffer)
+    return buffer.getvalue()
+
+
+# ============================================================
+# 3. Background jobs
+# ============================================================
+
+class ExportJob:
+    """One export running on its own thread; written to `path` when done."""
+
+    def __init__(self, request: ExportRequest, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.path = path
+        self.status = "queued"      # queued → running → done / failed / cancelled; done → expired
+        self.done = 0
+        self.total = 0
+        self.rows = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    def __repr__(self):
+        return f"ExportJob({self.id!r}, {self.status!r}, {self.done}/{self.total})"
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def available(self) -> bool:
+        """Finished and its file still on disk (not pruned)."""
+        return self.status == "done" and os.path.exists(self.path)
+
+    def read(self) -> bytes:
+        """The finished export's bytes (FileNotFoundError once pruned)."""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _progress(self, done, total):
+        self.done, self.total = done, total
+
+    def run(self, cube):
+        self.status, self.started = "running", time.time()
+        tmp = self.path + ".part"
+        try:
+            self.total = len(self.request.plan(cube))
+            self.rows = write_export(self.request, cube, tmp, self._progress, self._cancel)
+            os.replace(tmp, self.path)
+            self.status = "done"
+        except InterruptedError:
+            self.status = "cancelled"
+        except Exception as e:  # surfaced in the app; the session keeps working
+            self.status, self.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            self.finished = time.time()
+
+
+class ExportManager:
+    """
+    Process-wide registry of export jobs. Jobs outlive the script run that
+    started them; the session keeps only the job id. The oldest finished
+    jobs beyond `keep` are dropped with their files.
+    """
+
+    def __init__(self, out_dir: str = EXPORT_DIR, keep: int = KEEP_JOBS):
+        self.out_dir = out_dir
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, request: ExportRequest, cube) -> ExportJob:
+        os.makedirs(self.out_dir, exist_ok=True)
+        with self._lock:
+            self._prune()
+            job = ExportJob(request, "")
+            job.path = os.path.join(self.out_dir, f"{job.id}_{request.file_name()}")
+            self._jobs[job.id] = job
+        threading.Thread(
+            target=job.run, args=(cube,), name=f"export-{job.id}", daemon=True
+        ).start()
+        return job
+
+    def get(self, job_id) -> ExportJob:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in finished[: max(0, len(self._jobs) - self.keep + 1)]:
+            del self._jobs[job.id]
+            if job.status == "done":
+                job.status = "expired"
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+
+@track_cache("exports.get_export_manager")
+@st.cache_resource(show_spinner=False)
+def get_export_manager() -> ExportManager:
+    return ExportManager()
+
+
+# ============================================================
+# 4. CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export metric data as CSV or Parquet.")
+    parser.add_argument("--metrics", nargs="*", help="Metric names (default: all, every CAGR window)")
+    parser.add_argument("--years", nargs="*", type=int, help="Years (default: all)")
+    parser.add_argument("--metros", nargs="*", help="Metro keys (default: the nation)")
+    parser.add_argument("--level", choices=LEVELS, default="zip")
+    parser.add_argument("--format", dest="fmt", choices=list(FORMATS), default=None,
+                        help="Output format (default: from the --out extension, else csv)")
+    parser.add_argument("--out", help="Output file (default: data/exports/<scope>.<ext>)")
+    args = parser.parse_args(argv)
+
+    fmt = args.fmt
+    if fmt is None:
+        fmt = "parquet" if args.out and args.out.endswith(".parquet") else "csv"
+    request = ExportRequest(concrete_metrics(args.metrics), args.years, args.metros, args.level, fmt)
+    out = args.out or os.path.join(EXPORT_DIR, request.file_name())
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} chunks", end="", file=sys.stderr)
+
+    instrumentation.logger.setLevel(logging.WARNING)
+    start = time.perf_counter()
+    cube = inspect.unwrap(get_metric_cube)()
+    rows = write_export(request, cube, out, progress)
+    print(file=sys.stderr)
+    print(f"{rows:,} rows → {out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# forecast.py
+"""
+Batch trend fitting and projection for many time series at once.
+
+Every ZIP (or metro) series is a row of an aligned series × year matrix
+with NaN where a year is missing. Trends are fitted to all rows in one
+pass of masked, closed-form least squares (no per-series loop):
+
+  - "linear"    : value = a + b * year
+  - "loglinear" : log(value) = a + b * year   (constant % growth; values > 0)
+
+Each fit keeps what is needed to project any horizon with a prediction
+interval (Student t, n - 2 degrees of freedom):
+
+    ŷ(x0) ± t * s * sqrt(1 + 1/n + (x0 - x̄)² / Sxx)
+
+Log-linear projections and bounds are transformed back with exp.
+
+    keys, years, Y = series_matrix(df, ["city", "zip_code_str"], "year", "metric_value")
+    fits = fit_trends(years, Y, model="loglinear")
+    table = forecast_table(keys, fits)      # + proj_1y / lo_1y / hi_1y, ...
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t as student_t
+
+HORIZONS = (1, 3, 5)
+MIN_POINTS = 3
+INTERVAL = 0.80
+
+FIT_COLUMNS = [
+    "model", "n_points", "first_year", "last_year", "last_value",
+    "intercept", "slope", "sigma", "x_mean", "sxx", "r2", "annual_change",
+]
+
+
+# ============================================================
+# 1. Panel
+# ============================================================
+
+def series_matrix(df: pd.DataFrame, key_cols, year_col: str, value_col: str):
+    """
+    Long (keys, year, value) rows → (keys DataFrame, years array, matrix)
+    with one row per key and one column per year. Duplicate cells are
+    averaged; missing cells are NaN.
+    """
+    key_cols = list(key_cols)
+    if df.empty:
+        return pd.DataFrame(columns=key_cols), np.array([], dtype=int), np.empty((0, 0))
+    codes, keys = pd.MultiIndex.from_frame(df[key_cols].astype(str)).factorize()
+    years, year_idx = np.unique(df[year_col].to_numpy(dtype=np.int64), return_inverse=True)
+    values = df[value_col].to_numpy(dtype=float)
+
+    sums = np.zeros((len(keys), len(years)))
+    counts = np.zeros((len(keys), len(years)))
+    ok = np.isfinite(values)
+    np.add.at(sums, (codes[ok], year_idx[ok]), values[ok])
+    np.add.at(counts, (codes[ok], year_idx[ok]), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = sums / counts
+    return keys.to_frame(index=False, name=key_cols), years, matrix
+
+
+# ============================================================
+# 2. Fitting
+# ============================================================
+
+def fit_trends(years, Y, model: str = "linear", min_points: int = MIN_POINTS) -> pd.DataFrame:
+    """
+    Fit `model` to every row of Y (series × years). Rows with fewer than
+    `min_points` usable values get NaN parameters.
+    """
+    if model not in ("linear", "loglinear"):
+        raise ValueError(f"Unknown trend model: {model!r}")
+    years = np.asarray(years, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if model == "loglinear":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            Y = np.where(Y > 0, np.log(Y), np.nan)
+
+    mask = np.isfinite(Y)
+    X = np.broadcast_to(years, Y.shape)
+    Yz = np.where(mask, Y, 0.0)
+    n = mask.sum(axis=1).astype(float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(mask, X, 0.0).sum(axis=1) / n
+        y_mean = Yz.sum(axis=1) / n
+        dx = np.where(mask, X - x_mean[:, None], 0.0)
+        dy = np.where(mask, Yz - y_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / sxx
+        intercept = y_mean - slope * x_mean
+        resid = np.where(mask, Yz - (intercept[:, None] + slope[:, None] * X), 0.0)
+        sse = (resid * resid).sum(axis=1)
+        sst = (dy * dy).sum(axis=1)
+        sigma = np.sqrt(sse / (n - 2))
+        r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+
+    valid = (n >= max(min_points, 3)) & (sxx > 0)
+    for arr in (slope, intercept, sigma, r2):
+        arr[~valid] = np.nan
+
+    # Last observed year / value per series
+    last_idx = np.where(mask.any(axis=1), Y.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1), 0)
+    first_idx = np.argmax(mask, axis=1)
+    rows = np.arange(len(Y))
+    last_value = np.where(mask.any(axis=1), Y[rows, last_idx], np.nan) if len(Y) else np.array([])
+    if model == "loglinear":
+        last_value = np.exp(last_value)
+        annual_change = (np.exp(slope) - 1) * 100     # % per year
+    else:
+        annual_change = slope                         # units per year
+
+    return pd.DataFrame(
+        {
+            "model": model,
+            "n_points": n.astype(int),
+            "first_year": years[first_idx].astype(int) if len(years) else [],
+            "last_year": years[last_idx].astype(int) if len(years) else [],
+            "last_value": last_value,
+            "intercept": intercept,
+            "slope": slope,
+            "sigma": sigma,
+            "x_mean": x_mean,
+            "sxx": sxx,
+            "r2": r2,
+            "annual_change": annual_change,
+        }
+    )
+
+
+def predict(fits: pd.DataFrame, target_years, interval: float = INTERVAL):
+    """
+    Projection + prediction interval at `target_years` (scalar, or one per
+    fit) for every fit: (fitted, lower, upper) arrays in value units.
+    """
+    x0 = np.broadcast_to(np.asarray(target_years, dtype=float), (len(fits),))
+    n = fits["n_points"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fitted = fits["intercept"].to_numpy() + fits["slope"].to_numpy() * x0
+        t_crit = student_t.ppf(0.5 + interval / 2, np.maximum(n - 2, 1))
+        se = fits["sigma"].to_numpy() * np.sqrt(
+            1 + 1 / n + (x0 - fits["x_mean"].to_numpy()) ** 2 / fits["sxx"].to_numpy()
+        )
+    lower, upper = fitted - t_crit * se, fitted + t_crit * se
+    loglinear = (fits["model"] == "loglinear").to_numpy()
+    if loglinear.any():
+        fitted, lower, upper = (np.where(loglinear, np.exp(v), v) for v in (fitted, lower, upper))
+    return fitted, lower, upper
+
+
+def forecast_table(keys: pd.DataFrame, fits: pd.DataFrame, horizons=HORIZONS,
+                   interval: float = INTERVAL) -> pd.DataFrame:
+    """keys + fit parameters + proj_/lo_/hi_{h}y columns, h years after the last observation."""
+    table = pd.concat([keys.reset_index(drop=True), fits.reset_index(drop=True)], axis=1)
+    for h in horizons:
+        fitted, lower, upper = predict(fits, fits["last_year"].to_numpy() + h, interval)
+        table[f"proj_{h}y"] = fitted
+        table[f"lo_{h}y"] = lower
+        table[f"hi_{h}y"] = upper
+    return table
+
+
+def projection_path(fit_row, horizon: int = max(HORIZONS), interval: float = INTERVAL) -> pd.DataFrame:
+    """
+    Year-by-year projection for one fitted series, starting at its last
+    observed year (so a chart line connects to the history):
+    [year, fitted, lower, upper].
+    """
+    fit = pd.DataFrame([fit_row])[FIT_COLUMNS] if not isinstance(fit_row, pd.DataFrame) else fit_row
+    last_year = int(fit["last_year"].iloc[0])
+    years = np.arange(last_year, last_year + horizon + 1)
+    fits = pd.concat([fit] * len(years), ignore_index=True)
+    fitted, lower, upper = predict(fits, years, interval)
+    path = pd.DataFrame({"year": years, "fitted": fitted, "lower": lower, "upper": upper})
+    # Anchor the first point on the last observation
+    path.loc[0, ["fitted", "lower", "upper"]] = float(fit["last_value"].iloc[0])
+    return path
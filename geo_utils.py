@@ -2,6 +2,7 @@ import os
 import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
 import streamlit as st
 
 from config_data import (
@@ -10,8 +11,16 @@ from config_data import (
     CBSA_ZIP_PATH,
     ZCTA_ZIP_PATH,
     MANUAL_CBSA_NAME_MAP,
+    LOCAL_STORE_DIR,
+    USE_COLUMNAR_STORE,
 )
 from config_data import compute_rankings
+from instrumentation import timed, track_cache, mark_cache_miss
+from columnar_store import has_store, open_table, table_to_gdf, lookup_rows, table_to_csr_arrays
+from spatial_index import SpatialIndex, AdjacencyGraph, polygon_adjacency
+
+# cbsa_code of a ZIP outside every CBSA (codes are the integer CBSA GEOIDs)
+NO_CBSA = -1
 
 
 # =========================
@@ -46,9 +55,7 @@ def _resolve_shapefile_path(shp_path: str, zip_path: str, label: str) -> str:
     )
 
 
-@st.cache_resource(show_spinner="🗺️ Loading ZIP code boundaries...")
-def load_zcta_shapes() -> gpd.GeoDataFrame:
-    """Load ZCTA (ZIP Code Tabulation Area) boundaries."""
+def _read_zcta_shapefile() -> gpd.GeoDataFrame:
     path = _resolve_shapefile_path(ZCTA_SHP_PATH, ZCTA_ZIP_PATH, "ZCTA")
     gdf = gpd.read_file(path)
 
@@ -59,9 +66,7 @@ def load_zcta_shapes() -> gpd.GeoDataFrame:
     return gdf
 
 
-@st.cache_resource(show_spinner="🏙️ Loading metro area boundaries...")
-def load_cbsa_shapes() -> gpd.GeoDataFrame:
-    """Load CBSA (Core-Based Statistical Area) boundaries."""
+def _read_cbsa_shapefile() -> gpd.GeoDataFrame:
     path = _resolve_shapefile_path(CBSA_SHP_PATH, CBSA_ZIP_PATH, "CBSA")
     gdf = gpd.read_file(path)
 
@@ -72,6 +77,71 @@ def load_cbsa_shapes() -> gpd.GeoDataFrame:
     return gdf
 
 
+def _use_geometry_store(name: str) -> bool:
+    return USE_COLUMNAR_STORE and has_store(name, LOCAL_STORE_DIR)
+
+
+def zcta_store_available() -> bool:
+    """True when ZCTAs can be decoded per metro from the columnar store."""
+    return _use_geometry_store("zcta")
+
+
+def zip_cbsa_store_available() -> bool:
+    """True when the ZIP → CBSA assignment is precomputed in the columnar store."""
+    return _use_geometry_store("zip_cbsa")
+
+
+@track_cache("geo.open_zcta_store")
+@st.cache_resource
+def _open_zcta_store():
+    """Memory-mapped ZCTA table (attributes + WKB), shared across workers."""
+    mark_cache_miss()
+    return open_table("zcta", LOCAL_STORE_DIR)
+
+
+@track_cache("geo.load_zcta_shapes")
+@st.cache_resource(show_spinner="🗺️ Loading ZIP code boundaries...")
+def load_zcta_shapes() -> gpd.GeoDataFrame:
+    """
+    Load ZCTA (ZIP Code Tabulation Area) boundaries.
+
+    Decodes every ZCTA from the columnar store when it exists (no shapefile
+    parsing); prefer load_zcta_shapes_for() when only one metro is needed.
+    """
+    mark_cache_miss()
+    if _use_geometry_store("zcta"):
+        return table_to_gdf(_open_zcta_store())
+    return _read_zcta_shapefile()
+
+
+@timed("geo.load_zcta_shapes_for")
+def load_zcta_shapes_for(zip_codes) -> gpd.GeoDataFrame:
+    """
+    ZCTA polygons for just `zip_codes`, decoded from the memory-mapped store
+    with a binary search on the sorted ZIP key. Keeps per-worker geometry
+    memory proportional to the current view instead of the whole nation.
+    Falls back to filtering the full GeoDataFrame without a store.
+    """
+    zip_codes = pd.Series(list(zip_codes), dtype=str)
+    if not _use_geometry_store("zcta"):
+        gdf = load_zcta_shapes()
+        return gdf[gdf["zip_code_str"].isin(set(zip_codes))]
+
+    keys = pd.to_numeric(zip_codes, errors="coerce").dropna().astype("int64")
+    rows = lookup_rows(_open_zcta_store(), "zip_code", keys.to_numpy())
+    return table_to_gdf(_open_zcta_store(), rows)
+
+
+@track_cache("geo.load_cbsa_shapes")
+@st.cache_resource(show_spinner="🏙️ Loading metro area boundaries...")
+def load_cbsa_shapes() -> gpd.GeoDataFrame:
+    """Load CBSA (Core-Based Statistical Area) boundaries."""
+    mark_cache_miss()
+    if _use_geometry_store("cbsa"):
+        return table_to_gdf(open_table("cbsa", LOCAL_STORE_DIR))
+    return _read_cbsa_shapefile()
+
+
 # =========================
 # 2. City / CBSA matching utilities
 # =========================
@@ -129,6 +199,7 @@ def resolve_manual_cbsa_name(city: str, city_full: str):
     return None
 
 
+@track_cache("geo.build_city_cbsa_polygons")
 @st.cache_data
 def build_city_cbsa_polygons(
     df_city: pd.DataFrame,
@@ -138,16 +209,22 @@ def build_city_cbsa_polygons(
     """
     Given aggregated city-level metrics, match each city to a corresponding CBSA polygon.
     Returns a GeoDataFrame suitable for metro-level choropleths.
+
+    Cities carrying a spatially assigned `cbsa_code` (see
+    assign_cities_to_cbsa) are looked up by GEOID; name matching is only
+    the fallback for cities without one.
     """
+    mark_cache_miss()
     cbsa_gdf = _cbsa_gdf.copy()
     if "name_lower" not in cbsa_gdf.columns:
         cbsa_gdf["name_lower"] = cbsa_gdf["NAME"].astype(str).str.lower()
 
-    # Precompute centroids (EPSG 4326) for nearest-distance fallback
-    cbsa_4326 = cbsa_gdf.to_crs(epsg=4326)
-    centroids = cbsa_4326.geometry.centroid
-    cbsa_gdf["centroid_lat"] = centroids.y
-    cbsa_gdf["centroid_lon"] = centroids.x
+    cbsa_pos = {
+        int(code): i
+        for i, code in enumerate(pd.to_numeric(cbsa_gdf["GEOID"], errors="coerce"))
+        if pd.notna(code)
+    }
+    cbsa_index = None  # built on first ambiguous name match
 
     cbsa_name_lower = cbsa_gdf["name_lower"]
     cbsa_name_upper = cbsa_gdf["NAME"].astype(str).str.upper()
@@ -164,6 +241,20 @@ def build_city_cbsa_polygons(
         if not city_full:
             continue
 
+        # 0. Spatial ZIP → CBSA assignment
+        code = row.get("cbsa_code", NO_CBSA)
+        if pd.notna(code) and int(code) in cbsa_pos:
+            records.append(
+                {
+                    "city": city,
+                    "city_full": city_full,
+                    "metro_name": city_full,
+                    "avg_metric_value": avg_value,
+                    "geometry": cbsa_gdf.geometry.iloc[cbsa_pos[int(code)]],
+                }
+            )
+            continue
+
         candidates = cbsa_gdf.iloc[0:0]
 
         # 1. Manual override
@@ -212,20 +303,23 @@ def build_city_cbsa_polygons(
         if candidates.empty:
             continue
 
-        # Multiple CBSA matches → pick the geographically closest one
+        # Multiple CBSA matches → the one containing the city's point,
+        # otherwise the one with the closest centroid
+        best = candidates.iloc[0]
         if (
             len(candidates) > 1
             and np.isfinite(lat0)
             and np.isfinite(lon0)
         ):
-            cand = candidates.copy()
-            dlat = cand["centroid_lat"] - lat0
-            dlon = cand["centroid_lon"] - lon0
-            cand["dist2"] = dlat * dlat + dlon * dlon
-            cand = cand.sort_values("dist2")
-            best = cand.iloc[0]
-        else:
-            best = candidates.iloc[0]
+            if cbsa_index is None:
+                cbsa_index = get_cbsa_index()
+            containing = candidates[candidates["GEOID"].isin(cbsa_index.contains(lon0, lat0))]
+            if not containing.empty:
+                best = containing.iloc[0]
+            else:
+                dist = cbsa_index.distances(lon0, lat0, candidates["GEOID"])
+                if np.isfinite(dist).any():
+                    best = candidates.iloc[int(np.nanargmin(dist))]
 
         records.append(
             {
@@ -248,9 +342,180 @@ def build_city_cbsa_polygons(
 
 
 # =========================
-# 3. Metro → ZIP polygons
+# 3. Spatial indexes
 # =========================
 
+@track_cache("geo.cbsa_index")
+@st.cache_resource(show_spinner=False)
+def get_cbsa_index() -> SpatialIndex:
+    """STRtree + centroid KD-tree over the CBSA polygons, keyed by GEOID."""
+    mark_cache_miss()
+    with timed("geo.build_index.cbsa"):
+        return SpatialIndex(load_cbsa_shapes(), "GEOID")
+
+
+@track_cache("geo.zcta_index")
+@st.cache_resource(show_spinner="🧭 Indexing ZIP code boundaries...")
+def get_zcta_index() -> SpatialIndex:
+    """
+    STRtree + centroid KD-tree over every ZCTA, keyed by 5-digit ZIP string.
+    Built once per process; answers point / nearest / bbox lookups without
+    scanning the ~33k polygons.
+    """
+    mark_cache_miss()
+    with timed("geo.build_index.zcta"):
+        return SpatialIndex(load_zcta_shapes(), "zip_code_str")
+
+
+# =========================
+# 4. ZIP → CBSA assignment (spatial join)
+# =========================
+
+def build_zip_cbsa_table(zcta_gdf: gpd.GeoDataFrame, cbsa_gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+    """
+    Assign every ZCTA to the CBSA containing its representative point (a
+    point guaranteed to lie inside the ZCTA, unlike its centroid) with one
+    vectorized STRtree join. ZIPs outside every CBSA get NO_CBSA.
+
+    Returns [zip_code, cbsa_code] as integers, sorted by zip_code.
+    """
+    cbsa_index = SpatialIndex(cbsa_gdf, "GEOID")
+    if zcta_gdf.crs is not None and zcta_gdf.crs.to_epsg() != 4326:
+        zcta_gdf = zcta_gdf.to_crs(epsg=4326)
+
+    points = shapely.point_on_surface(np.asarray(zcta_gdf.geometry.values))
+    geoids = cbsa_index.locate(shapely.get_x(points), shapely.get_y(points))
+    table = pd.DataFrame(
+        {
+            "zip_code": pd.to_numeric(zcta_gdf["zip_code_str"], errors="coerce"),
+            "cbsa_code": pd.to_numeric(pd.Series(geoids, index=zcta_gdf.index), errors="coerce"),
+        }
+    ).dropna(subset=["zip_code"])
+    table["zip_code"] = table["zip_code"].astype("int64")
+    table["cbsa_code"] = table["cbsa_code"].fillna(NO_CBSA).astype("int32")
+    return table.sort_values("zip_code").reset_index(drop=True)
+
+
+@track_cache("geo.load_zip_cbsa")
+@st.cache_resource
+def load_zip_cbsa() -> pd.DataFrame:
+    """
+    The ZIP → CBSA table precomputed in the columnar store. The spatial
+    join is only run offline (python columnar_store.py); callers check
+    zip_cbsa_store_available() first.
+    """
+    mark_cache_miss()
+    if not _use_geometry_store("zip_cbsa"):
+        raise FileNotFoundError(
+            f"zip_cbsa.arrow is not in {LOCAL_STORE_DIR}; build it with `python columnar_store.py`"
+        )
+    return open_table("zip_cbsa", LOCAL_STORE_DIR).to_pandas()
+
+
+def _zip_ints(zip_codes) -> np.ndarray:
+    """ZIPs (ints, strings or a categorical) → int64, -1 where unparseable."""
+    zips = pd.Series(zip_codes)
+    if isinstance(zips.dtype, pd.CategoricalDtype):
+        # Parse each category once, then gather by code
+        cats = pd.to_numeric(pd.Series(zips.cat.categories.astype(str)), errors="coerce")
+        cats = cats.fillna(-1).astype("int64").to_numpy()
+        codes = zips.cat.codes.to_numpy()
+        return np.where(codes >= 0, cats[codes], -1)
+    return pd.to_numeric(zips, errors="coerce").fillna(-1).astype("int64").to_numpy()
+
+
+def zip_to_cbsa(zip_codes) -> np.ndarray:
+    """int32 CBSA code per ZIP (NO_CBSA when unassigned), by binary search."""
+    table = load_zip_cbsa()
+    keys = table["zip_code"].to_numpy()
+    codes = table["cbsa_code"].to_numpy()
+    values = _zip_ints(zip_codes)
+    if len(keys) == 0:
+        return np.full(len(values), NO_CBSA, dtype=np.int32)
+    pos = np.clip(np.searchsorted(keys, values), 0, len(keys) - 1)
+    return np.where(keys[pos] == values, codes[pos], NO_CBSA).astype(np.int32)
+
+
+def assign_cities_to_cbsa(df_zip: pd.DataFrame) -> pd.DataFrame:
+    """
+    Metro → CBSA by majority vote of the metro's ZIPs, as an integer
+    groupby over (city code, CBSA code) pairs. Returns [city, cbsa_code];
+    cities with no ZIP inside a CBSA are left out (name-matching fallback).
+    """
+    city_codes, cities = pd.factorize(df_zip["city"])
+    if "cbsa_code" in df_zip.columns:
+        cbsa = df_zip["cbsa_code"].to_numpy()
+    else:
+        cbsa = zip_to_cbsa(df_zip["zip_code_str"])
+    keep = (city_codes >= 0) & (cbsa != NO_CBSA)
+    if not keep.any():
+        return pd.DataFrame({"city": [], "cbsa_code": np.array([], dtype=np.int32)})
+
+    votes = (
+        pd.DataFrame({"city": city_codes[keep], "cbsa_code": cbsa[keep]})
+        .groupby(["city", "cbsa_code"], sort=False)
+        .size()
+        .reset_index(name="n")
+        .sort_values(["city", "n", "cbsa_code"], ascending=[True, False, True])
+        .drop_duplicates("city")
+    )
+    return pd.DataFrame(
+        {
+            "city": np.asarray(cities)[votes["city"].to_numpy()],
+            "cbsa_code": votes["cbsa_code"].to_numpy(dtype=np.int32),
+        }
+    )
+
+
+# =========================
+# 5. ZCTA adjacency
+# =========================
+
+def build_zcta_adjacency(zcta_gdf: gpd.GeoDataFrame) -> AdjacencyGraph:
+    """
+    Which ZCTAs border each other, from one STRtree query over all
+    polygons. Meant to run offline (python columnar_store.py); rows are
+    ordered by integer ZIP.
+    """
+    zip_codes = pd.to_numeric(zcta_gdf["zip_code_str"], errors="coerce")
+    valid = zip_codes.notna().to_numpy()
+    zip_codes = zip_codes[valid].astype("int64").to_numpy()
+    order = np.argsort(zip_codes, kind="stable")
+    geometries = np.asarray(zcta_gdf.geometry.values)[valid][order]
+    with timed("geo.build_zcta_adjacency"):
+        return AdjacencyGraph(zip_codes[order], polygon_adjacency(geometries))
+
+
+@track_cache("geo.load_zcta_adjacency")
+@st.cache_resource(show_spinner="🧩 Loading ZIP neighbors...")
+def load_zcta_adjacency() -> AdjacencyGraph:
+    """
+    ZCTA adjacency as a CSR matrix, memory-mapped from the columnar store
+    when it was precomputed, otherwise built once from the shapes.
+    """
+    mark_cache_miss()
+    if _use_geometry_store("zcta_adjacency"):
+        return AdjacencyGraph.from_csr_arrays(
+            *table_to_csr_arrays(open_table("zcta_adjacency", LOCAL_STORE_DIR))
+        )
+    return build_zcta_adjacency(load_zcta_shapes())
+
+
+def get_zip_neighbors(zip_code) -> list:
+    """ZIPs bordering `zip_code` (empty when unknown or shapes are unavailable)."""
+    if not zip_code:
+        return []
+    try:
+        return load_zcta_adjacency().neighbors(zip_code)
+    except (RuntimeError, OSError):
+        return []
+
+
+# =========================
+# 6. Metro → ZIP polygons
+# =========================
+
+@timed("geo.get_zip_polygons_for_metro")
 def get_zip_polygons_for_metro(selected_city, zcta_shapes, df_zip_metric):
     """
     Return ZIP-level polygons and metric values for a given metro.
@@ -259,8 +524,9 @@ def get_zip_polygons_for_metro(selected_city, zcta_shapes, df_zip_metric):
     ----------
     selected_city : str
         The metro/city selected at the top level.
-    zcta_shapes : GeoDataFrame
-        ZCTA geographic boundaries.
+    zcta_shapes : GeoDataFrame or None
+        ZCTA geographic boundaries. Pass None to decode only this metro's
+        ZCTAs from the memory-mapped store (see load_zcta_shapes_for).
     df_zip_metric : DataFrame
         Contains ['city', 'zip_code_str', 'metric_value', ...]
 
@@ -283,5 +549,8 @@ def get_zip_polygons_for_metro(selected_city, zcta_shapes, df_zip_metric):
         .drop_duplicates()
     )
 
+    if zcta_shapes is None:
+        zcta_shapes = load_zcta_shapes_for(zip_df_small["zip_code_str"].astype(str).unique())
+
     gdf_merge = zcta_shapes.merge(zip_df_small, on="zip_code_str", how="inner")
     return zip_df_city, gdf_merge
@@ -0,0 +1,237 @@
+# hotspots.py
+"""
+Spatial hotspot statistics for ZIP-level values, computed in batch.
+
+Given one value per ZIP and a sparse contiguity matrix W (ZCTA adjacency,
+see spatial_index.AdjacencyGraph), this module computes for every ZIP at
+once:
+
+  - local Moran's I  : z_i * (W z)_i on row-standardized W, with a
+                       pseudo p-value from conditional permutations
+                       (all ZIPs × all permutations drawn as arrays)
+  - Getis-Ord Gi*    : analytic z-score of the local sum (self included)
+
+Every statistic can be computed within groups (e.g. per metro): values are
+standardized per group, edges across groups are dropped and permutations
+only draw from the same group. With a single group it is the national
+analysis.
+
+Typical use (see MetricCube.hotspots):
+
+    W = graph.weights_for(df_zip["zip_code_str"])
+    table = hotspot_table(df_zip["metric_value"], W, groups=df_zip["city"])
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.special import ndtr
+
+DEFAULT_PERMUTATIONS = 499
+DEFAULT_ALPHA = 0.05
+
+# Cluster labels, in legend order
+HOT_SPOT = "Hot spot (High-High)"
+COLD_SPOT = "Cold spot (Low-Low)"
+HIGH_OUTLIER = "High outlier (High-Low)"
+LOW_OUTLIER = "Low outlier (Low-High)"
+NOT_SIGNIFICANT = "Not significant"
+CLUSTER_LABELS = [HOT_SPOT, COLD_SPOT, HIGH_OUTLIER, LOW_OUTLIER, NOT_SIGNIFICANT]
+
+# Random draws held in memory at once during permutation inference
+_PERMUTATION_BUDGET = 4_000_000
+
+
+# ============================================================
+# 1. Weights
+# ============================================================
+
+def _group_codes(groups, n: int) -> np.ndarray:
+    if groups is None:
+        return np.zeros(n, dtype=np.int64)
+    codes, _ = pd.factorize(pd.Series(np.asarray(groups)), use_na_sentinel=True)
+    return codes.astype(np.int64)
+
+
+def restrict_to_groups(W: sparse.spmatrix, codes: np.ndarray) -> sparse.csr_matrix:
+    """Drop edges between different groups."""
+    coo = W.tocoo()
+    keep = codes[coo.row] == codes[coo.col]
+    return sparse.csr_matrix(
+        (coo.data[keep], (coo.row[keep], coo.col[keep])), shape=W.shape
+    )
+
+
+def row_standardize(W: sparse.spmatrix) -> sparse.csr_matrix:
+    """Scale each row to sum 1 (rows without neighbors stay empty)."""
+    W = sparse.csr_matrix(W, dtype=float)
+    row_sums = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return (sparse.diags(scale) @ W).tocsr()
+
+
+def knn_weights(lons, lats, k: int = 6) -> sparse.csr_matrix:
+    """k-nearest-neighbor weights from point coordinates (fallback without shapes)."""
+    from spatial_index import PointIndex
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    n = len(lons)
+    points = PointIndex(np.arange(n), lons, lats)
+    k = min(int(k), len(points) - 1)
+    if k <= 0:
+        return sparse.csr_matrix((n, n))
+    _, idx = points.kdtree.query(points.kdtree.data, k=k + 1)
+    rows = np.repeat(points.rows, k)
+    cols = points.rows[idx[:, 1:].ravel()]
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+
+# ============================================================
+# 2. Statistics
+# ============================================================
+
+def _standardize(values: np.ndarray, codes: np.ndarray):
+    """Per-group z-scores plus group mean / std / size per element."""
+    s = pd.Series(values)
+    grouped = s.groupby(codes)
+    mean = grouped.transform("mean").to_numpy()
+    std = grouped.transform("std", ddof=0).to_numpy()
+    size = grouped.transform("size").to_numpy()
+    z = np.divide(values - mean, std, out=np.zeros_like(values), where=std > 0)
+    return z, mean, std, size
+
+
+def local_moran(values, W: sparse.spmatrix, groups=None,
+                permutations: int = DEFAULT_PERMUTATIONS, seed: int = 0) -> pd.DataFrame:
+    """
+    Local Moran's I for every element of `values`.
+
+    Returns [z, lag, local_i, p_value, quadrant] where quadrant is 1=HH,
+    2=LH, 3=LL, 4=HL (0 without neighbors). The p-value is a folded
+    pseudo p-value from conditional permutations: each element keeps its
+    own value while its neighbors' slots are filled with values drawn
+    from the rest of its group (with replacement, which is
+    indistinguishable from PySAL's draw without replacement when groups
+    are much larger than the number of neighbors).
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    codes = _group_codes(groups, n)
+    W = row_standardize(restrict_to_groups(W, codes))
+    z, _, _, _ = _standardize(values, codes)
+    lag = W @ z
+    local_i = z * lag
+
+    degree = np.diff(W.indptr)
+    quadrant = np.where(
+        degree == 0, 0,
+        np.where(z >= 0, np.where(lag >= 0, 1, 4), np.where(lag >= 0, 2, 3)),
+    )
+    p_value = np.full(n, np.nan)
+    if permutations > 0 and n > 1:
+        p_value = _permutation_p(z, local_i, W, codes, degree, permutations, seed)
+
+    return pd.DataFrame(
+        {"z": z, "lag": lag, "local_i": local_i, "p_value": p_value, "quadrant": quadrant}
+    )
+
+
+def _permutation_p(z, local_i, W, codes, degree, permutations, seed) -> np.ndarray:
+    n = len(z)
+    rng = np.random.default_rng(seed)
+
+    # Elements sorted by group, so each group is a contiguous index range
+    order = np.argsort(codes, kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    z_sorted = z[order]
+    _, starts, sizes = np.unique(codes[order], return_index=True, return_counts=True)
+    group_of = np.searchsorted(starts, rank, side="right") - 1
+    start = starts[group_of]
+    size = sizes[group_of]
+
+    p_value = np.full(n, np.nan)
+    testable = np.flatnonzero((degree > 0) & (size > 1))
+    if testable.size == 0:
+        return p_value
+
+    kmax = int(degree[testable].max())
+    chunk = max(1, _PERMUTATION_BUDGET // (permutations * kmax))
+    for lo in range(0, testable.size, chunk):
+        nodes = testable[lo:lo + chunk]
+        k = degree[nodes]
+        kmax_c = int(k.max())
+
+        # Padded (nodes × kmax) neighbor weights; padding weight 0
+        slot = np.arange(kmax_c)
+        valid = slot[None, :] < k[:, None]
+        weights = np.zeros((len(nodes), kmax_c))
+        row_ptr = W.indptr[nodes]
+        weights[valid] = W.data[(row_ptr[:, None] + slot[None, :])[valid]]
+
+        # Draw from the node's group, skipping the node itself
+        draws = rng.random((permutations, len(nodes), kmax_c))
+        picks = (draws * (size[nodes] - 1)[None, :, None]).astype(np.int64)
+        own = (rank[nodes] - start[nodes])[None, :, None]
+        picks = picks + (picks >= own) + start[nodes][None, :, None]
+
+        lag_perm = (z_sorted[picks] * weights[None, :, :]).sum(axis=2)
+        local_perm = z[nodes][None, :] * lag_perm
+        larger = (local_perm >= local_i[nodes][None, :]).sum(axis=0)
+        folded = np.minimum(larger, permutations - larger)
+        p_value[nodes] = (folded + 1.0) / (permutations + 1.0)
+    return p_value
+
+
+def getis_ord_gstar(values, W: sparse.spmatrix, groups=None) -> pd.DataFrame:
+    """
+    Getis-Ord Gi* (binary weights, self included) for every element:
+    [gi_z, gi_p] with a two-sided normal p-value. Positive z = cluster of
+    high values.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    codes = _group_codes(groups, n)
+    B = restrict_to_groups(W, codes)
+    B = sparse.csr_matrix((np.ones(B.nnz), B.indices, B.indptr), shape=B.shape)
+    B = (B + sparse.identity(n, format="csr")).tocsr()
+
+    _, mean, std, size = _standardize(values, codes)
+    w_sum = np.asarray(B.sum(axis=1)).ravel()
+    w_sq = w_sum  # binary weights: Σw² = Σw
+    local_sum = B @ values
+    denom = std * np.sqrt(
+        np.clip((size * w_sq - w_sum ** 2) / np.maximum(size - 1, 1), 0, None)
+    )
+    gi_z = np.divide(local_sum - mean * w_sum, denom, out=np.full(n, np.nan), where=denom > 0)
+    gi_p = 2.0 * ndtr(-np.abs(gi_z))
+    return pd.DataFrame({"gi_z": gi_z, "gi_p": gi_p})
+
+
+# ============================================================
+# 3. Combined table
+# ============================================================
+
+def classify(quadrant: np.ndarray, p_value: np.ndarray, alpha: float = DEFAULT_ALPHA) -> np.ndarray:
+    """LISA cluster label per element."""
+    labels = np.array([NOT_SIGNIFICANT, HOT_SPOT, LOW_OUTLIER, COLD_SPOT, HIGH_OUTLIER], dtype=object)
+    significant = np.nan_to_num(p_value, nan=1.0) < alpha
+    return labels[np.where(significant, quadrant, 0)]
+
+
+def hotspot_table(values, W: sparse.spmatrix, groups=None,
+                  permutations: int = DEFAULT_PERMUTATIONS, alpha: float = DEFAULT_ALPHA,
+                  seed: int = 0) -> pd.DataFrame:
+    """
+    Local Moran's I + Gi* + cluster label for every element, in input
+    order: [z, lag, local_i, p_value, quadrant, gi_z, gi_p, cluster].
+    """
+    moran = local_moran(values, W, groups, permutations, seed)
+    gstar = getis_ord_gstar(values, W, groups)
+    table = pd.concat([moran, gstar], axis=1)
+    table["cluster"] = pd.Categorical(
+        classify(table["quadrant"].to_numpy(), table["p_value"].to_numpy(), alpha),
+        categories=CLUSTER_LABELS,
+    )
+    return table
@@ -0,0 +1,405 @@
+# ingest.py
+"""
+Bounded-memory ingestion: raw monthly ZIP-level files → house_ts_agg.
+
+Reproduces the aggregation the Databricks query runs server-side
+
+    AVG(median_sale_price), AVG(per_capita_income), AVG(lat), AVG(lon)
+    GROUP BY city, city_full, zip_code, year
+    WHERE median_sale_price IS NOT NULL AND median_sale_price > 0
+
+on raw files far larger than RAM. Files are streamed in Arrow record
+batches (CSV blocks / Parquet row groups); each batch is reduced to
+per-group sums and counts and folded into global accumulators, so memory
+is bounded by the number of (metro, ZIP, year) groups, not the raw size.
+
+Besides the mean, the median of each group's monthly values is available
+as `median_sale_price_p50`:
+
+  - "approx" : (default) a log-spaced histogram per group over $1k–$100M
+               (`--bins`, default 128 → bins ≈9% wide, interpolated within
+               the bin); memory per group is fixed however many raw values
+               it has
+  - "exact"  : spills each valid price as float32 + a group id (8 bytes per
+               raw value) to temporary files bucketed by group, then sorts
+               one bucket at a time. NOT bounded by the number of groups:
+               disk grows with the raw row count and RAM with the largest
+               bucket (≈ raw values / `--spill-buckets`)
+  - "none"   : means only
+
+Income may come in the same files or in separate (zip_code, year|date,
+per_capita_income) files, averaged per ZIP-year and joined at the end.
+
+Usage:
+    python ingest.py raw/prices_*.csv --income raw/income_*.parquet \\
+        --out-csv data/house_ts_agg.csv --store data/store
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+GROUP_KEYS = ["city", "city_full", "zip_code", "year"]
+MEAN_COLUMNS = ["median_sale_price", "per_capita_income", "lat", "lon"]
+
+COLUMN_TYPES = {
+    "city": pa.string(),
+    "city_full": pa.string(),
+    "zip_code": pa.int64(),
+    "year": pa.int64(),
+    "month": pa.int64(),
+    "date": pa.string(),
+    "median_sale_price": pa.float64(),
+    "per_capita_income": pa.float64(),
+    "lat": pa.float64(),
+    "lon": pa.float64(),
+}
+
+# Approximate-median histogram range (log10 of the price)
+_LOG_LO, _LOG_HI = 3.0, 8.0
+
+
+# ============================================================
+# 1. Streaming readers
+# ============================================================
+
+def iter_batches(path: str, columns=None, chunk_bytes: int = 64 << 20, batch_rows: int = 250_000):
+    """
+    Yield pa.RecordBatch from a CSV or Parquet file without reading it
+    whole. Only `columns` that exist in the file are read.
+    """
+    if path.lower().endswith(".parquet"):
+        pf = pq.ParquetFile(path)
+        names = pf.schema_arrow.names
+        wanted = [c for c in columns if c in names] if columns else None
+        yield from pf.iter_batches(batch_size=batch_rows, columns=wanted)
+        return
+
+    with open(path, "rb") as fh:
+        header = fh.readline()
+    names = pacsv.read_csv(pa.BufferReader(header)).schema.names
+    wanted = [c for c in columns if c in names] if columns else names
+    convert = pacsv.ConvertOptions(
+        include_columns=wanted,
+        column_types={c: t for c, t in COLUMN_TYPES.items() if c in wanted},
+    )
+    for block in _csv_blocks(path, chunk_bytes):
+        table = pacsv.read_csv(pa.BufferReader(header + block), convert_options=convert)
+        yield from table.to_batches()
+
+
+def _csv_blocks(path: str, chunk_bytes: int):
+    """
+    Raw CSV body in ~chunk_bytes pieces cut at line ends. Parsing one piece
+    at a time keeps memory bounded (pyarrow's streaming CSV reader parses
+    ahead as fast as it can). Quoted fields must not contain newlines.
+    """
+    with open(path, "rb") as fh:
+        fh.readline()  # header
+        carry = b""
+        while True:
+            data = fh.read(chunk_bytes)
+            if not data:
+                break
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                carry = data
+                continue
+            carry = data[cut:]
+            yield data[:cut]
+        if carry.strip():
+            yield carry if carry.endswith(b"\n") else carry + b"\n"
+
+
+def _with_year(df: pd.DataFrame) -> pd.DataFrame:
+    """Derive `year` from `date` when the raw file has no year column."""
+    if "year" not in df.columns:
+        if "date" not in df.columns:
+            raise ValueError("raw file needs a 'year' or 'date' column")
+        df["year"] = pd.to_datetime(df["date"], errors="coerce").dt.year
+        df = df[df["year"].notna()]
+        df["year"] = df["year"].astype("int64")
+    return df
+
+
+# ============================================================
+# 2. Accumulators
+# ============================================================
+
+class GroupAccumulator:
+    """
+    Running per-group sums / counts keyed by `keys`. Each batch is
+    pre-aggregated with pandas, then mapped onto stable global group ids
+    through a merge against the (small) key table.
+    """
+
+    def __init__(self, keys: list, value_cols: list):
+        self.keys = keys
+        self.value_cols = value_cols
+        self.key_table = None          # keys + "gid"
+        self.sums = {c: np.zeros(0) for c in value_cols}
+        self.counts = {c: np.zeros(0, dtype=np.int64) for c in value_cols}
+
+    @property
+    def n_groups(self) -> int:
+        return 0 if self.key_table is None else len(self.key_table)
+
+    def _global_ids(self, batch_keys: pd.DataFrame) -> np.ndarray:
+        """Global id for each row of a de-duplicated key frame (new keys appended)."""
+        if self.key_table is None:
+            self.key_table = batch_keys.reset_index(drop=True).assign(
+                gid=np.arange(len(batch_keys), dtype=np.int64)
+            )
+            return self.key_table["gid"].to_numpy()
+
+        merged = batch_keys.merge(self.key_table, on=self.keys, how="left")
+        new_mask = merged["gid"].isna().to_numpy()
+        if new_mask.any():
+            start = len(self.key_table)
+            new_keys = batch_keys[new_mask].reset_index(drop=True)
+            new_keys["gid"] = np.arange(start, start + len(new_keys), dtype=np.int64)
+            self.key_table = pd.concat([self.key_table, new_keys], ignore_index=True)
+            merged.loc[new_mask, "gid"] = new_keys["gid"].to_numpy()
+        return merged["gid"].to_numpy(dtype=np.int64)
+
+    def _grow(self):
+        n = self.n_groups
+        for c in self.value_cols:
+            if len(self.sums[c]) < n:
+                self.sums[c] = np.concatenate([self.sums[c], np.zeros(n - len(self.sums[c]))])
+                self.counts[c] = np.concatenate(
+                    [self.counts[c], np.zeros(n - len(self.counts[c]), dtype=np.int64)]
+                )
+
+    def add(self, df: pd.DataFrame) -> np.ndarray:
+        """Fold one batch in; returns each row's global group id."""
+        grouped = df.groupby(self.keys, sort=False, observed=True, dropna=False)
+        row_group = grouped.ngroup().to_numpy()
+        partial = grouped[self.value_cols].agg(["sum", "count"])
+        batch_keys = partial.index.to_frame(index=False)
+        gids = self._global_ids(batch_keys)
+        self._grow()
+        for c in self.value_cols:
+            np.add.at(self.sums[c], gids, partial[(c, "sum")].to_numpy(dtype=float))
+            np.add.at(self.counts[c], gids, partial[(c, "count")].to_numpy(dtype=np.int64))
+        return gids[row_group]
+
+    def result(self) -> pd.DataFrame:
+        out = self.key_table.drop(columns="gid").copy()
+        for c in self.value_cols:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[c] = np.where(self.counts[c] > 0, self.sums[c] / self.counts[c], np.nan)
+        return out
+
+
+class ExactMedian:
+    """
+    All (group id, value) pairs spilled to disk, bucketed by group id
+    (gid % buckets); each bucket is then read and sorted on its own. Disk
+    use is 8 bytes per raw value and peak RAM one bucket, so this is not
+    bounded by the number of groups — prefer HistogramMedian for raw
+    data far larger than RAM.
+    """
+
+    PAIR = np.dtype([("gid", "<i4"), ("val", "<f4")])
+
+    def __init__(self, buckets: int = 64, spill_dir: str = None):
+        self.buckets = max(int(buckets), 1)
+        self._dir = tempfile.mkdtemp(prefix="ingest_median_", dir=spill_dir)
+        self._files = [
+            open(os.path.join(self._dir, f"bucket_{i:04d}.bin"), "wb") for i in range(self.buckets)
+        ]
+
+    def add(self, gids: np.ndarray, values: np.ndarray):
+        pairs = np.empty(len(gids), dtype=self.PAIR)
+        pairs["gid"] = gids
+        pairs["val"] = values
+        bucket = pairs["gid"] % self.buckets
+        for i in np.unique(bucket):
+            pairs[bucket == i].tofile(self._files[i])
+
+    def result(self, n_groups: int) -> np.ndarray:
+        out = np.full(n_groups, np.nan)
+        try:
+            for f in self._files:
+                f.close()
+            for f in self._files:
+                pairs = np.fromfile(f.name, dtype=self.PAIR)
+                if len(pairs):
+                    self._bucket_medians(pairs["gid"], pairs["val"], out)
+        finally:
+            shutil.rmtree(self._dir, ignore_errors=True)
+        return out
+
+    @staticmethod
+    def _bucket_medians(gids: np.ndarray, vals: np.ndarray, out: np.ndarray):
+        order = np.lexsort((vals, gids))
+        gids, vals = gids[order], vals[order].astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, gids[1:] != gids[:-1]])
+        counts = np.diff(np.r_[starts, len(gids)])
+        lo = starts + (counts - 1) // 2
+        hi = starts + counts // 2
+        out[gids[starts]] = (vals[lo] + vals[hi]) / 2.0
+
+
+class HistogramMedian:
+    """Per-group log-spaced histogram; median interpolated within its bin."""
+
+    def __init__(self, bins: int = 128):
+        self.bins = bins
+        self.counts = np.zeros((0, bins), dtype=np.uint32)
+
+    def add(self, gids: np.ndarray, values: np.ndarray):
+        n = int(gids.max()) + 1 if len(gids) else 0
+        if n > len(self.counts):
+            grow = np.zeros((n - len(self.counts), self.bins), dtype=np.uint32)
+            self.counts = np.vstack([self.counts, grow])
+        pos = (np.log10(values) - _LOG_LO) / (_LOG_HI - _LOG_LO) * self.bins
+        b = np.clip(pos.astype(np.int64), 0, self.bins - 1)
+        np.add.at(self.counts, (gids, b), 1)
+
+    def result(self, n_groups: int) -> np.ndarray:
+        out = np.full(n_groups, np.nan)
+        counts = self.counts[:n_groups].astype(np.float64)
+        totals = counts.sum(axis=1)
+        has = totals > 0
+        cum = counts.cumsum(axis=1)
+        half = totals / 2.0
+        b = (cum < half[:, None]).sum(axis=1).clip(0, self.bins - 1)
+        rows = np.arange(len(counts))
+        below = np.where(b > 0, cum[rows, np.maximum(b - 1, 0)], 0.0)
+        inside = counts[rows, b]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.where(inside > 0, (half - below) / inside, 0.5)
+        width = (_LOG_HI - _LOG_LO) / self.bins
+        log_val = _LOG_LO + (b + frac) * width
+        out[: len(counts)][has] = 10 ** log_val[has]
+        return out
+
+
+# ============================================================
+# 3. Pipeline
+# ============================================================
+
+def _income_by_zip_year(paths, chunk_bytes: int) -> pd.DataFrame:
+    acc = GroupAccumulator(["zip_code", "year"], ["per_capita_income"])
+    for path in paths:
+        for batch in iter_batches(path, ["zip_code", "year", "date", "per_capita_income"], chunk_bytes):
+            df = _with_year(batch.to_pandas())
+            df = df[df["zip_code"].notna() & df["per_capita_income"].notna()]
+            if not df.empty:
+                acc.add(df[["zip_code", "year", "per_capita_income"]])
+    if acc.n_groups == 0:
+        return pd.DataFrame(columns=["zip_code", "year", "per_capita_income"])
+    return acc.result()
+
+
+def aggregate_monthly(
+    paths,
+    income_paths=(),
+    median: str = "approx",
+    bins: int = 128,
+    spill_buckets: int = 64,
+    chunk_bytes: int = 64 << 20,
+    progress=None,
+) -> pd.DataFrame:
+    """
+    Stream raw monthly files and return the city/ZIP/year aggregate with
+    the columns of house_ts_agg.csv (+ median_sale_price_p50 unless
+    median="none").
+    """
+    if median not in ("exact", "approx", "none"):
+        raise ValueError("median must be 'exact', 'approx' or 'none'")
+    acc = GroupAccumulator(GROUP_KEYS, MEAN_COLUMNS)
+    med = {
+        "exact": lambda: ExactMedian(spill_buckets),
+        "approx": lambda: HistogramMedian(bins),
+    }.get(median)
+    med = med() if med else None
+
+    rows_read = 0
+    for path in paths:
+        for batch in iter_batches(path, list(COLUMN_TYPES), chunk_bytes):
+            rows_read += batch.num_rows
+            price = batch.column("median_sale_price")
+            batch = batch.filter(pc.fill_null(pc.greater(price, 0), False))
+            if batch.num_rows == 0:
+                continue
+            df = _with_year(batch.to_pandas())
+            for c in MEAN_COLUMNS:
+                if c not in df.columns:
+                    df[c] = np.nan
+            gids = acc.add(df[GROUP_KEYS + MEAN_COLUMNS])
+            if med is not None:
+                med.add(gids, df["median_sale_price"].to_numpy(dtype=np.float64))
+            if progress:
+                progress(rows_read, acc.n_groups)
+
+    if acc.n_groups == 0:
+        return pd.DataFrame(columns=GROUP_KEYS + MEAN_COLUMNS)
+
+    out = acc.result()
+    if med is not None:
+        out["median_sale_price_p50"] = med.result(acc.n_groups)
+
+    if income_paths:
+        income = _income_by_zip_year(income_paths, chunk_bytes)
+        out = out.drop(columns="per_capita_income").merge(income, on=["zip_code", "year"], how="left")
+
+    columns = GROUP_KEYS + MEAN_COLUMNS + [c for c in out.columns if c not in GROUP_KEYS + MEAN_COLUMNS]
+    return out[columns].sort_values(["year", "city", "zip_code"], kind="stable").reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate raw monthly files into house_ts_agg.")
+    parser.add_argument("inputs", nargs="+", help="Raw monthly price files (CSV / Parquet)")
+    parser.add_argument("--income", nargs="*", default=[], help="Separate income files")
+    parser.add_argument("--median", choices=["approx", "exact", "none"], default="approx")
+    parser.add_argument("--bins", type=int, default=128, help="Histogram bins for --median approx")
+    parser.add_argument("--spill-buckets", type=int, default=64, help="Spill files for --median exact")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="CSV block size per batch")
+    parser.add_argument("--out-csv", default=None, help="Write house_ts_agg.csv here")
+    parser.add_argument("--store", default=None, help="Write the columnar store (house.arrow) here")
+    args = parser.parse_args(argv)
+
+    if not args.out_csv and not args.store:
+        parser.error("give --out-csv and/or --store")
+
+    def progress(rows, groups):
+        print(f"\r{rows:,} raw rows → {groups:,} groups", end="", file=sys.stderr)
+
+    agg = aggregate_monthly(
+        args.inputs, args.income, median=args.median, bins=args.bins,
+        spill_buckets=args.spill_buckets,
+        chunk_bytes=args.chunk_mb << 20, progress=progress,
+    )
+    print(file=sys.stderr)
+
+    if args.out_csv:
+        folder = os.path.dirname(args.out_csv)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        agg.to_csv(args.out_csv, index=False)
+        print(f"{len(agg):,} rows → {args.out_csv}")
+    if args.store:
+        import inspect
+        from config_data import _standardize_house_df
+        from columnar_store import build_store
+
+        house = inspect.unwrap(_standardize_house_df)(agg)
+        written = build_store(args.store, house_df=house)
+        print(f"{len(house):,} rows → {written['house']}")
+
+
+if __name__ == "__main__":
+    main()
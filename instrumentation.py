@@ -0,0 +1,284 @@
+# instrumentation.py
+"""
+Per-rerun timing and cache instrumentation.
+
+- timed(name): decorator *or* context manager that records how long a
+  phase of the rerun took (loading, groupbys, polygon matching, GeoJSON
+  conversion, st.plotly_chart, ...)
+- track_cache(name): wraps an @st.cache_data / @st.cache_resource loader
+  and records whether the call was a cache hit or a miss. The cached body
+  must call mark_cache_miss() so we know it actually ran.
+- render_debug_panel(): opt-in sidebar panel showing the current rerun.
+
+Every record is also written as one JSON line on the "data511.perf"
+logger, so regressions can be found in production logs without
+attaching a profiler.
+
+Enable the sidebar panel with DATA511_DEBUG_TIMINGS=1 or by opening the
+app with ?debug=1. Set DATA511_PERF_LOG=0 to silence the log lines.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+# ============================================================
+# 1. Settings
+# ============================================================
+
+DEBUG_ENV_VAR = "DATA511_DEBUG_TIMINGS"
+PERF_LOG_ENV_VAR = "DATA511_PERF_LOG"
+
+PERF_LOG_ENABLED = os.getenv(PERF_LOG_ENV_VAR, "1").lower() not in ("0", "false", "no")
+
+logger = logging.getLogger("data511.perf")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Streamlit runs each session's script in its own thread, and cached
+# functions execute in the calling thread, so thread-local storage gives
+# us "records of the current rerun" without touching session_state.
+_local = threading.local()
+
+
+def _state():
+    if not hasattr(_local, "records"):
+        _local.records = []
+        _local.depth = 0
+        _local.cache_stack = []
+        _local.run_id = None
+        _local.run_start = time.perf_counter()
+    return _local
+
+
+# ============================================================
+# 2. Recording
+# ============================================================
+
+def start_rerun() -> str:
+    """
+    Reset the records for a new rerun. Call once at the top of app.py.
+    Returns the run id attached to every log line of this rerun.
+    """
+    state = _state()
+    state.records = []
+    state.depth = 0
+    state.cache_stack = []
+    state.run_id = uuid.uuid4().hex[:12]
+    state.run_start = time.perf_counter()
+    return state.run_id
+
+
+def _emit(record: dict):
+    state = _state()
+    record["run_id"] = state.run_id
+    state.records.append(record)
+    if PERF_LOG_ENABLED:
+        logger.info(json.dumps(record, default=str))
+
+
+class timed:
+    """
+    Record the wall time of a phase.
+
+    Usable as a decorator:
+
+        @timed("geo.build_city_cbsa_polygons")
+        def build_city_cbsa_polygons(...): ...
+
+    or as a context manager:
+
+        with timed("app.plotly_chart.metro"):
+            st.plotly_chart(fig)
+
+    As a context manager the elapsed time is on `.ms` afterwards.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ms = None
+        self._start = None
+        self._depth = 0
+
+    def __enter__(self):
+        state = _state()
+        self._depth = state.depth
+        state.depth += 1
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._start) * 1000.0
+        self.ms = elapsed_ms
+        state = _state()
+        state.depth = max(state.depth - 1, 0)
+        _emit(
+            {
+                "event": "phase",
+                "phase": self.name,
+                "ms": round(elapsed_ms, 3),
+                "depth": self._depth,
+                "ok": exc_type is None,
+            }
+        )
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def mark_cache_miss():
+    """
+    Called from inside a cached function body. Streamlit only executes the
+    body on a miss, so reaching this line means the cache was cold.
+    """
+    state = _state()
+    if state.cache_stack:
+        state.cache_stack[-1]["miss"] = True
+
+
+def track_cache(name: str):
+    """
+    Decorator placed *above* @st.cache_data / @st.cache_resource.
+
+        @track_cache("config.load_metro_slice")
+        @st.cache_data
+        def load_metro_slice(city):
+            mark_cache_miss()
+            ...
+
+    Records the call time and whether it was a hit or a miss.
+    """
+
+    def decorator(cached_func):
+        @functools.wraps(cached_func)
+        def wrapper(*args, **kwargs):
+            state = _state()
+            probe = {"miss": False}
+            state.cache_stack.append(probe)
+            depth = state.depth
+            state.depth += 1
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = cached_func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                state.depth = max(state.depth - 1, 0)
+                state.cache_stack.pop()
+                _emit(
+                    {
+                        "event": "cache",
+                        "phase": name,
+                        "ms": round(elapsed_ms, 3),
+                        "depth": depth,
+                        "ok": ok,
+                        "cache": "miss" if probe["miss"] else "hit",
+                    }
+                )
+
+        # Keep Streamlit's cache controls reachable through the wrapper
+        if hasattr(cached_func, "clear"):
+            wrapper.clear = cached_func.clear
+        return wrapper
+
+    return decorator
+
+
+def get_records() -> pd.DataFrame:
+    """Return the current rerun's records as a DataFrame (in call order)."""
+    records = _state().records
+    if not records:
+        return pd.DataFrame(columns=["event", "phase", "ms", "depth", "ok", "cache"])
+    return pd.DataFrame(records)
+
+
+def finish_rerun():
+    """Emit one summary line for the rerun (total time, hits, misses)."""
+    state = _state()
+    total_ms = (time.perf_counter() - state.run_start) * 1000.0
+    records = state.records
+    hits = sum(1 for r in records if r.get("cache") == "hit")
+    misses = sum(1 for r in records if r.get("cache") == "miss")
+    summary = {
+        "event": "rerun",
+        "phase": "rerun.total",
+        "ms": round(total_ms, 3),
+        "n_phases": len(records),
+        "cache_hits": hits,
+        "cache_misses": misses,
+    }
+    if PERF_LOG_ENABLED:
+        logger.info(json.dumps({**summary, "run_id": state.run_id}, default=str))
+    return summary
+
+
+# ============================================================
+# 3. Debug sidebar panel (opt-in)
+# ============================================================
+
+def debug_enabled() -> bool:
+    """True when the timing panel was requested via env var or ?debug=1."""
+    if os.getenv(DEBUG_ENV_VAR, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        return str(st.query_params.get("debug", "")).lower() in ("1", "true", "timings")
+    except Exception:
+        return False
+
+
+def render_debug_panel():
+    """Render the current rerun's timings in an expander (call inside st.sidebar)."""
+    summary = finish_rerun()
+    if not debug_enabled():
+        return
+
+    with st.expander("⏱ Rerun Timings (debug)", expanded=False):
+        st.caption(
+            f"Total: **{summary['ms']:,.0f} ms** · "
+            f"cache hits: {summary['cache_hits']} · misses: {summary['cache_misses']}"
+        )
+        df = get_records()
+        if df.empty:
+            st.caption("No instrumented phases ran.")
+            return
+
+        df = df.copy()
+        if "cache" not in df.columns:
+            df["cache"] = None
+        df["phase"] = [
+            ("  " * int(d)) + str(p) for d, p in zip(df["depth"], df["phase"])
+        ]
+        st.dataframe(
+            df[["phase", "ms", "cache", "ok"]],
+            hide_index=True,
+            width="stretch",
+        )
+
+        slowest = (
+            df.assign(name=df["phase"].str.strip())
+            .groupby("name", as_index=False)["ms"].sum()
+            .sort_values("ms", ascending=False)
+            .head(5)
+        )
+        st.caption("Slowest phases (summed):")
+        for _, row in slowest.iterrows():
+            st.caption(f"- `{row['name']}`: {row['ms']:,.1f} ms")
@@ -0,0 +1,862 @@
+# metric_cube.py
+"""
+Per-year metric cube with incremental refresh.
+
+The app's expensive per-rerun work is a function of (year, metric):
+ZIP-level metric values, metro averages + rankings, and metro YoY. The
+cube keeps one partition of house rows per year and precomputes those
+tables for both metrics, so a rerun is a dictionary lookup.
+
+Refreshing does not throw the cube away. Each year partition carries a
+fingerprint; a refresh compares fingerprints and only touches the years
+that changed (plus the following year, whose YoY depends on them):
+
+  - local files : the file's (mtime, size) is checked first; only when it
+                  changed is the file re-read and fingerprinted per year
+  - SQL backends: one GROUP BY year signature query
+                  (query_backend.PARTITION_SIGNATURE_QUERY); only the
+                  changed years are re-fetched
+
+Unchanged years keep the very same DataFrame objects, so downstream
+content-keyed caches (CBSA polygon matching, ZIP polygon joins, charts)
+keep hitting. Each year has a generation counter and the cube a global
+`version` for callers that cache by key rather than by content.
+
+When the columnar store has the precomputed ZIP → CBSA table
+(zip_cbsa.arrow), ZIP and metro tables carry an integer `cbsa_code`, so
+metros map to CBSA polygons by key (the CBSA most of their ZIPs fall in).
+Metro aggregates themselves are still grouped by the dataset's metro.
+The table is only built offline with the store (python columnar_store.py);
+without it metros fall back to name matching.
+
+forecasts() fits a trend to every ZIP or metro series over all years in
+one batched least-squares pass (forecast.py) and keeps the 1/3/5-year
+projections; it is rebuilt after any change.
+
+Metrics come from the registry in metrics.py: level metrics (price, PTI)
+are aggregated from each year's rows with the metric's `prepare`; panel
+metrics (CAGR, volatility, drawdown, recovery) are computed for every ZIP,
+metro and year at once from the yearly series of their base metric and
+served by the same zip_metric / city_metric / metro_yoy calls.
+
+Monthly data (a `month` column in the house file) is kept as a second,
+compact partition per year; the annual partition is its precomputed
+yearly roll-up, so every annual view is unchanged. ZIP history is served
+at monthly, quarterly or yearly resolution from per-metro roll-ups
+(zip_series), picked by choose_resolution to fit the chart width.
+
+The cube lives in st.cache_resource (one per process) and checks for new
+data at most every DATA511_REFRESH_SECONDS (default 300) seconds.
+Returned frames are shared between sessions: copy before mutating.
+"""
+
+import inspect
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import config_data as cd
+import forecast
+import geo_utils
+import hotspots
+from columnar_store import has_store, open_table, store_path, table_to_house_df
+from spatial_index import PointIndex
+from affordability import AffordabilityIndex
+from percentiles import PercentileIndex
+from instrumentation import timed, track_cache, mark_cache_miss
+from metrics import PRICE_METRIC, PTI_METRIC, get_metric, is_panel_metric, level_metrics
+
+REFRESH_INTERVAL = float(os.getenv("DATA511_REFRESH_SECONDS", "300"))
+
+ZIP_KEYS = ["city", "city_full", "city_clean", "zip_code_str", "year"]
+CITY_KEYS = ["city", "city_full", "city_clean"]
+ROLLUP_KEYS = ["city", "city_full", "city_clean", "zip_code", "zip_code_str", "year"]
+VALUE_COLUMNS = ["median_sale_price", "per_capita_income", "lat", "lon"]
+
+# Derived tables that compare against the previous year
+PREV_YEAR_KINDS = ("yoy", "growth", "hotspots")
+# Derived tables over the whole panel (all years), stored under PANEL_YEAR
+# and dropped on any change
+PANEL_KINDS = ("forecast", "panel")
+PANEL_YEAR = 0
+
+# Series levels of forecasts and panel metrics
+FORECAST_LEVELS = ("zip", "metro")
+
+# Hotspot analysis: scope → grouping, variable → values
+HOTSPOT_SCOPES = ("metro", "national")
+HOTSPOT_VARIABLES = ("level", "growth")
+# Env switch for the background hotspot warm-up after each refresh (batch
+# tools that fork turn it off; read at refresh time)
+WARM_HOTSPOTS_ENV = "DATA511_WARM_HOTSPOTS"
+
+# Time resolutions, finest first: code → (label, periods per year)
+RESOLUTIONS = {
+    "M": ("Monthly", 12),
+    "Q": ("Quarterly", 4),
+    "Y": ("Yearly", 1),
+}
+# Minimum horizontal spacing between points of a history chart
+HISTORY_POINT_PX = 8
+# Approximate plot width of the ZIP trend chart (right-hand detail column)
+HISTORY_CHART_WIDTH_PX = 420
+
+
+def _whole_panel(kind: str, metric: str) -> bool:
+    """Derived tables that depend on every year (dropped on any change)."""
+    return kind in PANEL_KINDS or is_panel_metric(metric.split("|")[0])
+
+
+# ============================================================
+# 1. Partitions & fingerprints
+# ============================================================
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """Order-insensitive content hash of one partition."""
+    if df.empty:
+        return "0"
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return f"{len(df)}:{int(hashes.sum(dtype=np.uint64))}:{int(np.bitwise_xor.reduce(hashes))}"
+
+
+def split_by_year(df: pd.DataFrame) -> dict:
+    """
+    {year: rows}. A year-sorted frame (e.g. the columnar store) is split
+    into row ranges without copying.
+    """
+    if df.empty:
+        return {}
+    years = df["year"].to_numpy()
+    if (np.diff(years) >= 0).all():
+        bounds = np.flatnonzero(np.diff(years)) + 1
+        starts = np.r_[0, bounds]
+        stops = np.r_[bounds, len(years)]
+        return {int(years[a]): df.iloc[a:b] for a, b in zip(starts, stops)}
+    return {int(year): part for year, part in df.groupby("year", sort=True)}
+
+
+def rollup_annual(monthly: pd.DataFrame) -> pd.DataFrame:
+    """Monthly rows → one row per metro/ZIP/year (mean of the months)."""
+    keys = [c for c in ROLLUP_KEYS if c in monthly.columns]
+    values = [c for c in VALUE_COLUMNS if c in monthly.columns]
+    return monthly.groupby(keys, as_index=False, observed=True, sort=False)[values].mean()
+
+
+def compact_monthly(part: pd.DataFrame) -> pd.DataFrame:
+    """Only what the time series need, in small dtypes."""
+    cols = ["city", "zip_code_str", "year", "month", "median_sale_price", "per_capita_income"]
+    out = part[cols].copy()
+    for col in ("city", "zip_code_str"):
+        out[col] = out[col].astype("category")
+    out["year"] = out["year"].astype(np.int16)
+    out["month"] = out["month"].astype(np.int8)
+    for col in ("median_sale_price", "per_capita_income"):
+        out[col] = out[col].astype(np.float32)
+    return out
+
+
+def choose_resolution(n_years: int, width_px: int, available=("M", "Q", "Y"),
+                      px_per_point: int = HISTORY_POINT_PX) -> str:
+    """Finest available resolution whose points stay px_per_point apart."""
+    for res in available:
+        if n_years * RESOLUTIONS[res][1] * px_per_point <= width_px:
+            return res
+    return available[-1]
+
+
+class LocalFileSource:
+    """The local CSV / Parquet file, or the columnar store when present."""
+
+    lazy = False
+
+    def __init__(self, path: str, loader):
+        self.path = path
+        self.loader = loader
+        self._stat = None
+
+    def changed(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return self._stat is not None
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._stat:
+            return False
+        self._stat = key
+        return True
+
+    def partitions(self) -> dict:
+        return split_by_year(self.loader())
+
+
+class SQLSource:
+    """
+    A SQL backend: per-year signatures from the engine, years fetched on
+    demand with the year filter pushed down.
+    """
+
+    lazy = True
+
+    def __init__(self, backend, fetch_year, on_change=None):
+        self.backend = backend
+        self.fetch_year = fetch_year
+        self.on_change = on_change
+
+    def signatures(self) -> dict:
+        return self.backend.partition_signatures()
+
+    def load_year(self, year: int) -> pd.DataFrame:
+        return self.fetch_year(year)
+
+
+# ============================================================
+# 2. Cube
+# ============================================================
+
+class MetricCube:
+    """
+    Year partitions + derived (kind, year, metric) tables:
+
+      - "zip"  : df_zip_metric (ZIP_KEYS + metric_value, lat, lon, and
+                 cbsa_code when zip_cbsa is in the store)
+      - "city" : metro averages with rank / rank_total / percentile and
+                 the metro's majority cbsa_code (when available)
+      - "yoy"  : metro YoY (year - 1 .. year)
+      - "points": PointIndex over the ZIP coordinates (radius search)
+      - "afford": AffordabilityIndex, the year's ZIPs sorted by price with
+                  their local PTI (affordability finder)
+      - "pctl" : PercentileIndex, the year's ZIP values sorted nationally
+                 and per state (national / state percentiles)
+      - "growth": ZIP % change of the metric from the previous year
+      - "hotspots": local Moran's I / Gi* clusters per ZIP (warmed in the
+                    background after each refresh)
+      - "forecast": trend fit + 1/3/5-year projections for every ZIP or
+                    metro series (all years, see forecast.py)
+      - "panel"   : a panel metric (CAGR, volatility, ...) of every ZIP /
+                    metro for every year
+
+    Panel metrics are served by zip_metric / city_metric like level
+    metrics; since each year depends on the years before it, their tables
+    are dropped on any change.
+    """
+
+    def __init__(self, source, refresh_interval: float = REFRESH_INTERVAL):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._partitions = {}
+        self._fingerprints = {}
+        self._generations = {}
+        self._tables = {}
+        self._building = {}    # key → lock held while that table is built
+        self._monthly = {}
+        self._series = {}
+        self._checked_at = None
+        self._lock = threading.RLock()
+
+    # ---------- refresh ----------
+
+    def maybe_refresh(self) -> set:
+        """Refresh if the last check is older than refresh_interval."""
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.refresh_interval:
+            return set()
+        return self.refresh()
+
+    @timed("cube.refresh")
+    def refresh(self, force: bool = False) -> set:
+        """
+        Detect changed / new / removed years, reload only those and rebuild
+        their derived tables. Returns the set of changed years.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self.source.lazy:
+                new_fps = self.source.signatures()
+                changed = self._diff(new_fps, force)
+                if changed and self._fingerprints and self.source.on_change is not None:
+                    self.source.on_change(changed)
+                reload = {y for y in changed if y in self._partitions and y in new_fps}
+                fresh = {y: self.source.load_year(y) for y in sorted(reload)}
+            else:
+                if not self.source.changed() and not force and self._fingerprints:
+                    return set()
+                parts = self.source.partitions()
+                new_fps = {year: fingerprint(part) for year, part in parts.items()}
+                changed = self._diff(new_fps, force)
+                fresh = {y: parts[y] for y in changed if y in parts}
+
+            if not changed:
+                return set()
+
+            for year in changed:
+                part = fresh.get(year)
+                if part is not None and "month" in part.columns:
+                    self._monthly[year] = compact_monthly(part)
+                    part = rollup_annual(part)
+                else:
+                    self._monthly.pop(year, None)
+                if part is not None:
+                    self._partitions[year] = part
+                else:
+                    self._partitions.pop(year, None)
+                self._generations[year] = self._generations.get(year, 0) + 1
+            self._fingerprints = new_fps
+            self._series = {}
+            self.version += 1
+
+            # Changed years lose everything; year + 1 only the tables that
+            # compare against the changed year (YoY, growth, hotspots);
+            # whole-panel tables (forecasts) any change
+            self._tables = {
+                (kind, year, metric): table
+                for (kind, year, metric), table in self._tables.items()
+                if year not in changed
+                and not (kind in PREV_YEAR_KINDS and year - 1 in changed)
+                and not _whole_panel(kind, metric)
+            }
+
+        # Outside the lock: a build in flight on another thread may hold a
+        # table's build lock while it waits for self._lock
+        for year in sorted(changed | {y + 1 for y in changed}):
+            if year in self._partitions:
+                for metric in level_metrics():
+                    self.city_metric(year, metric)
+                    self.metro_yoy(year, metric)
+        self._warm_hotspots(changed)
+        return changed
+
+    def _warm_hotspots(self, changed: set):
+        """
+        Build the hotspot tables of the changed years (and year + 1, whose
+        growth depends on them) on a background thread, newest year first,
+        so the hotspot layer is a lookup instead of seconds of permutations
+        on first view. A newer refresh stops the warm-up and starts its own.
+        """
+        if os.getenv(WARM_HOTSPOTS_ENV, "1") == "0":
+            return
+        years = sorted((y for y in changed | {y + 1 for y in changed} if y in self._partitions), reverse=True)
+        jobs = [
+            (year, metric, scope, variable)
+            for year in years
+            for metric in level_metrics()
+            for scope in HOTSPOT_SCOPES
+            for variable in HOTSPOT_VARIABLES
+        ]
+        version = self.version
+
+        def run():
+            for year, metric, scope, variable in jobs:
+                if self.version != version:
+                    return
+                try:
+                    self.hotspots(year, metric, scope, variable)
+                except Exception:
+                    # Left to be built (and its error shown) on first view
+                    continue
+
+        if jobs:
+            threading.Thread(target=run, name="cube-hotspot-warmup", daemon=True).start()
+
+    def _diff(self, new_fps: dict, force: bool) -> set:
+        if force:
+            return set(new_fps) | set(self._fingerprints)
+        changed = {y for y, fp in new_fps.items() if self._fingerprints.get(y) != fp}
+        return changed | (set(self._fingerprints) - set(new_fps))
+
+    # ---------- partitions ----------
+
+    def years(self) -> list:
+        return sorted(self._fingerprints)
+
+    def year_bounds(self):
+        years = self.years()
+        return (years[0], years[-1]) if years else None
+
+    def generation(self, year: int) -> int:
+        return self._generations.get(int(year), 0)
+
+    def year_frame(self, year: int) -> pd.DataFrame:
+        """All house rows of one year (empty frame for unknown years)."""
+        year = int(year)
+        part = self._partitions.get(year)
+        if part is None and self.source.lazy and year in self._fingerprints:
+            with self._lock:
+                part = self._partitions.get(year)
+                if part is None:
+                    part = self.source.load_year(year)
+                    self._partitions[year] = part
+        if part is None:
+            return self._empty_frame()
+        return part
+
+    def metro_frame(self, city: str) -> pd.DataFrame:
+        """All years of one metro."""
+        if self.source.lazy:
+            return cd.load_metro_slice(city, data_version=self.version)
+        parts = [p[p["city"] == city] for _, p in sorted(self._partitions.items())]
+        parts = [p for p in parts if not p.empty]
+        return pd.concat(parts, ignore_index=True) if parts else self._empty_frame()
+
+    # ---------- time series ----------
+
+    @property
+    def has_monthly(self) -> bool:
+        return bool(self._monthly)
+
+    def resolutions(self) -> list:
+        return list(RESOLUTIONS) if self.has_monthly else ["Y"]
+
+    def _metro_series(self, city: str, resolution: str) -> pd.DataFrame:
+        """
+        Per-ZIP price / income of one metro at `resolution` (memoized):
+        zip_code_str, year, period (Timestamp), median_sale_price,
+        per_capita_income.
+        """
+        key = (city, resolution)
+        series = self._series.get(key)
+        if series is not None:
+            return series
+
+        if self.has_monthly:
+            parts = [m[m["city"] == city] for _, m in sorted(self._monthly.items())]
+            df = pd.concat([p for p in parts if not p.empty] or [parts[0]], ignore_index=True)
+            month = df["month"].astype(np.int64)
+        else:
+            df = self.metro_frame(city)
+            month = pd.Series(1, index=df.index)
+        year = df["year"].astype(np.int64)
+        step = 12 // RESOLUTIONS[resolution][1]
+        first_month = (month - 1) // step * step + 1
+
+        frame = pd.DataFrame({
+            "zip_code_str": df["zip_code_str"].astype(str).to_numpy(),
+            "year": year.to_numpy(),
+            "bucket": (year * 12 + first_month - 1).to_numpy(),
+            "median_sale_price": df["median_sale_price"].astype(np.float64).to_numpy(),
+            "per_capita_income": df["per_capita_income"].astype(np.float64).to_numpy(),
+        })
+        series = frame.groupby(["zip_code_str", "bucket"], as_index=False).agg(
+            year=("year", "first"),
+            median_sale_price=("median_sale_price", "mean"),
+            per_capita_income=("per_capita_income", "mean"),
+        )
+        series["period"] = pd.to_datetime(
+            {"year": series["bucket"] // 12, "month": series["bucket"] % 12 + 1, "day": 1}
+        )
+        series = series.drop(columns="bucket").sort_values(["zip_code_str", "period"])
+        self._series[key] = series
+        return series
+
+    def zip_series(self, city: str, zip_code_str: str, metric: str, resolution: str = "Y") -> pd.DataFrame:
+        """
+        History of one ZIP for the trend chart: `period` (+ `year`) and
+        `metric_value`. Yearly values are the mean of the months; panel
+        metrics are yearly only.
+        """
+        rows = self.zip_series_many([(city, zip_code_str)], metric, resolution)
+        return rows[["year", "period", "metric_value"]]
+
+    def zip_series_many(self, keys, metric: str, resolution: str = "Y") -> pd.DataFrame:
+        """
+        History of several ZIPs at once: `keys` are (city, zip_code_str)
+        pairs; returns city, zip_code_str, year, period, metric_value.
+        Panel metrics take one merge against the long table, level metrics
+        one filter per metro series — not one scan per ZIP.
+        """
+        columns = ["city", "zip_code_str", "year", "period", "metric_value"]
+        keys = pd.DataFrame(
+            [(str(c), str(z)) for c, z in keys], columns=["city", "zip_code_str"]
+        ).drop_duplicates()
+        spec = get_metric(metric)
+        if spec.is_panel:
+            table = self.long_horizon(metric, "zip")
+            rows = table[["city", "zip_code_str", "year", "metric_value"]].merge(
+                keys, on=["city", "zip_code_str"], how="inner"
+            )
+            rows = rows.assign(period=pd.to_datetime(dict(year=rows["year"], month=1, day=1)))
+            return rows[columns].reset_index(drop=True)
+        if resolution not in self.resolutions():
+            resolution = "Y"
+        parts = []
+        for city, zips in keys.groupby("city", sort=False)["zip_code_str"]:
+            series = self._metro_series(city, resolution)
+            rows = spec.prepare(series[series["zip_code_str"].isin(zips)])
+            parts.append(rows.assign(city=city).rename(columns={"value": "metric_value"}))
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(parts, ignore_index=True)[columns]
+
+    def _empty_frame(self) -> pd.DataFrame:
+        for part in self._partitions.values():
+            return part.iloc[0:0]
+        return pd.DataFrame(columns=ZIP_KEYS)
+
+    # ---------- derived tables ----------
+
+    def _derived(self, kind: str, year: int, metric: str, build):
+        key = (kind, int(year), metric)
+        table = self._tables.get(key)
+        if table is not None:
+            return table
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        # Built once per key (a view and the warm-up thread asking for the
+        # same table wait for one build); other keys build concurrently
+        with build_lock:
+            table = self._tables.get(key)
+            if table is not None:
+                return table
+            version = self.version
+            try:
+                table = build()
+                with self._lock:
+                    # A refresh during the build may have swapped the partitions
+                    # it read: only keep tables built from the current data
+                    if self.version == version:
+                        self._tables[key] = table
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+        return table
+
+    def zip_metric(self, year: int, metric: str) -> pd.DataFrame:
+        if is_panel_metric(metric):
+            return self._derived("zip", year, metric, lambda: self._build_zip_panel(year, metric))
+        return self._derived("zip", year, metric, lambda: self._build_zip(year, metric))
+
+    def city_metric(self, year: int, metric: str) -> pd.DataFrame:
+        if is_panel_metric(metric):
+            return self._derived("city", year, metric, lambda: self._build_city_panel(year, metric))
+        return self._derived("city", year, metric, lambda: self._build_city(year, metric))
+
+    def metro_yoy(self, year: int, metric: str) -> pd.DataFrame:
+        return self._derived("yoy", year, metric, lambda: self._build_yoy(year, metric))
+
+    def long_horizon(self, metric: str, level: str = "zip") -> pd.DataFrame:
+        """
+        A panel metric for every ZIP (`city`, `zip_code_str`) or metro
+        (`city`) and every year: keys + year + metric_value (rows with a
+        value only). Metro values come from the metro series of the base
+        metric, not from averaging ZIP values.
+        """
+        if not is_panel_metric(metric) or level not in FORECAST_LEVELS:
+            raise ValueError(f"Unknown panel metric/level: {metric!r}, {level!r}")
+        return self._derived(
+            "panel", PANEL_YEAR, f"{metric}|{level}", lambda: self._build_long_horizon(metric, level)
+        )
+
+    def zip_compare(self, year: int, metric: str, zip_codes) -> pd.DataFrame:
+        """
+        Metric value and YoY for `zip_codes` (5-digit strings) in any metro:
+        [zip_code_str, city_full, metric_value, prev_value, yoy_change, yoy_pct].
+        """
+        def values(y):
+            df_zip = self.zip_metric(y, metric)
+            df_zip = df_zip[df_zip["zip_code_str"].isin(list(zip_codes))]
+            df_zip = df_zip.groupby("zip_code_str", as_index=False, observed=True).agg(
+                city_full=("city_full", "first"),
+                metric_value=("metric_value", "mean"),
+            )
+            return df_zip.astype({"zip_code_str": str, "city_full": str})
+
+        current = values(year)
+        if year - 1 in self._fingerprints:
+            prev = values(year - 1)[["zip_code_str", "metric_value"]]
+            current = current.merge(
+                prev.rename(columns={"metric_value": "prev_value"}), on="zip_code_str", how="left"
+            )
+        else:
+            current["prev_value"] = np.nan
+        current["yoy_change"] = current["metric_value"] - current["prev_value"]
+        current["yoy_pct"] = (current["metric_value"] / current["prev_value"] - 1) * 100
+        return current
+
+    def zip_growth(self, year: int, metric: str) -> pd.DataFrame:
+        """zip_metric with metric_value replaced by its % change from year - 1."""
+        return self._derived("growth", year, metric, lambda: self._build_growth(year, metric))
+
+    def hotspots(self, year: int, metric: str, scope: str = "metro", variable: str = "level") -> pd.DataFrame:
+        """
+        Local Moran's I / Gi* cluster per ZIP (hotspots.hotspot_table) on the
+        metric level or its YoY growth, within each metro or nationally.
+        Built once per (year, metric, scope, variable) and shared.
+        """
+        if scope not in HOTSPOT_SCOPES or variable not in HOTSPOT_VARIABLES:
+            raise ValueError(f"Unknown hotspot scope/variable: {scope!r}, {variable!r}")
+        key = f"{metric}|{scope}|{variable}"
+        return self._derived(
+            "hotspots", year, key, lambda: self._build_hotspots(year, metric, scope, variable)
+        )
+
+    def zip_points(self, year: int, metric: str) -> PointIndex:
+        """KD-tree over the ZIP coordinates of zip_metric(year, metric)."""
+        return self._derived("points", year, metric, lambda: self._build_points(year, metric))
+
+    def zips_within(self, year: int, metric: str, lon: float, lat: float, miles: float) -> pd.DataFrame:
+        """
+        Every ZIP with data within `miles` of (lon, lat), across metro
+        boundaries: zip_metric rows + distance_miles, ranked by metric value
+        within the radius. Closest first.
+        """
+        points = self.zip_points(year, metric)
+        idx, dist = points.query_radius(lon, lat, miles)
+        df_zip = self.zip_metric(year, metric)
+        found = df_zip.iloc[points.rows[idx]].reset_index(drop=True)
+        found["distance_miles"] = dist
+        if found.empty:
+            return found
+        return cd.compute_rankings(found, "metric_value", "zip_code_str")
+
+    def affordability(self, year: int) -> AffordabilityIndex:
+        """The year's ZIPs sorted by median sale price, for budget queries."""
+        return self._derived("afford", year, PTI_METRIC, lambda: self._build_affordability(year))
+
+    def percentiles(self, year: int, metric: str) -> PercentileIndex:
+        """The year's ZIP values sorted nationally and per state, for percentile lookups."""
+        return self._derived("pctl", year, metric, lambda: PercentileIndex(self.zip_metric(year, metric)))
+
+    def forecasts(self, metric: str, level: str = "zip") -> pd.DataFrame:
+        """
+        Trend fit and next 1/3/5-year projections (with prediction
+        intervals) for every ZIP (`city`, `zip_code_str`) or metro (`city`)
+        series of the metric, fitted in one batch over all years
+        (forecast.forecast_table columns).
+        """
+        if level not in FORECAST_LEVELS or get_metric(metric).trend_model is None:
+            raise ValueError(f"No forecast for metric/level: {metric!r}, {level!r}")
+        return self._derived(
+            "forecast", PANEL_YEAR, f"{metric}|{level}", lambda: self._build_forecast(metric, level)
+        )
+
+    def zip_forecast(self, city: str, zip_code_str: str, metric: str):
+        """Forecast row of one ZIP (None without a usable trend)."""
+        if get_metric(metric).trend_model is None:
+            return None
+        table = self.forecasts(metric, "zip")
+        rows = table[(table["city"] == str(city)) & (table["zip_code_str"] == str(zip_code_str))]
+        if rows.empty or not np.isfinite(rows["slope"].iloc[0]):
+            return None
+        return rows.iloc[0]
+
+    @staticmethod
+    def _cbsa_codes(zip_codes):
+        """
+        Spatial CBSA code per ZIP from the store's zip_cbsa table, or None
+        when the store was not built (metros then match CBSAs by name).
+        """
+        if not geo_utils.zip_cbsa_store_available():
+            return None
+        try:
+            return geo_utils.zip_to_cbsa(zip_codes)
+        except (RuntimeError, OSError):
+            return None
+
+    def _build_zip(self, year: int, metric: str) -> pd.DataFrame:
+        spec = get_metric(metric)
+        df_year = spec.prepare(self.year_frame(year))
+        df_zip = df_year.groupby(ZIP_KEYS, as_index=False, observed=True).agg(
+            metric_value=("value", spec.agg),
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+        )
+        codes = self._cbsa_codes(df_zip["zip_code_str"])
+        if codes is not None:
+            df_zip["cbsa_code"] = codes
+        return df_zip
+
+    def _build_city(self, year: int, metric: str) -> pd.DataFrame:
+        df_zip_metric = self.zip_metric(year, metric)
+        df_city = df_zip_metric.groupby(CITY_KEYS, as_index=False, observed=True).agg(
+            n=("zip_code_str", "count"),
+            avg_metric_value=("metric_value", "mean"),
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+        )
+        if df_city.empty:
+            return df_city
+        if "cbsa_code" in df_zip_metric.columns:
+            assigned = geo_utils.assign_cities_to_cbsa(df_zip_metric)
+            lookup = dict(zip(assigned["city"], assigned["cbsa_code"]))
+            df_city["cbsa_code"] = (
+                df_city["city"].astype(str).map(lookup).fillna(geo_utils.NO_CBSA).astype("int32")
+            )
+        return cd.compute_rankings(df_city.reset_index(drop=True), "avg_metric_value", "city")
+
+    def _build_growth(self, year: int, metric: str) -> pd.DataFrame:
+        current = self.zip_metric(year, metric)
+        if year - 1 not in self._fingerprints:
+            return current.iloc[0:0]
+        prev = self.zip_metric(year - 1, metric)
+        keys = ["city", "zip_code_str"]
+        prev = prev[keys + ["metric_value"]].astype({k: str for k in keys})
+        growth = current.astype({k: str for k in keys}).merge(
+            prev.rename(columns={"metric_value": "prev_value"}), on=keys, how="inner"
+        )
+        growth["metric_value"] = (growth["metric_value"] / growth["prev_value"] - 1) * 100
+        return growth[np.isfinite(growth["metric_value"])].reset_index(drop=True)
+
+    def _build_hotspots(self, year: int, metric: str, scope: str, variable: str) -> pd.DataFrame:
+        df_zip = self.zip_growth(year, metric) if variable == "growth" else self.zip_metric(year, metric)
+        df_zip = df_zip[df_zip["metric_value"].notna()].reset_index(drop=True)
+        columns = ["city", "zip_code_str", "metric_value"]
+        if df_zip.empty:
+            return pd.DataFrame(columns=columns + ["cluster"])
+
+        with timed("cube.hotspots.weights"):
+            try:
+                W = geo_utils.load_zcta_adjacency().weights_for(df_zip["zip_code_str"].astype(str))
+            except (RuntimeError, OSError):
+                W = hotspots.knn_weights(df_zip["lon"], df_zip["lat"])
+        groups = df_zip["city"].astype(str) if scope == "metro" else None
+        with timed("cube.hotspots.stats"):
+            stats = hotspots.hotspot_table(df_zip["metric_value"].to_numpy(), W, groups=groups)
+        out = pd.concat([df_zip[columns].astype({"city": str, "zip_code_str": str}), stats], axis=1)
+        return out
+
+    def _panel_matrix(self, metric: str, level: str):
+        """Aligned series × year matrix of a point-in-time metric: (keys, years, values)."""
+        if level == "zip":
+            keys, value_col, table = ["city", "zip_code_str"], "metric_value", self.zip_metric
+        else:
+            keys, value_col, table = ["city"], "avg_metric_value", self.city_metric
+        frames = []
+        for year in self.years():
+            df = table(year, metric)
+            if not df.empty:
+                frames.append(df[keys + [value_col]].assign(year=year))
+        if not frames:
+            return pd.DataFrame(columns=keys), np.array([], dtype=np.int64), np.empty((0, 0))
+        return forecast.series_matrix(pd.concat(frames, ignore_index=True), keys, "year", value_col)
+
+    @timed("cube.forecast")
+    def _build_forecast(self, metric: str, level: str) -> pd.DataFrame:
+        key_frame, years, values = self._panel_matrix(metric, level)
+        if key_frame.empty:
+            return pd.DataFrame(columns=list(key_frame.columns) + forecast.FIT_COLUMNS)
+        fits = forecast.fit_trends(years, values, get_metric(metric).trend_model)
+        return forecast.forecast_table(key_frame, fits)
+
+    @timed("cube.long_horizon")
+    def _build_long_horizon(self, metric: str, level: str) -> pd.DataFrame:
+        spec = get_metric(metric)
+        key_frame, years, values = self._panel_matrix(spec.base, level)
+        result = spec.panel(values, years) if values.size else values
+
+        # Wide → long, keeping cells with a value
+        row, col = np.nonzero(np.isfinite(result))
+        long = key_frame.iloc[row].reset_index(drop=True)
+        long["year"] = years[col].astype(np.int64)
+        long["metric_value"] = result[row, col]
+        return long
+
+    def _build_zip_panel(self, year: int, metric: str) -> pd.DataFrame:
+        base = self.zip_metric(year, get_metric(metric).base)
+        table = self.long_horizon(metric, "zip")
+        table = table[table["year"] == int(year)]
+        keys = ["city", "zip_code_str"]
+        df_zip = base.drop(columns="metric_value").astype({k: str for k in keys}).merge(
+            table[keys + ["metric_value"]], on=keys, how="inner"
+        )
+        return df_zip
+
+    def _build_city_panel(self, year: int, metric: str) -> pd.DataFrame:
+        base = self.city_metric(year, get_metric(metric).base)
+        if base.empty:
+            return base
+        table = self.long_horizon(metric, "metro")
+        table = table[table["year"] == int(year)]
+        lookup = dict(zip(table["city"], table["metric_value"]))
+        df_city = base.drop(columns=["rank", "rank_total", "percentile"], errors="ignore").copy()
+        df_city["avg_metric_value"] = df_city["city"].astype(str).map(lookup)
+        df_city = df_city[df_city["avg_metric_value"].notna()].reset_index(drop=True)
+        if df_city.empty:
+            return df_city
+        return cd.compute_rankings(df_city, "avg_metric_value", "city")
+
+    def _build_points(self, year: int, metric: str) -> PointIndex:
+        df_zip = self.zip_metric(year, metric)
+        return PointIndex(
+            df_zip["zip_code_str"].astype(str).to_numpy(),
+            df_zip["lon"].to_numpy(),
+            df_zip["lat"].to_numpy(),
+            "zip_code_str",
+        )
+
+    def _build_affordability(self, year: int) -> AffordabilityIndex:
+        keys = ["city", "zip_code_str"]
+        price = self.zip_metric(year, PRICE_METRIC)
+        pti = self.zip_metric(year, PTI_METRIC)
+        frame = pd.DataFrame({
+            "zip_code_str": price["zip_code_str"].astype(str).to_numpy(),
+            "city": price["city"].astype(str).to_numpy(),
+            "city_full": price["city_full"].astype(str).to_numpy(),
+            "price": price["metric_value"].to_numpy(dtype=np.float64),
+            "lat": price["lat"].to_numpy(dtype=np.float64),
+            "lon": price["lon"].to_numpy(dtype=np.float64),
+        })
+        local_pti = pd.DataFrame({
+            "zip_code_str": pti["zip_code_str"].astype(str).to_numpy(),
+            "city": pti["city"].astype(str).to_numpy(),
+            "local_pti": pti["metric_value"].to_numpy(dtype=np.float64),
+        }).drop_duplicates(keys)
+        return AffordabilityIndex(frame.merge(local_pti, on=keys, how="left"))
+
+    def _build_yoy(self, year: int, metric: str) -> pd.DataFrame:
+        spec = get_metric(metric)
+        if spec.is_panel:
+            # Year-over-year change of the metro values themselves
+            frames = [
+                self.city_metric(y, metric)[["city", "city_full", "avg_metric_value"]].assign(year=y)
+                for y in (year - 1, year)
+            ]
+            value_col = "avg_metric_value"
+        else:
+            frames = [spec.prepare(self.year_frame(y)) for y in (year - 1, year)]
+            value_col = "value"
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return cd.compute_yoy(pd.concat(frames, ignore_index=True), year, ["city", "city_full"], value_col)
+
+
+# ============================================================
+# 3. Process-wide cube
+# ============================================================
+
+def _local_source() -> LocalFileSource:
+    if cd.USE_COLUMNAR_STORE and has_store("house", cd.LOCAL_STORE_DIR):
+        def load_store():
+            return table_to_house_df(open_table("house", cd.LOCAL_STORE_DIR))
+
+        return LocalFileSource(store_path("house", cd.LOCAL_STORE_DIR), load_store)
+    # Untimed: reloads run on the refresh thread, whose perf records are never drained
+    return LocalFileSource(cd.LOCAL_HOUSE_FILE, inspect.unwrap(cd._load_all_data_local))
+
+
+def _sql_source() -> SQLSource:
+    def on_change(years):
+        # Cached warehouse results for the house table are stale now
+        if cd.DATA_BACKEND == "databricks":
+            cd.get_sql_executor().invalidate([cd.HOUSE_TABLE])
+
+    return SQLSource(
+        cd.get_query_backend(),
+        lambda year: cd._fetch_house_sql(year=int(year)),
+        on_change=on_change,
+    )
+
+
+@track_cache("cube.get_metric_cube")
+@st.cache_resource(show_spinner="📊 Building metric cube...")
+def get_metric_cube() -> MetricCube:
+    """The shared cube, fully built for the current data."""
+    mark_cache_miss()
+    source = _local_source() if cd.DATA_BACKEND == "pandas" else _sql_source()
+    cube = MetricCube(source)
+    cube.refresh()
+    return cube
@@ -0,0 +1,265 @@
+# metrics.py
+"""
+Metric registry.
+
+Every map metric is one Metric registration: how its values come out of
+house rows, how they aggregate, how they are displayed and how they change
+over time. The metric cube, the charts and the app only go through the
+registry, so a new metric is one register() call and gets the cube tables,
+caches, rankings, YoY, hotspots and radius search without further code.
+
+Two kinds of metric:
+
+  - "level": per-row values from one year of house rows (`prepare` returns
+             the kept rows with a `value` column), averaged per ZIP / metro
+  - "panel": computed from the yearly series of a level metric (`base`)
+             for every series and year at once (`panel(values, years)`,
+             see panel_metrics.py); metro values use the metro series
+
+A metric with `windows` is a family: get_metric("Price CAGR (5y)") returns
+the 5-year member of "Price CAGR".
+
+    spec = get_metric(metric_type)
+    spec.format(412000)                  # "$412,000"
+    spec.hover("%{customdata[2]}")       # "Price: $%{customdata[2]:,.0f}"
+"""
+
+from functools import partial
+
+import pandas as pd
+
+import config_data as cd
+import panel_metrics
+
+# Display units: unit → (prefix, value format, suffix, axis tick format,
+# st.column_config format, change suffix)
+UNITS = {
+    "price": ("$", ",.0f", "", ",", "dollar", "%"),
+    "ratio": ("", ".2f", "x", ",.2f", "%.2fx", "%"),
+    "change": ("", "+.1f", "%", ",.1f", "%+.1f%%", " pts"),
+    "pct": ("", ".1f", "%", ",.1f", "%.1f%%", " pts"),
+    "years": ("", ".1f", " yrs", ",.0f", "%d yrs", " yrs"),
+}
+
+
+# ============================================================
+# 1. Metric
+# ============================================================
+
+class Metric:
+    """One registered metric (see module docstring)."""
+
+    def __init__(self, name, label, unit, *, kind="level", prepare=None, base=None,
+                 panel=None, windows=None, window=None, agg="mean", change="pct",
+                 trend_model=None, palette="gold", card_title=None, help=""):
+        if unit not in UNITS:
+            raise ValueError(f"Unknown unit: {unit!r}")
+        self.name = name
+        self.label = label
+        self.unit = unit
+        self.kind = kind
+        self.prepare = prepare
+        self.base = base
+        self.panel = panel
+        self.windows = tuple(windows) if windows else None
+        self.window = window
+        self.agg = agg
+        self.change = change            # "pct": YoY in %, "diff": in points / years
+        self.trend_model = trend_model  # forecast.fit_trends model, None = no projection
+        self.palette = palette
+        self.card_title = card_title or name
+        self.help = help
+
+    def __repr__(self):
+        return f"Metric({self.name!r})"
+
+    @property
+    def is_panel(self) -> bool:
+        return self.kind == "panel"
+
+    @property
+    def positive(self) -> bool:
+        """Levels are > 0; rates and drawdowns may be zero or negative."""
+        return self.kind == "level"
+
+    def with_window(self, window: int) -> "Metric":
+        """Member of a windowed family, e.g. CAGR over 5 years."""
+        if not self.windows:
+            raise ValueError(f"{self.name} has no windows")
+        return Metric(
+            f"{self.name} ({int(window)}y)", f"{self.label} ({int(window)}y)", self.unit,
+            kind=self.kind, prepare=self.prepare, base=self.base,
+            panel=partial(self.panel, window=int(window)), window=int(window),
+            agg=self.agg, change=self.change, trend_model=self.trend_model,
+            palette=self.palette, card_title=f"{self.card_title} ({int(window)}y)", help=self.help,
+        )
+
+    # ---------- display ----------
+
+    def format(self, value) -> str:
+        """A value as text, e.g. $412,000 / 5.31x / +4.2% / 3.0 yrs."""
+        prefix, fmt, suffix = UNITS[self.unit][:3]
+        if value is None or pd.isna(value):
+            return "N/A"
+        text = format(float(value), fmt)
+        if prefix and text.startswith("-"):
+            return f"-{prefix}{text[1:]}{suffix}"
+        return f"{prefix}{text}{suffix}"
+
+    def template(self, field: str = "%{y}") -> str:
+        """Plotly hovertemplate value for a field, e.g. "%{y:.2f}x"."""
+        prefix, fmt, suffix = UNITS[self.unit][:3]
+        return f"{prefix}{field[:-1]}:{fmt}}}{suffix}"
+
+    def hover(self, field: str = "%{y}") -> str:
+        """Labelled hovertemplate value, e.g. "PTI: %{y:.2f}x"."""
+        return f"{self.label}: {self.template(field)}"
+
+    def ticks(self) -> dict:
+        """tickprefix / tickformat / ticksuffix for an axis or colorbar."""
+        prefix, _, suffix, tick = UNITS[self.unit][:4]
+        return dict(tickprefix=prefix, tickformat=tick, ticksuffix=suffix)
+
+    @property
+    def column_format(self) -> str:
+        """st.column_config.NumberColumn format."""
+        return UNITS[self.unit][4]
+
+    def yoy(self, pct, diff):
+        """The YoY number this metric reports: % change or difference."""
+        return pct if self.change == "pct" else diff
+
+    def format_change(self, value) -> str:
+        """A YoY / relative change as text: "+3.1%" or "+0.8 pts"."""
+        if value is None or pd.isna(value):
+            return "N/A"
+        suffix = "%" if self.change == "pct" else UNITS[self.unit][5]
+        return f"{float(value):+.1f}{suffix}"
+
+
+# ============================================================
+# 2. Registry
+# ============================================================
+
+_REGISTRY = {}
+
+
+def register(metric: Metric) -> Metric:
+    """Add a metric (or windowed family); the registration order is the UI order."""
+    if metric.is_panel and metric.base not in _REGISTRY:
+        raise ValueError(f"{metric.name}: base metric {metric.base!r} is not registered")
+    _REGISTRY[metric.name] = metric
+    return metric
+
+
+def metric_names() -> list:
+    """Registered metric / family names, in UI order."""
+    return list(_REGISTRY)
+
+
+def concrete_metrics(names=None) -> list:
+    """Metric names with windowed families expanded to every window member."""
+    out = []
+    for name in names or metric_names():
+        spec = get_metric(name)
+        if spec.windows and spec.window is None:
+            out.extend(_window_member(spec.name, w).name for w in spec.windows)
+        else:
+            out.append(spec.name)
+    return out
+
+
+def level_metrics() -> list:
+    """Names of the metrics computed from one year of rows."""
+    return [name for name, m in _REGISTRY.items() if not m.is_panel]
+
+
+def get_metric(name: str) -> Metric:
+    """Registered metric by name; "<family> (<n>y)" resolves to a family member."""
+    metric = _REGISTRY.get(name)
+    if metric is not None:
+        return metric
+    family, _, rest = name.rpartition(" (")
+    if family in _REGISTRY and rest.endswith("y)") and rest[:-2].isdigit():
+        return _window_member(family, int(rest[:-2]))
+    raise KeyError(f"Unknown metric: {name!r}")
+
+
+_MEMBERS = {}
+
+
+def _window_member(family: str, window: int) -> Metric:
+    key = (family, window)
+    if key not in _MEMBERS:
+        _MEMBERS[key] = _REGISTRY[family].with_window(window)
+    return _MEMBERS[key]
+
+
+def is_panel_metric(name: str) -> bool:
+    try:
+        return get_metric(name).is_panel
+    except KeyError:
+        return False
+
+
+# ============================================================
+# 3. Built-in metrics
+# ============================================================
+
+# PTI filters: rows below the income floor or outside the ratio range are
+# treated as data errors, not as (un)affordable ZIPs
+PTI_MIN_INCOME = 5000
+PTI_RANGE = (0.5, 50)
+
+
+def _price_rows(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[df["median_sale_price"].notna()]
+    return df.assign(value=df["median_sale_price"].astype(float))
+
+
+def _pti_rows(df: pd.DataFrame) -> pd.DataFrame:
+    df = cd.compute_pti(df, min_income=PTI_MIN_INCOME, pti_range=PTI_RANGE)
+    return df.assign(value=df["PTI"])
+
+
+def _max_drawdown(values, years):
+    return panel_metrics.max_drawdown(values)
+
+
+PRICE_METRIC = register(Metric(
+    "Median Sale Price", "Price", "price",
+    prepare=_price_rows, trend_model="loglinear", palette="gold",
+    help="Price: median home sale price",
+)).name
+
+PTI_METRIC = register(Metric(
+    "Price-to-Income Ratio (PTI)", "PTI", "ratio",
+    prepare=_pti_rows, trend_model="linear", palette="orange", card_title="PTI Ratio",
+    help="PTI: affordability (lower = more affordable)",
+)).name
+
+CAGR_METRIC = register(Metric(
+    "Price CAGR", "CAGR", "change",
+    kind="panel", base=PRICE_METRIC, panel=panel_metrics.cagr,
+    windows=panel_metrics.DEFAULT_CAGR_WINDOWS, change="diff",
+    help="CAGR: compound annual price growth over the chosen window",
+)).name
+
+VOLATILITY_METRIC = register(Metric(
+    "Price Volatility", "Volatility", "pct",
+    kind="panel", base=PRICE_METRIC, panel=panel_metrics.volatility, change="diff",
+    help="Volatility: annualized std of yearly price returns since the first year",
+)).name
+
+DRAWDOWN_METRIC = register(Metric(
+    "Max Drawdown", "Max Drawdown", "change",
+    kind="panel", base=PRICE_METRIC, panel=_max_drawdown, change="diff",
+    help="Max Drawdown: worst peak-to-trough price decline up to the selected year",
+)).name
+
+RECOVERY_METRIC = register(Metric(
+    "Years to Recover", "Years to Recover", "years",
+    kind="panel", base=PRICE_METRIC, panel=panel_metrics.years_to_recover, change="diff",
+    help="Years to Recover: years from that trough back to the prior peak "
+         "(blank while still below it)",
+)).name
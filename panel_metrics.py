@@ -0,0 +1,143 @@
+# panel_metrics.py
+"""
+Long-horizon metrics over a series × year value matrix, for every series
+and every year at once.
+
+Each function takes the aligned matrix from forecast.series_matrix (one row
+per ZIP or metro, one column per year, NaN where missing) and returns a
+matrix of the same shape whose column j is the metric "as of" year j, i.e.
+computed only from years up to and including it:
+
+  - cagr              : compound annual growth over the trailing `window` years
+  - volatility        : annualized std of annual log returns since the start
+  - max_drawdown      : worst peak-to-trough decline since the start
+  - years_to_recover  : years from the trough of that decline back to the
+                        prior peak (NaN while still below it)
+
+Percentages are in percent (5.0 = 5 %). Years may have gaps; returns are
+scaled by the gap so every return is per year.
+"""
+
+import numpy as np
+
+DEFAULT_CAGR_WINDOWS = (1, 3, 5, 10)
+
+
+# ============================================================
+# 1. Growth
+# ============================================================
+
+def cagr(values: np.ndarray, years, window: int) -> np.ndarray:
+    """CAGR (%) from year - window to year; NaN when either end is missing."""
+    values = np.asarray(values, dtype=float)
+    years = np.asarray(years, dtype=np.int64)
+    out = np.full(values.shape, np.nan)
+    # Column holding year - window for each column (-1 if absent)
+    start = np.searchsorted(years, years - window)
+    has_start = (start < len(years)) & (years[np.minimum(start, len(years) - 1)] == years - window)
+    cols = np.flatnonzero(has_start)
+    if cols.size == 0:
+        return out
+    begin = values[:, start[cols]]
+    end = values[:, cols]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = np.where((begin > 0) & (end > 0), (end / begin) ** (1.0 / window) - 1, np.nan)
+    out[:, cols] = growth * 100
+    return out
+
+
+def annual_log_returns(values: np.ndarray, years) -> np.ndarray:
+    """
+    Per-year log return between consecutive observed years of each series,
+    placed at the later year (NaN for the first observation).
+    """
+    values = np.asarray(values, dtype=float)
+    years = np.asarray(years, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        logs = np.where(values > 0, np.log(values), np.nan)
+
+    # Last observed column before each column (forward fill of indices)
+    n_rows, n_cols = values.shape
+    observed = np.isfinite(logs)
+    idx = np.where(observed, np.arange(n_cols)[None, :], -1)
+    last_seen = np.maximum.accumulate(idx, axis=1)
+    prev = np.full((n_rows, n_cols), -1)
+    prev[:, 1:] = last_seen[:, :-1]
+
+    rows = np.arange(n_rows)[:, None]
+    prev_log = np.where(prev >= 0, logs[rows, np.maximum(prev, 0)], np.nan)
+    gap = years[None, :] - np.where(prev >= 0, years[np.maximum(prev, 0)], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(observed, (logs - prev_log) / gap, np.nan)
+
+
+def volatility(values: np.ndarray, years) -> np.ndarray:
+    """
+    Annualized volatility (%): sample std of the annual log returns from the
+    first year up to each year (needs at least two returns).
+    """
+    returns = annual_log_returns(values, years)
+    ok = np.isfinite(returns)
+    r = np.where(ok, returns, 0.0)
+    n = np.cumsum(ok, axis=1)
+    s1 = np.cumsum(r, axis=1)
+    s2 = np.cumsum(r * r, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+    var = np.where(n >= 2, np.maximum(var, 0.0), np.nan)
+    return np.sqrt(var) * 100
+
+
+# ============================================================
+# 2. Drawdowns
+# ============================================================
+
+def running_peak(values: np.ndarray) -> np.ndarray:
+    """Highest value so far (NaNs skipped)."""
+    values = np.asarray(values, dtype=float)
+    return np.fmax.accumulate(values, axis=1)
+
+
+def drawdown(values: np.ndarray) -> np.ndarray:
+    """Decline from the running peak (%, <= 0); NaN where the value is missing."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (values / running_peak(values) - 1) * 100
+
+
+def max_drawdown(values: np.ndarray) -> np.ndarray:
+    """Worst drawdown (%, <= 0) from the first year up to each year."""
+    return np.fmin.accumulate(drawdown(values), axis=1)
+
+
+def years_to_recover(values: np.ndarray, years) -> np.ndarray:
+    """
+    For the worst drawdown up to each year: years from its trough until the
+    value is back at the peak before it. 0 without any decline, NaN while
+    still below the peak as of that year.
+    """
+    values = np.asarray(values, dtype=float)
+    years = np.asarray(years, dtype=float)
+    n_rows, n_cols = values.shape
+    dd = drawdown(values)
+    peak = running_peak(values)
+    out = np.full((n_rows, n_cols), np.nan)
+    rows = np.arange(n_rows)
+
+    # One pass per year (a few dozen at most), vectorized over all series
+    for j in range(n_cols):
+        window = dd[:, : j + 1]
+        seen = np.isfinite(window).any(axis=1)
+        trough = np.argmin(np.where(np.isfinite(window), window, np.inf), axis=1)
+        trough_dd = window[rows, trough]
+        target = peak[rows, trough]
+
+        after = np.arange(j + 1)[None, :] > trough[:, None]
+        back = after & (values[:, : j + 1] >= target[:, None])
+        recovered = back.any(axis=1)
+        first = np.argmax(back, axis=1)
+
+        col = np.where(recovered, years[first] - years[trough], np.nan)
+        col = np.where(trough_dd >= 0, 0.0, col)
+        out[:, j] = np.where(seen, col, np.nan)
+    return out
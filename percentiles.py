@@ -0,0 +1,147 @@
+# percentiles.py
+"""
+National and state percentiles for ZIP metric values.
+
+compute_rankings ranks ZIPs within one metro with a groupby + rank per
+call. PercentileIndex instead keeps one year's values sorted once,
+nationally and per state, so the percentile of any value — a ZIP's own or
+an arbitrary one — is a single np.searchsorted:
+
+    percentile(v) = #{values <= v} / n × 100
+
+which is the same definition as compute_rankings (rank 1 = highest value,
+ties share the best rank, percentile 100 = highest). A ZIP's state is the
+state of its metro (the first state in city_full, e.g. "Omaha, NE-IA" →
+NE). ZIPs themselves are looked up through a sorted key array, so a ZIP's
+national and state context is O(log n) too.
+
+    index = cube.percentiles(2023, "Median Sale Price")
+    index.lookup("68102")            # national + state rank / percentile
+    index.percentile(450_000)        # where a price sits nationally
+    index.percentile(450_000, "NE")  # ... and within Nebraska
+"""
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import parse_city_state
+
+RESULT_COLUMNS = [
+    "zip_code_str", "city", "city_full", "state", "metric_value",
+    "national_rank", "national_total", "national_percentile",
+    "state_rank", "state_total", "state_percentile",
+]
+
+
+class PercentileIndex:
+    """
+    One year's ZIP values for one metric, sorted nationally and per state.
+    `frame` has zip_code_str, city, city_full and metric_value; rows
+    without a value are dropped.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        frame = frame[frame["metric_value"].notna()]
+        zips = frame["zip_code_str"].astype(str).to_numpy()
+        order = np.argsort(zips, kind="stable")
+        self.zips = zips[order]
+        self.city = frame["city"].astype(str).to_numpy()[order]
+        self.city_full = frame["city_full"].astype(str).to_numpy()[order]
+        self.values = frame["metric_value"].to_numpy(dtype=np.float64)[order]
+        states = {c: parse_city_state("", c)[1] for c in np.unique(self.city_full)}
+        self.state = np.array([states[c] for c in self.city_full], dtype=object)
+
+        self.sorted = np.sort(self.values)
+        self.by_state = {
+            state: np.sort(self.values[self.state == state])
+            for state in sorted(set(states.values()))
+        }
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def states(self) -> list:
+        return list(self.by_state)
+
+    def _values(self, state: str = None) -> np.ndarray:
+        if state is None:
+            return self.sorted
+        return self.by_state.get(str(state).upper(), self.sorted[:0])
+
+    def rank(self, value, state: str = None):
+        """
+        (rank, total) of `value` among the national (or state) values:
+        1 + the number of strictly higher values.
+        """
+        values = self._values(state)
+        higher = len(values) - np.searchsorted(values, value, side="right")
+        return higher + 1, len(values)
+
+    def percentile(self, value, state: str = None):
+        """Share of national (or state) values at or below `value`, in %."""
+        values = self._values(state)
+        if len(values) == 0:
+            return np.nan if np.ndim(value) == 0 else np.full(np.shape(value), np.nan)
+        return np.searchsorted(values, value, side="right") / len(values) * 100
+
+    def _position(self, zip_code_str: str, city_full: str = None):
+        """Row of a ZIP (binary search on the sorted ZIP keys), or None."""
+        key = str(zip_code_str)
+        lo = int(np.searchsorted(self.zips, key, side="left"))
+        hi = int(np.searchsorted(self.zips, key, side="right"))
+        if lo == hi:
+            return None
+        if city_full is not None:
+            for i in range(lo, hi):
+                if self.city_full[i] == str(city_full):
+                    return i
+        return lo
+
+    def lookup(self, zip_code_str: str, city_full: str = None):
+        """
+        National and state rank / percentile of one ZIP (a dict keyed like
+        RESULT_COLUMNS), or None when the ZIP has no value this year. A
+        ZIP listed under several metros is picked by `city_full`.
+        """
+        i = self._position(zip_code_str, city_full)
+        if i is None:
+            return None
+        value, state = self.values[i], self.state[i]
+        national_rank, national_total = self.rank(value)
+        state_rank, state_total = self.rank(value, state)
+        return {
+            "zip_code_str": self.zips[i],
+            "city": self.city[i],
+            "city_full": self.city_full[i],
+            "state": state,
+            "metric_value": float(value),
+            "national_rank": int(national_rank),
+            "national_total": int(national_total),
+            "national_percentile": round(float(self.percentile(value)), 1),
+            "state_rank": int(state_rank),
+            "state_total": int(state_total),
+            "state_percentile": round(float(self.percentile(value, state)), 1),
+        }
+
+    def table(self) -> pd.DataFrame:
+        """Every ZIP with its national and state context (RESULT_COLUMNS), by ZIP."""
+        national_rank, national_total = self.rank(self.values)
+        state_rank = np.zeros(len(self.values), dtype=np.int64)
+        state_total = np.zeros(len(self.values), dtype=np.int64)
+        for state, values in self.by_state.items():
+            mask = self.state == state
+            state_rank[mask] = len(values) - np.searchsorted(values, self.values[mask], side="right") + 1
+            state_total[mask] = len(values)
+        return pd.DataFrame({
+            "zip_code_str": self.zips,
+            "city": self.city,
+            "city_full": self.city_full,
+            "state": self.state,
+            "metric_value": self.values,
+            "national_rank": national_rank,
+            "national_total": national_total,
+            "national_percentile": np.round(self.percentile(self.values), 1),
+            "state_rank": state_rank,
+            "state_total": state_total,
+            "state_percentile": np.round((state_total - state_rank + 1) / np.maximum(state_total, 1) * 100, 1),
+        }, columns=RESULT_COLUMNS)
@@ -0,0 +1,293 @@
+# query_backend.py
+"""
+Pluggable SQL query backends.
+
+Both backends run the *same* parameterized SQL (see HOUSE_QUERY) so the
+year / metro filters the UI needs are pushed down to the engine instead
+of loading the whole table and filtering in pandas:
+
+  - DatabricksBackend : the Databricks SQL warehouse (production)
+  - DuckDBBackend     : an embedded DuckDB engine over the local Parquet /
+                        CSV files — a fully offline stand-in for Databricks,
+                        so the remote code path can be developed and tested
+                        without a warehouse
+
+Queries use `:name` parameters (Databricks native syntax); DuckDBBackend
+rewrites them to DuckDB's `$name` form. Table names are filled in per
+backend through the {house} / {zip_geo} placeholders.
+
+fetch_house_arrow() streams the result as Arrow record batches and applies
+a per-batch transform (e.g. columnar_store.standardize_house_table), so a
+large refresh never holds the raw result and a pandas copy side by side.
+"""
+
+import os
+import re
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from sql_pool import collect_arrow
+
+# ============================================================
+# 1. Shared SQL
+# ============================================================
+
+# Same shape as the original full-table Databricks query, with optional
+# pushed-down filters appended to the WHERE clause.
+HOUSE_QUERY = """
+    SELECT
+        h.city,
+        h.city_full,
+        h.zip_code,
+        h.year,
+        AVG(h.median_sale_price) AS median_sale_price,
+        AVG(h.per_capita_income) AS per_capita_income,
+        AVG(g.lat) AS lat,
+        AVG(g.lon) AS lon
+    FROM {house} h
+    LEFT JOIN {zip_geo} g
+      ON CAST(h.zip_code AS INT) = CAST(g.zip_code AS INT)
+    WHERE h.median_sale_price IS NOT NULL
+      AND h.median_sale_price > 0
+      {filters}
+    GROUP BY
+        h.city, h.city_full, h.zip_code, h.year
+"""
+
+YEAR_BOUNDS_QUERY = """
+    SELECT MIN(year) AS min_year, MAX(year) AS max_year
+    FROM {house}
+"""
+
+# Cheap per-year change detection for incremental refresh (metric_cube.py):
+# a year whose signature changed is re-fetched, the others are kept. Only
+# integer aggregates (values rounded to cents): a floating-point SUM on a
+# parallel warehouse depends on the reduction order and would change the
+# signature between runs without any data change.
+PARTITION_SIGNATURE_QUERY = """
+    SELECT
+        year,
+        COUNT(*) AS n_rows,
+        COUNT(DISTINCT zip_code) AS n_zips,
+        CAST(SUM(CAST(ROUND(median_sale_price * 100) AS BIGINT)) AS BIGINT) AS sum_price_cents,
+        CAST(SUM(CAST(ROUND(per_capita_income * 100) AS BIGINT)) AS BIGINT) AS sum_income_cents
+    FROM {house}
+    GROUP BY year
+"""
+
+# filter name → SQL fragment (parameters are bound, never interpolated)
+HOUSE_FILTERS = {
+    "year": "AND h.year = :year",
+    "year_from": "AND h.year >= :year_from",
+    "year_to": "AND h.year <= :year_to",
+    "city": "AND h.city = :city",
+}
+
+
+def build_house_query(**filters):
+    """
+    Return (sql_template, params) for the aggregated house query with the
+    given filters, e.g. build_house_query(year=2023) or
+    build_house_query(city="seattle"). None values are ignored.
+    """
+    params = {k: v for k, v in filters.items() if v is not None}
+    unknown = set(params) - set(HOUSE_FILTERS)
+    if unknown:
+        raise ValueError(f"Unsupported house filters: {sorted(unknown)}")
+    clauses = "\n      ".join(HOUSE_FILTERS[k] for k in HOUSE_FILTERS if k in params)
+    return HOUSE_QUERY.replace("{filters}", clauses), params
+
+
+# ============================================================
+# 2. Backends
+# ============================================================
+
+class QueryBackend:
+    """Base class: fill table placeholders, run SQL, return a DataFrame."""
+
+    name = "base"
+
+    def tables(self) -> dict:
+        raise NotImplementedError
+
+    # `refresh=True` skips any result cache in front of the engine
+
+    def execute(self, query: str, params: dict = None, refresh: bool = False) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def execute_arrow(self, query: str, params: dict = None, transform=None,
+                      refresh: bool = False) -> pa.Table:
+        """Arrow result with `transform` applied per batch (fallback: one batch)."""
+        table = pa.Table.from_pandas(self.execute(query, params, refresh), preserve_index=False)
+        return collect_arrow([table], transform)
+
+    def render(self, template: str) -> str:
+        return template.format(**self.tables())
+
+    def fetch_house(self, **filters) -> pd.DataFrame:
+        template, params = build_house_query(**filters)
+        return self.execute(self.render(template), params)
+
+    def fetch_house_arrow(self, transform=None, **filters) -> pa.Table:
+        template, params = build_house_query(**filters)
+        return self.execute_arrow(self.render(template), params, transform)
+
+    def partition_signatures(self) -> dict:
+        """{year: signature string}, always read fresh from the engine."""
+        df = self.execute(self.render(PARTITION_SIGNATURE_QUERY), refresh=True)
+        def as_int(v):
+            return "" if pd.isna(v) else str(int(v))
+
+        return {
+            int(row.year): ":".join(
+                as_int(v) for v in (row.n_rows, row.n_zips, row.sum_price_cents, row.sum_income_cents)
+            )
+            for row in df.itertuples(index=False)
+        }
+
+    def year_bounds(self):
+        df = self.execute(self.render(YEAR_BOUNDS_QUERY))
+        if df.empty or pd.isna(df["min_year"].iloc[0]):
+            return None
+        return int(df["min_year"].iloc[0]), int(df["max_year"].iloc[0])
+
+
+class DatabricksBackend(QueryBackend):
+    """
+    Runs queries on the Databricks SQL warehouse through `executor`
+    (a sql_pool.PooledExecutor), using native `:name` parameter binding.
+    """
+
+    name = "databricks"
+
+    def __init__(self, executor, house_table: str, zip_geo_table: str):
+        self._executor = executor
+        self._tables = {"house": house_table, "zip_geo": zip_geo_table}
+
+    def tables(self) -> dict:
+        return self._tables
+
+    def execute(self, query: str, params: dict = None, refresh: bool = False) -> pd.DataFrame:
+        return self._executor(query, params, refresh=refresh)
+
+    def execute_arrow(self, query: str, params: dict = None, transform=None,
+                      refresh: bool = False) -> pa.Table:
+        return self._executor.execute_arrow(query, params, transform, refresh=refresh)
+
+
+_NAMED_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Embedded DuckDB over local files, standing in for Databricks.
+
+    - house   : house_parquet if it exists, otherwise the CSV
+    - zip_geo : zip_geo_parquet if it exists, otherwise derived from the
+                house file's lat/lon (the shipped CSV is pre-joined)
+
+    One in-memory database holds the views; every query runs on its own
+    cursor, which DuckDB makes safe to use from Streamlit's threads.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, house_file: str, house_parquet: str = None, zip_geo_parquet: str = None,
+                 batch_rows: int = 100_000):
+        import duckdb  # optional dependency, only needed for this backend
+
+        self.batch_rows = batch_rows
+        self._conn = duckdb.connect(database=":memory:")
+        self._lock = threading.Lock()
+
+        if house_parquet and os.path.exists(house_parquet):
+            house_src = f"read_parquet('{_sql_path(house_parquet)}')"
+        elif house_file.lower().endswith(".parquet"):
+            house_src = f"read_parquet('{_sql_path(house_file)}')"
+        else:
+            house_src = f"read_csv_auto('{_sql_path(house_file)}', header = true)"
+        self._conn.execute(f"CREATE VIEW house AS SELECT * FROM {house_src}")
+
+        if zip_geo_parquet and os.path.exists(zip_geo_parquet):
+            self._conn.execute(
+                f"CREATE VIEW zip_geo AS SELECT * FROM read_parquet('{_sql_path(zip_geo_parquet)}')"
+            )
+        else:
+            self._conn.execute(
+                """
+                CREATE VIEW zip_geo AS
+                SELECT zip_code, AVG(lat) AS lat, AVG(lon) AS lon
+                FROM house
+                GROUP BY zip_code
+                """
+            )
+
+    def tables(self) -> dict:
+        return {"house": "house", "zip_geo": "zip_geo"}
+
+    @staticmethod
+    def to_duckdb_params(query: str) -> str:
+        """`:name` → `$name` (leaves `::` casts alone)."""
+        return _NAMED_PARAM.sub(r"$\1", query)
+
+    def execute(self, query: str, params: dict = None, refresh: bool = False) -> pd.DataFrame:
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            cursor.execute(self.to_duckdb_params(query), params or {})
+            return cursor.fetch_df()
+        finally:
+            cursor.close()
+
+    def execute_arrow(self, query: str, params: dict = None, transform=None,
+                      refresh: bool = False) -> pa.Table:
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            cursor.execute(self.to_duckdb_params(query), params or {})
+            reader = cursor.fetch_record_batch(self.batch_rows)
+            chunks = (pa.Table.from_batches([batch]) for batch in reader)
+            return collect_arrow(
+                _with_schema(chunks, reader.schema), transform
+            )
+        finally:
+            cursor.close()
+
+
+def _with_schema(chunks, schema: pa.Schema):
+    """Yield `chunks`, or one empty table with `schema` if there are none."""
+    empty = True
+    for chunk in chunks:
+        empty = False
+        yield chunk
+    if empty:
+        yield schema.empty_table()
+
+
+def _sql_path(path: str) -> str:
+    return os.path.abspath(path).replace("'", "''")
+
+
+# ============================================================
+# 3. Local Parquet export (for the DuckDB stand-in)
+# ============================================================
+
+def export_local_parquet(house_file: str, house_parquet: str, zip_geo_parquet: str = None):
+    """
+    Convert the local house CSV into the Parquet layout the DuckDB backend
+    reads (and optionally a zip_geo table), mirroring the Databricks tables.
+    """
+    if house_file.lower().endswith(".parquet"):
+        house = pd.read_parquet(house_file)
+    else:
+        house = pd.read_csv(house_file)
+    house.to_parquet(house_parquet, index=False)
+
+    if zip_geo_parquet:
+        zip_geo = (
+            house.groupby("zip_code", as_index=False)
+            .agg(lat=("lat", "mean"), lon=("lon", "mean"))
+        )
+        zip_geo.to_parquet(zip_geo_parquet, index=False)
@@ -0,0 +1,308 @@
+# spatial_index.py
+"""
+Spatial indexes over the CBSA / ZCTA shapes for lookups by coordinate.
+
+Every "which metro / ZIP is here" question used to be answered by scanning
+all geometries (or all centroids) in pandas. A SpatialIndex is built once
+per shape load and answers the same questions from trees:
+
+  - contains(lon, lat)      : keys of the polygons containing a point
+                              (shapely STRtree, exact point-in-polygon)
+  - locate(lons, lats)      : vectorized version, one key per point
+  - nearest(lon, lat, k)    : k nearest centroids by great-circle distance
+                              (scipy cKDTree on 3D unit vectors, so the
+                              distances are correct away from the equator)
+  - within(lon, lat, miles) : every centroid inside a radius
+  - bbox(minx, miny, ...)   : keys of the polygons intersecting a box
+
+AdjacencyGraph holds polygon contiguity (which ZCTAs share a border) as a
+sparse CSR matrix, computed offline with one STRtree query
+(polygon_adjacency) and stored next to the shapes.
+
+PointIndex is the centroid half on its own, for plain lat/lon points such
+as the dataset's ZIP coordinates.
+
+Coordinates are always lon/lat degrees (EPSG:4326); the shapes are
+reprojected once when the index is built. The shared, cached indexes live
+in geo_utils (get_cbsa_index / get_zcta_index).
+"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy import sparse
+from scipy.spatial import cKDTree
+from shapely import STRtree
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+# ============================================================
+# 1. Great-circle helpers
+# ============================================================
+
+def unit_vectors(lons, lats) -> np.ndarray:
+    """(n, 3) unit vectors on the sphere for lon/lat degrees."""
+    lon = np.radians(np.asarray(lons, dtype=float))
+    lat = np.radians(np.asarray(lats, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_miles(chord) -> np.ndarray:
+    """Straight-line distance between unit vectors → great-circle miles."""
+    chord = np.clip(np.asarray(chord, dtype=float), 0.0, 2.0)
+    return 2.0 * EARTH_RADIUS_MILES * np.arcsin(chord / 2.0)
+
+
+def miles_to_chord(miles) -> np.ndarray:
+    angle = np.clip(np.asarray(miles, dtype=float) / EARTH_RADIUS_MILES, 0.0, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+def haversine_miles(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Great-circle distance in miles (broadcasts over arrays)."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=float)) for v in (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def circle_lonlat(lon: float, lat: float, miles: float, n: int = 72):
+    """Closed ring of (lons, lats) `miles` around a point, for drawing a radius."""
+    angle = float(miles) / EARTH_RADIUS_MILES
+    bearing = np.linspace(0.0, 2.0 * np.pi, n + 1)
+    lat0, lon0 = np.radians(lat), np.radians(lon)
+    lat1 = np.arcsin(
+        np.sin(lat0) * np.cos(angle) + np.cos(lat0) * np.sin(angle) * np.cos(bearing)
+    )
+    lon1 = lon0 + np.arctan2(
+        np.sin(bearing) * np.sin(angle) * np.cos(lat0),
+        np.cos(angle) - np.sin(lat0) * np.sin(lat1),
+    )
+    return np.degrees(lon1), np.degrees(lat1)
+
+
+# ============================================================
+# 2. Index
+# ============================================================
+
+class PointIndex:
+    """
+    Points (e.g. ZIP centroids) keyed by `key_col`, in a cKDTree over 3D
+    unit vectors. Rows with missing coordinates are skipped; positions
+    (0..n-1) follow the order of the remaining rows.
+    """
+
+    def __init__(self, keys, lons, lats, key_col: str = "key"):
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        finite = np.isfinite(lons) & np.isfinite(lats)
+        self.key_col = key_col
+        self.rows = np.flatnonzero(finite)   # positions in the input
+        self.keys = np.asarray(keys)[finite]
+        self.lon = lons[finite]
+        self.lat = lats[finite]
+        self.kdtree = cKDTree(unit_vectors(self.lon, self.lat))
+        self._position = {}
+        for i, key in enumerate(self.keys):
+            self._position.setdefault(key, i)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def positions(self, keys) -> np.ndarray:
+        """Row positions of `keys` (unknown keys are dropped)."""
+        return np.array([self._position[k] for k in keys if k in self._position], dtype=np.int64)
+
+    def centroid(self, key):
+        """(lon, lat) of a key's point, or None if unknown."""
+        pos = self._position.get(key)
+        if pos is None:
+            return None
+        return float(self.lon[pos]), float(self.lat[pos])
+
+    # ---------- nearest / radius / distance ----------
+
+    def nearest(self, lon: float, lat: float, k: int = 1) -> pd.DataFrame:
+        """k nearest points: DataFrame [key_col, distance_miles], closest first."""
+        k = min(int(k), len(self))
+        if k <= 0:
+            return pd.DataFrame({self.key_col: [], "distance_miles": []})
+        chord, idx = self.kdtree.query(unit_vectors([lon], [lat])[0], k=k)
+        idx = np.atleast_1d(idx)
+        return pd.DataFrame(
+            {self.key_col: self.keys[idx], "distance_miles": chord_to_miles(np.atleast_1d(chord))}
+        )
+
+    def query_radius(self, lon: float, lat: float, miles: float):
+        """(positions, distance_miles) of every point within `miles`, closest first."""
+        center = unit_vectors([lon], [lat])[0]
+        idx = np.asarray(self.kdtree.query_ball_point(center, float(miles_to_chord(miles))), dtype=np.int64)
+        if idx.size == 0:
+            return idx, np.empty(0)
+        dist = chord_to_miles(np.linalg.norm(self.kdtree.data[idx] - center, axis=1))
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
+
+    def within(self, lon: float, lat: float, miles: float) -> pd.DataFrame:
+        """Points within `miles`: DataFrame [key_col, distance_miles], closest first."""
+        idx, dist = self.query_radius(lon, lat, miles)
+        return pd.DataFrame({self.key_col: self.keys[idx], "distance_miles": dist})
+
+    def distances(self, lon: float, lat: float, keys) -> np.ndarray:
+        """Great-circle miles from (lon, lat) to the points of `keys` (NaN if unknown)."""
+        pos = np.array([self._position.get(k, -1) for k in keys], dtype=np.int64)
+        out = np.full(len(pos), np.nan)
+        known = pos >= 0
+        out[known] = haversine_miles(lon, lat, self.lon[pos[known]], self.lat[pos[known]])
+        return out
+
+
+class SpatialIndex(PointIndex):
+    """
+    Polygons of one shape layer keyed by `key_col`: an STRtree over the
+    polygons plus the PointIndex queries over their centroids.
+
+    Query results are returned as keys, so callers do not depend on row
+    positions (polygons with an empty centroid have no point).
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame, key_col: str):
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+        self.geometries = np.asarray(gdf.geometry.values)
+        self.tree = STRtree(self.geometries)
+        self.geometry_keys = gdf[key_col].to_numpy()
+
+        centroids = shapely.centroid(self.geometries)
+        super().__init__(self.geometry_keys, shapely.get_x(centroids), shapely.get_y(centroids), key_col)
+
+    # ---------- point in polygon ----------
+
+    def contains(self, lon: float, lat: float) -> list:
+        """Keys of every polygon containing (lon, lat), boundaries included."""
+        hits = self.tree.query(shapely.points(lon, lat), predicate="intersects")
+        return [self.geometry_keys[i] for i in np.sort(hits)]
+
+    def locate(self, lons, lats) -> np.ndarray:
+        """
+        One key per point (object array, None where no polygon contains it).
+        A point on a shared boundary gets the first polygon in row order.
+        """
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        out = np.full(len(lons), None, dtype=object)
+        valid = np.flatnonzero(np.isfinite(lons) & np.isfinite(lats))
+        if valid.size == 0 or len(self.geometries) == 0:
+            return out
+
+        points = shapely.points(lons[valid], lats[valid])
+        point_idx, geom_idx = self.tree.query(points, predicate="intersects")
+        if point_idx.size:
+            order = np.lexsort((geom_idx, point_idx))
+            point_idx, geom_idx = point_idx[order], geom_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            out[valid[point_idx[first]]] = self.geometry_keys[geom_idx[first]]
+        return out
+
+    # ---------- window ----------
+
+    def bbox(self, minx: float, miny: float, maxx: float, maxy: float) -> list:
+        """Keys of every polygon intersecting the lon/lat box."""
+        hits = self.tree.query(shapely.box(minx, miny, maxx, maxy), predicate="intersects")
+        return [self.geometry_keys[i] for i in np.sort(hits)]
+
+
+
+# ============================================================
+# 3. Adjacency graph
+# ============================================================
+
+def polygon_adjacency(geometries) -> sparse.csr_matrix:
+    """
+    Contiguity of polygons (shared edge or corner, or overlap from
+    generalized boundaries) as a symmetric boolean CSR matrix without self
+    loops. One bulk STRtree query instead of pairwise `touches` checks.
+    """
+    geometries = np.asarray(geometries)
+    n = len(geometries)
+    if n == 0:
+        return sparse.csr_matrix((0, 0), dtype=bool)
+    tree = STRtree(geometries)
+    left, right = tree.query(geometries, predicate="intersects")
+    keep = left != right
+    left, right = left[keep], right[keep]
+    matrix = sparse.csr_matrix(
+        (np.ones(len(left), dtype=bool), (left, right)), shape=(n, n)
+    )
+    return (matrix + matrix.T).tocsr()
+
+
+class AdjacencyGraph:
+    """
+    ZCTA adjacency keyed by integer ZIP: row i of `matrix` holds the
+    neighbors of zip_codes[i], with zip_codes sorted so a lookup is a
+    binary search.
+    """
+
+    def __init__(self, zip_codes, matrix):
+        self.zip_codes = np.asarray(zip_codes, dtype=np.int64)
+        self.matrix = sparse.csr_matrix(matrix, dtype=bool)
+
+    @classmethod
+    def from_csr_arrays(cls, zip_codes, indptr, indices):
+        """Wrap stored CSR arrays (e.g. an Arrow list column) without copying them."""
+        n = len(zip_codes)
+        data = np.ones(len(indices), dtype=bool)
+        return cls(zip_codes, sparse.csr_matrix((data, indices, indptr), shape=(n, n)))
+
+    def __len__(self) -> int:
+        return len(self.zip_codes)
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.matrix.nnz // 2)
+
+    def _row(self, zip_code) -> int:
+        try:
+            value = int(zip_code)
+        except (TypeError, ValueError):
+            return -1
+        pos = int(np.searchsorted(self.zip_codes, value))
+        if pos < len(self.zip_codes) and self.zip_codes[pos] == value:
+            return pos
+        return -1
+
+    def rows(self, zip_codes) -> np.ndarray:
+        """Matrix row of each ZIP (ints or strings), -1 where unknown."""
+        values = pd.to_numeric(pd.Series(np.asarray(zip_codes)), errors="coerce")
+        values = values.fillna(-1).astype("int64").to_numpy()
+        if len(self.zip_codes) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self.zip_codes, values), 0, len(self.zip_codes) - 1)
+        return np.where(self.zip_codes[pos] == values, pos, -1)
+
+    def weights_for(self, zip_codes) -> sparse.csr_matrix:
+        """
+        Binary n×n contiguity among `zip_codes`, in their order (repeated
+        ZIPs share the same neighbors; unknown ZIPs have none).
+        """
+        rows = self.rows(zip_codes)
+        n = len(rows)
+        known = np.flatnonzero(rows >= 0)
+        sub = self.matrix[rows[known]][:, rows[known]].tocoo()
+        return sparse.csr_matrix(
+            (np.ones(sub.nnz), (known[sub.row], known[sub.col])), shape=(n, n)
+        )
+
+    def neighbors(self, zip_code) -> list:
+        """5-digit ZIP strings adjacent to `zip_code` (empty if unknown)."""
+        row = self._row(zip_code)
+        if row < 0:
+            return []
+        cols = self.matrix.indices[self.matrix.indptr[row]:self.matrix.indptr[row + 1]]
+        return [f"{z:05d}" for z in np.sort(self.zip_codes[cols])]
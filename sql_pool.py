@@ -0,0 +1,427 @@
+# sql_pool.py
+"""
+Connection pooling + disk-backed result cache for the SQL warehouse path.
+
+Opening a Databricks connection pays TLS, authentication and session
+setup, which dominates once the app issues small per-year / per-metro
+queries. This module keeps connections open and reuses them:
+
+  - ConnectionPool  : thread-safe pool of DB-API connections with a
+                      liveness ping before reusing an idle connection and
+                      a maximum connection lifetime
+  - ResultCache     : query results on disk (Parquet), keyed by the
+                      normalized SQL text + parameters, with a TTL and
+                      explicit invalidation by table name
+  - PooledExecutor  : `executor(query, params) -> DataFrame` combining both;
+                      plugs into query_backend.DatabricksBackend.
+                      execute_arrow() streams the result in Arrow batches
+                      (fetchmany_arrow) and transforms each batch as it
+                      arrives, so the raw result is never held in full
+
+Everything works with any DB-API 2.0 driver, so the warehouse code path can
+be exercised offline, e.g. against sqlite3 (which also uses `:name`
+parameters):
+
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False))
+    run = PooledExecutor(pool, ResultCache("/tmp/sql-cache", ttl_seconds=60))
+    df = run("SELECT * FROM house WHERE year = :year", {"year": 2023})
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+
+
+# ============================================================
+# 1. Connection pool
+# ============================================================
+
+class _PooledConnection:
+    __slots__ = ("conn", "created", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Up to `max_size` open connections shared by all threads.
+
+    - connection() hands out an idle connection (or opens a new one) and
+      blocks up to `timeout` seconds when all of them are in use
+    - a connection idle for more than `ping_after` seconds is checked with
+      `ping_sql` before reuse; a failed ping replaces it transparently
+    - connections older than `max_lifetime` seconds are recycled
+    - a connection whose caller raised is closed instead of returned,
+      since its session state is unknown
+    """
+
+    def __init__(
+        self,
+        connect,
+        max_size: int = 4,
+        timeout: float = 30.0,
+        ping_sql: str = "SELECT 1",
+        ping_after: float = 60.0,
+        max_lifetime: float = 3600.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_sql = ping_sql
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+
+        self._idle = []          # LIFO: the most recently used stays warm
+        self._open = 0           # idle + checked out
+        self._cond = threading.Condition()
+        self.stats = {"opened": 0, "reused": 0, "closed": 0, "ping_failures": 0}
+
+    # ---------- checkout / return ----------
+
+    @contextmanager
+    def connection(self):
+        pooled = self._acquire()
+        try:
+            yield pooled.conn
+        except BaseException:
+            self._discard(pooled)
+            raise
+        else:
+            self._release(pooled)
+
+    def _acquire(self) -> _PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+                    if self._open < self.max_size:
+                        self._open += 1
+                        pooled = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No SQL connection available after {self.timeout:.0f}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            if pooled is None:
+                break
+            # Health-check outside the lock: a slow ping must not block
+            # every other acquire / release
+            if self._usable(pooled):
+                with self._cond:
+                    self.stats["reused"] += 1
+                return pooled
+            self._discard(pooled)
+
+        # Open outside the lock: connecting is the slow part
+        try:
+            with timed("sql.connect"):
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats["opened"] += 1
+        return _PooledConnection(conn)
+
+    def _release(self, pooled: _PooledConnection):
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard(self, pooled: _PooledConnection):
+        with self._cond:
+            self._close(pooled)
+            self._cond.notify()
+
+    # ---------- health ----------
+
+    def _usable(self, pooled: _PooledConnection) -> bool:
+        """Called without the lock (may ping the warehouse); closes nothing itself."""
+        now = time.monotonic()
+        if self.max_lifetime and now - pooled.created > self.max_lifetime:
+            return False
+        if self.ping_sql and now - pooled.last_used > self.ping_after:
+            try:
+                cursor = pooled.conn.cursor()
+                try:
+                    cursor.execute(self.ping_sql)
+                    cursor.fetchall()
+                finally:
+                    cursor.close()
+            except Exception:
+                with self._cond:
+                    self.stats["ping_failures"] += 1
+                return False
+        return True
+
+    def _close(self, pooled: _PooledConnection):
+        """Called with the lock held."""
+        self._open -= 1
+        self.stats["closed"] += 1
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close idle connections (checked-out ones are unaffected)."""
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop())
+            self._cond.notify_all()
+
+
+# ============================================================
+# 2. Result cache
+# ============================================================
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace so formatting changes do not miss the cache."""
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class ResultCache:
+    """
+    Query results stored as Parquet files under `cache_dir`.
+
+    Entries are keyed by normalized SQL + parameters and expire after
+    `ttl_seconds` (0 disables the cache). Each entry records the table
+    names it was built from, so invalidate(tables=[...]) drops only the
+    affected results after a data refresh.
+    """
+
+    def __init__(self, cache_dir: str, ttl_seconds: float = 3600.0):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cache_dir) and self.ttl_seconds > 0
+
+    def key(self, query: str, params: dict = None, variant: str = "") -> str:
+        """`variant` separates differently post-processed copies of a result."""
+        payload = json.dumps(
+            {"sql": normalize_sql(query), "params": params or {}, "variant": variant},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.parquet", f"{base}.json"
+
+    def get(self, query: str, params: dict = None, variant: str = ""):
+        """Cached Arrow table, or None on a miss / expired entry."""
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(self.key(query, params, variant))
+        try:
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+            if time.time() - meta["created"] > self.ttl_seconds:
+                self._remove(data_path, meta_path)
+                return None
+            return pq.read_table(data_path)
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            return None
+
+    def put(self, query: str, params: dict, table: pa.Table, tables=(), variant: str = ""):
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, meta_path = self._paths(self.key(query, params, variant))
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        # Data first, metadata last: a reader never sees metadata without data
+        pq.write_table(table, data_path + suffix)
+        os.replace(data_path + suffix, data_path)
+        meta = {
+            "created": time.time(),
+            "sql": normalize_sql(query),
+            "params": params or {},
+            "tables": sorted(tables),
+        }
+        with open(meta_path + suffix, "w") as fh:
+            json.dump(meta, fh, default=str)
+        os.replace(meta_path + suffix, meta_path)
+
+    def invalidate(self, tables=None) -> int:
+        """
+        Drop cached results. With `tables`, only entries built from any of
+        those tables; otherwise everything. Returns the number removed.
+        """
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return 0
+        wanted = {t.lower() for t in tables} if tables else None
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                meta_path = os.path.join(self.cache_dir, name)
+                data_path = meta_path[: -len(".json")] + ".parquet"
+                if wanted is not None:
+                    try:
+                        with open(meta_path) as fh:
+                            used = {t.lower() for t in json.load(fh).get("tables", [])}
+                    except (OSError, ValueError):
+                        used = set(wanted)  # unreadable → drop it
+                    if not used & wanted:
+                        continue
+                self._remove(data_path, meta_path)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# ============================================================
+# 3. Executor
+# ============================================================
+
+def iter_arrow_chunks(cursor, batch_rows: int = 100_000):
+    """
+    Yield the result set as Arrow tables of up to `batch_rows` rows.
+    Uses fetchmany_arrow when the driver has it (Databricks); plain DB-API
+    drivers go through fetchmany, where each column's type is inferred per
+    chunk: a column that is all NULL in one chunk takes the type it had in
+    earlier chunks (collect_arrow promotes the rest). Always yields at
+    least one (possibly empty) chunk so the schema is known.
+    """
+    if hasattr(cursor, "fetchmany_arrow"):
+        first = True
+        while True:
+            chunk = cursor.fetchmany_arrow(batch_rows)
+            if chunk.num_rows == 0:
+                if first:
+                    yield chunk
+                return
+            first = False
+            yield chunk
+
+    names = [d[0] for d in cursor.description or []]
+    types = {}
+    first = True
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            if first:
+                yield pa.table({n: pa.array([], type=pa.null()) for n in names})
+            return
+        first = False
+        columns = {}
+        for n, col in zip(names, zip(*rows)):
+            arr = pa.array(col)
+            if pa.types.is_null(arr.type) and n in types:
+                arr = arr.cast(types[n])
+            elif not pa.types.is_null(arr.type):
+                types.setdefault(n, arr.type)
+            columns[n] = arr
+        yield pa.table(columns)
+
+
+def collect_arrow(chunks, transform=None) -> pa.Table:
+    """
+    Apply `transform` to each chunk as it arrives and concatenate. Drivers
+    that infer types per chunk can disagree between chunks (an all-NULL
+    column is `null`, ints vs floats): every chunk, empty ones included,
+    is cast to one schema unified with permissive promotion.
+    """
+    chunks = [transform(c) if transform is not None else c for c in chunks]
+    if not chunks:
+        return pa.table({})
+    schema = pa.unify_schemas([c.schema for c in chunks], promote_options="permissive")
+    kept = [c.select(schema.names).cast(schema) for c in chunks if c.num_rows]
+    if kept:
+        return pa.concat_tables(kept)
+    return chunks[0].select(schema.names).cast(schema)
+
+
+class PooledExecutor:
+    """
+    `executor(query, params) -> DataFrame`: result cache first, then a
+    pooled connection. `tables` lists the table names to look for in each
+    query so cache entries can be invalidated per table.
+    """
+
+    def __init__(self, pool: ConnectionPool, cache: ResultCache = None, tables=(),
+                 batch_rows: int = 100_000):
+        self.pool = pool
+        self.cache = cache
+        self.tables = list(tables)
+        self.batch_rows = batch_rows
+
+    def _tables_in(self, query: str):
+        lowered = query.lower()
+        return [t for t in self.tables if t.lower() in lowered]
+
+    def execute_arrow(self, query: str, params: dict = None, transform=None,
+                      refresh: bool = False) -> pa.Table:
+        """
+        Run `query` and return an Arrow table, streamed in batches with
+        `transform(chunk) -> chunk` applied per batch. The transformed
+        result is what gets cached (keyed by the transform's name).
+        `refresh=True` skips the cache lookup and overwrites the entry.
+        """
+        variant = getattr(transform, "__name__", "") if transform is not None else ""
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(query, params, variant)
+            if cached is not None:
+                return cached
+
+        with timed("sql.query"):
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    table = collect_arrow(iter_arrow_chunks(cursor, self.batch_rows), transform)
+                finally:
+                    cursor.close()
+
+        if self.cache is not None:
+            self.cache.put(query, params, table, self._tables_in(query), variant)
+        return table
+
+    def __call__(self, query: str, params: dict = None, refresh: bool = False) -> pd.DataFrame:
+        return self.execute_arrow(query, params, refresh=refresh).to_pandas()
+
+    def invalidate(self, tables=None) -> int:
+        return self.cache.invalidate(tables) if self.cache is not None else 0
@@ -0,0 +1,416 @@
+# static_reports.py
+"""
+Batch renderer for the weekly static reports.
+
+For every (year, metric) it builds, with the same charts.py builders as
+the app,
+
+  - the national metro choropleth          → {year}/{metric}/national.*
+  - every metro's ZIP choropleth           → {year}/{metric}/metros/{city}.*
+
+and writes each figure as standalone HTML (sharing one plotly.min.js at
+the output root) and / or Plotly JSON, optionally PNG (needs kaleido).
+Figures are basemap-independent: one map style is baked in and the JSON
+can be restyled by changing layout.mapbox.style.
+
+Work is spread over a process pool. The parent loads the cube, the CBSA
+and ZCTA shapes and every metric table once; on Linux the workers are
+forked and share those read-only inputs copy-on-write (elsewhere each
+worker loads them once in its initializer). Each artifact is keyed by a
+content hash of its input rows, the shapes and the rendering code, kept in
+manifest.json, so an interrupted or repeated run only renders what is
+missing or changed.
+
+Usage (from the repository root):
+
+    python static_reports.py --out reports/                 # everything
+    python static_reports.py --years 2023 --metrics "Median Sale Price"
+    python static_reports.py --workers 32 --png --force
+"""
+
+import argparse
+import hashlib
+import html
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import config_data as cd
+import geo_utils
+import instrumentation
+from charts import create_city_choropleth, create_zip_choropleth
+from config_data import compute_rankings
+import metric_cube
+from metric_cube import get_metric_cube
+from metrics import concrete_metrics
+
+DEFAULT_OUT = os.path.join(cd.DATA_DIR, "reports")
+DEFAULT_MAP_STYLE = "carto-positron"
+FORMATS = ("html", "json")
+MANIFEST = "manifest.json"
+PLOTLY_JS = "plotly.min.js"
+NATIONAL = "national"
+
+# Source files whose changes invalidate every artifact: the figure code and
+# everything that computes the values it draws (cube tables, metric
+# definitions, rankings, CBSA matching)
+_CODE_FILES = (
+    "charts.py", "config_data.py", "geo_utils.py", "metric_cube.py", "metrics.py",
+    "panel_metrics.py", "spatial_index.py", "static_reports.py",
+)
+# Manifest flush interval while rendering (seconds)
+_FLUSH_SECONDS = 5.0
+
+
+# ============================================================
+# 1. Jobs
+# ============================================================
+
+def slug(text: str) -> str:
+    """File-safe name: "Price CAGR (5y)" → "price-cagr-5y"."""
+    return re.sub(r"[^a-z0-9]+", "-", str(text).lower()).strip("-") or "_"
+
+
+def artifact_key(year: int, metric: str, scope: str) -> str:
+    """Path of an artifact below the output root, without extension."""
+    if scope == NATIONAL:
+        return f"{year}/{slug(metric)}/{NATIONAL}"
+    return f"{year}/{slug(metric)}/metros/{slug(scope)}"
+
+
+def _frame_digest(df: pd.DataFrame) -> bytes:
+    if df.empty:
+        return b"empty"
+    df = df.sort_index(axis=1)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+
+
+def _file_digest(paths) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            h.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def render_fingerprint(map_style: str, formats, png: bool) -> str:
+    """Hash of everything outside the data rows: code, shapes and options."""
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _CODE_FILES:
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    shape_files = [
+        cd.CBSA_SHP_PATH, cd.CBSA_ZIP_PATH, cd.ZCTA_SHP_PATH, cd.ZCTA_ZIP_PATH,
+        os.path.join(cd.LOCAL_STORE_DIR, "cbsa.arrow"), os.path.join(cd.LOCAL_STORE_DIR, "zcta.arrow"),
+        os.path.join(cd.LOCAL_STORE_DIR, "zip_cbsa.arrow"),
+    ]
+    h.update(_file_digest(shape_files).encode())
+    h.update(json.dumps([map_style, sorted(formats), bool(png)]).encode())
+    return h.hexdigest()
+
+
+def plan_jobs(cube, years, metrics, metros=None, national_only=False) -> list:
+    """
+    Every (year, metric, scope) to render with its input tables computed
+    (in the parent, so forked workers inherit them): list of
+    (year, metric, scope, input rows).
+    """
+    jobs = []
+    for year in years:
+        for metric in metrics:
+            df_city = cube.city_metric(year, metric)
+            if df_city.empty:
+                continue
+            jobs.append((year, metric, NATIONAL, df_city))
+            if national_only:
+                continue
+            df_zip = cube.zip_metric(year, metric)
+            cities = sorted(df_zip["city"].astype(str).unique())
+            if metros:
+                cities = [c for c in cities if c in set(metros)]
+            city_col = df_zip["city"].astype(str)
+            for city in cities:
+                jobs.append((year, metric, city, df_zip[city_col == city]))
+    return jobs
+
+
+def job_hash(fingerprint: str, year: int, metric: str, scope: str, rows: pd.DataFrame) -> str:
+    h = hashlib.sha256(fingerprint.encode())
+    h.update(f"{year}|{metric}|{scope}".encode())
+    h.update(_frame_digest(rows))
+    return h.hexdigest()
+
+
+# ============================================================
+# 2. Workers
+# ============================================================
+
+# Read-only inputs: filled in the parent before the pool forks, or by
+# _init_worker when workers are spawned
+_SHARED = {}
+
+
+def load_inputs() -> dict:
+    """The fully built cube + CBSA and ZCTA shapes, bypassing the Streamlit caches."""
+    # No background hotspot warm-up: its thread must not be running when
+    # the pool forks, and reports don't use hotspots
+    os.environ[metric_cube.WARM_HOTSPOTS_ENV] = "0"
+    return {
+        "cube": inspect.unwrap(get_metric_cube)(),
+        "cbsa": inspect.unwrap(geo_utils.load_cbsa_shapes)(),
+        "zcta": inspect.unwrap(geo_utils.load_zcta_shapes)(),
+    }
+
+
+def _quiet():
+    """No per-phase log lines or bare-mode Streamlit warnings from batch runs."""
+    instrumentation.logger.setLevel(logging.WARNING)
+    for name in [n for n in logging.root.manager.loggerDict if n.startswith("streamlit")]:
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def _init_worker(options: dict):
+    _quiet()
+    if "cube" not in _SHARED:
+        _SHARED.update(load_inputs())
+    _SHARED["options"] = options
+
+
+def build_figure(year: int, metric: str, scope: str, rows: pd.DataFrame):
+    """The app's figure for one job (None when there is nothing to draw)."""
+    map_style = _SHARED["options"]["map_style"]
+    if scope == NATIONAL:
+        fig, _ = create_city_choropleth(rows, _SHARED["cbsa"], map_style, metric)
+        return fig
+    zip_df_city, gdf_merge = geo_utils.get_zip_polygons_for_metro(scope, _SHARED["zcta"], rows)
+    if gdf_merge.empty:
+        return None
+    zip_df_city = zip_df_city[zip_df_city["zip_code_str"].isin(gdf_merge["zip_code_str"])]
+    if zip_df_city.empty:
+        return None
+    zip_df_city = compute_rankings(zip_df_city, "metric_value", "zip_code_str")
+    fig, _ = create_zip_choropleth(gdf_merge, map_style, None, zip_df_city, metric)
+    return fig
+
+
+def _title(year: int, metric: str, scope: str, rows: pd.DataFrame) -> str:
+    if scope == NATIONAL:
+        return f"{metric} by metro · {year}"
+    name = rows["city_full"].iloc[0] if "city_full" in rows and len(rows) else scope
+    return f"{metric} by ZIP · {name} · {year}"
+
+
+def write_figure(fig, base: str, out_dir: str, title: str, formats, png: bool) -> list:
+    """Write one figure as <base>.html / .json / .png; returns relative paths."""
+    path = os.path.join(out_dir, base)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.update_layout(title=dict(text=title, x=0.01), margin=dict(t=40))
+    written = []
+    if "html" in formats:
+        depth = base.count("/")
+        fig.write_html(path + ".html", include_plotlyjs="../" * depth + PLOTLY_JS, full_html=True)
+        written.append(base + ".html")
+    if "json" in formats:
+        with open(path + ".json", "w") as f:
+            f.write(fig.to_json())
+        written.append(base + ".json")
+    if png:
+        fig.write_image(path + ".png", width=1200, height=800)
+        written.append(base + ".png")
+    return written
+
+
+def render_job(job) -> dict:
+    """Build and write one artifact (runs in a worker)."""
+    year, metric, scope, rows, digest = job
+    instrumentation.start_rerun()
+    options = _SHARED["options"]
+    start = time.perf_counter()
+    base = artifact_key(year, metric, scope)
+    try:
+        fig = build_figure(year, metric, scope, rows)
+        files = [] if fig is None else write_figure(
+            fig, base, options["out_dir"], _title(year, metric, scope, rows),
+            options["formats"], options["png"],
+        )
+        error = None
+    except Exception as e:  # one bad metro must not stop the batch
+        files, error = [], f"{type(e).__name__}: {e}"
+    return {
+        "key": base, "hash": digest, "files": files, "error": error,
+        "year": year, "metric": metric, "scope": scope,
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+# ============================================================
+# 3. Manifest + index
+# ============================================================
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir: str, manifest: dict):
+    """Atomic write, so an interrupted run never leaves a broken manifest."""
+    path = os.path.join(out_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def up_to_date(entry, digest: str, out_dir: str) -> bool:
+    return (
+        entry is not None
+        and entry.get("hash") == digest
+        and all(os.path.exists(os.path.join(out_dir, p)) for p in entry.get("files", []))
+    )
+
+
+def write_index(out_dir: str, manifest: dict):
+    """index.html linking every rendered artifact, by year and metric."""
+    groups = {}
+    for entry in manifest.values():
+        page = next((p for p in entry["files"] if p.endswith(".html")), None) or next(iter(entry["files"]), None)
+        if page:
+            groups.setdefault((entry["year"], entry["metric"]), []).append((entry["scope"], page))
+    parts = ["<!DOCTYPE html><html><head><meta charset='utf-8'><title>Static map reports</title>",
+             "<style>body{font-family:sans-serif;margin:2em}li{display:inline-block;margin:0 1em 0.3em 0}</style>",
+             "</head><body><h1>Static map reports</h1>"]
+    for (year, metric), pages in sorted(groups.items(), key=lambda kv: (-kv[0][0], kv[0][1])):
+        pages.sort(key=lambda p: (p[0] != NATIONAL, p[0]))
+        links = "".join(
+            f"<li><a href='{html.escape(page)}'>{html.escape('National' if scope == NATIONAL else scope)}</a></li>"
+            for scope, page in pages
+        )
+        parts.append(f"<h3>{year} · {html.escape(metric)}</h3><ul>{links}</ul>")
+    parts.append("</body></html>")
+    with open(os.path.join(out_dir, "index.html"), "w") as f:
+        f.write("".join(parts))
+
+
+# ============================================================
+# 4. Driver
+# ============================================================
+
+def render_reports(out_dir: str, years=None, metrics=None, metros=None, national_only=False,
+                   formats=FORMATS, png=False, map_style=DEFAULT_MAP_STYLE, workers=None,
+                   force=False, progress=None) -> dict:
+    """
+    Render every outdated artifact into `out_dir`; returns counts
+    {"total", "rendered", "skipped", "empty", "failed"}.
+    """
+    _quiet()
+    os.makedirs(out_dir, exist_ok=True)
+    if "cube" not in _SHARED:
+        _SHARED.update(load_inputs())
+    cube = _SHARED["cube"]
+    years = [int(y) for y in (years or cube.years())]
+    metrics = concrete_metrics(metrics)
+
+    fingerprint = render_fingerprint(map_style, formats, png)
+    manifest = {} if force else load_manifest(out_dir)
+    todo = []
+    counts = {"total": 0, "rendered": 0, "skipped": 0, "empty": 0, "failed": 0}
+    for year, metric, scope, rows in plan_jobs(cube, years, metrics, metros, national_only):
+        counts["total"] += 1
+        digest = job_hash(fingerprint, year, metric, scope, rows)
+        if up_to_date(manifest.get(artifact_key(year, metric, scope)), digest, out_dir):
+            counts["skipped"] += 1
+        else:
+            todo.append((year, metric, scope, rows, digest))
+
+    if "html" in formats and not os.path.exists(os.path.join(out_dir, PLOTLY_JS)):
+        from plotly.offline import get_plotlyjs
+        with open(os.path.join(out_dir, PLOTLY_JS), "w") as f:
+            f.write(get_plotlyjs())
+
+    options = {"out_dir": out_dir, "formats": tuple(formats), "png": png, "map_style": map_style}
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    failures = []
+    last_flush = time.monotonic()
+    if todo:
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(), mp_context=context,
+            initializer=_init_worker, initargs=(options,),
+        ) as pool:
+            futures = [pool.submit(render_job, job) for job in todo]
+            for future in as_completed(futures):
+                result = future.result()
+                if result["error"]:
+                    counts["failed"] += 1
+                    failures.append(f"{result['key']}: {result['error']}")
+                else:
+                    counts["rendered" if result["files"] else "empty"] += 1
+                    manifest[result["key"]] = {
+                        k: result[k] for k in ("hash", "files", "year", "metric", "scope")
+                    }
+                if progress:
+                    progress(counts)
+                if time.monotonic() - last_flush > _FLUSH_SECONDS:
+                    save_manifest(out_dir, manifest)
+                    last_flush = time.monotonic()
+
+    save_manifest(out_dir, manifest)
+    write_index(out_dir, manifest)
+    counts["failures"] = failures
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the static map reports.")
+    parser.add_argument("--out", default=DEFAULT_OUT, help=f"Output folder (default {DEFAULT_OUT})")
+    parser.add_argument("--years", nargs="*", type=int, help="Years (default: all)")
+    parser.add_argument("--metrics", nargs="*", help="Metric names (default: all, every CAGR window)")
+    parser.add_argument("--metros", nargs="*", help="Metro keys (default: all)")
+    parser.add_argument("--national-only", action="store_true", help="Only the national metro maps")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--png", action="store_true", help="Also write PNGs (needs kaleido)")
+    parser.add_argument("--map-style", default=DEFAULT_MAP_STYLE)
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and re-render everything")
+    args = parser.parse_args(argv)
+
+    if args.png:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error("--png needs the kaleido package (pip install kaleido)")
+
+    def progress(counts):
+        done = counts["rendered"] + counts["empty"] + counts["failed"]
+        print(f"\r{done:,} rendered, {counts['failed']:,} failed", end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    counts = render_reports(
+        args.out, args.years, args.metrics, args.metros, args.national_only,
+        args.formats, args.png, args.map_style, args.workers, args.force, progress,
+    )
+    print(file=sys.stderr)
+    for line in counts.pop("failures"):
+        print(f"FAILED {line}", file=sys.stderr)
+    print(
+        f"{counts['total']:,} artifacts: {counts['rendered']:,} rendered, "
+        f"{counts['skipped']:,} up to date, {counts['empty']:,} empty, {counts['failed']:,} failed "
+        f"→ {args.out} ({time.perf_counter() - start:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
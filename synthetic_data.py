@@ -0,0 +1,427 @@
+# synthetic_data.py
+"""
+Deterministic synthetic dataset generator for scaling tests.
+
+Produces data with the same schema as the shipped files, so every hot path
+(build_city_cbsa_polygons, compute_yoy, the ZIP merge, the dashboard) can
+be measured at 10× / 100× the real row count, or at monthly granularity,
+on a laptop without real data:
+
+  - house_ts_agg.csv            city, city_full, zip_code, year,
+                                median_sale_price, per_capita_income, lat, lon
+                                (+ month, date when freq="monthly")
+  - cb_2018_us_cbsa_500k.shp    CBSA polygons (NAME, CBSAFP, GEOID, ...)
+  - cb_2018_us_zcta510_500k.shp ZCTA polygons (ZCTA5CE10, GEOID10, ...)
+
+The same (n_metros, zips_per_metro, seed) always gives the same layout, so
+the time series and the polygons always line up: every ZIP's lat/lon falls
+inside its ZCTA polygon, and every ZCTA lies inside its metro's CBSA.
+
+Usage:
+    python synthetic_data.py --preset 10x --out data_synth
+    python synthetic_data.py --metros 50 --zips-per-metro 100 --periods 144 \\
+        --freq monthly --out data_synth_monthly
+
+Then point the app or the benchmarks at it with DATA511_DATA_DIR=data_synth.
+"""
+
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# ============================================================
+# 1. Presets & name pools
+# ============================================================
+
+# ZIP codes are 10000 + i and must stay 5-digit (API validation, joins to
+# ZCTA keys), so layouts are capped at MAX_ZIPS ZIPs
+MAX_ZIPS = 89_999
+
+# Roughly the shape of the shipped dataset (≈30 metros, 12 annual periods),
+# then 10× and 100× the row count. 100× would need more ZIPs than fit in
+# five digits, so it scales through monthly periods instead.
+SCALE_PRESETS = {
+    "1x": dict(n_metros=30, zips_per_metro=200, n_periods=12),
+    "10x": dict(n_metros=150, zips_per_metro=400, n_periods=12),
+    "100x": dict(n_metros=300, zips_per_metro=240, n_periods=100, freq="monthly"),
+    "monthly": dict(n_metros=30, zips_per_metro=200, n_periods=144, freq="monthly"),
+}
+
+_PREFIXES = [
+    "Ash", "Bel", "Cedar", "Dun", "Elm", "Fair", "Glen", "Har", "Iron", "Jas",
+    "Kings", "Lake", "Mill", "North", "Oak", "Pine", "Quin", "River", "Stone",
+    "Tall", "Union", "Vale", "West", "York",
+]
+_SUFFIXES = ["ton", "field", "ville", "wood", "port", "burg", "dale", "view", "haven", "ford"]
+_STATES = [
+    "AL", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "ID", "IL", "IN",
+    "IA", "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT",
+    "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA",
+    "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY",
+]
+
+# Same extent as US_BOUNDS in config_data (kept local so this module has no
+# Streamlit import and can run in a plain build script)
+_WEST, _EAST, _SOUTH, _NORTH = -124.0, -67.0, 25.0, 49.0
+
+CRS = "EPSG:4269"  # NAD83, like the Census cartographic boundary files
+
+
+def _place_name(i: int) -> str:
+    n = len(_PREFIXES) * len(_SUFFIXES)
+    base = _PREFIXES[i % len(_PREFIXES)] + _SUFFIXES[(i // len(_PREFIXES)) % len(_SUFFIXES)]
+    return base if i < n else f"{base} {i // n + 1}"
+
+
+# ============================================================
+# 2. Layout (shared by the time series and the polygons)
+# ============================================================
+
+def _layout(n_metros: int, zips_per_metro: int, seed: int = 0):
+    """
+    Place metros on a grid over the continental U.S. and tile each metro
+    with a k×k grid of ZIP cells.
+
+    Returns
+    -------
+    (metros, zips)
+        metros : DataFrame [metro_idx, city, city_full, cbsa_name, cbsafp,
+                            xmin, ymin, xmax, ymax]
+        zips   : DataFrame [zip_code, metro_idx, xmin, ymin, xmax, ymax,
+                            lat, lon]
+    """
+    if n_metros * zips_per_metro > MAX_ZIPS:
+        raise ValueError(
+            f"{n_metros} metros × {zips_per_metro} ZIPs exceeds {MAX_ZIPS:,} 5-digit ZIP codes; "
+            "scale rows with more periods instead"
+        )
+    rng = np.random.default_rng(seed)
+
+    n_cols = max(1, math.ceil(math.sqrt(n_metros * (_EAST - _WEST) / (_NORTH - _SOUTH))))
+    n_rows = max(1, math.ceil(n_metros / n_cols))
+    cell_w = (_EAST - _WEST) / n_cols
+    cell_h = (_NORTH - _SOUTH) / n_rows
+    side = 0.7 * min(cell_w, cell_h)
+
+    idx = np.arange(n_metros)
+    col = idx % n_cols
+    row = idx // n_cols
+    jitter = rng.uniform(0.0, 1.0, size=(n_metros, 2))
+    xmin = _WEST + col * cell_w + jitter[:, 0] * (cell_w - side)
+    ymin = _SOUTH + row * cell_h + jitter[:, 1] * (cell_h - side)
+
+    cities, city_full, cbsa_name = [], [], []
+    for i in range(n_metros):
+        first = _place_name(i)
+        second = _place_name(i * 7 + 3)
+        state = _STATES[i % len(_STATES)]
+        cities.append(first.lower().replace(" ", "_"))
+        full = f"{first}-{second}, {state}"
+        city_full.append(full)
+        # Every fifth CBSA carries an extra principal city so the exact /
+        # contains match fails and the fuzzy token matcher is exercised.
+        if i % 5 == 4:
+            cbsa_name.append(f"{first}-{second}-{_place_name(i * 11 + 5)}, {state}")
+        else:
+            cbsa_name.append(full)
+
+    metros = pd.DataFrame(
+        {
+            "metro_idx": idx,
+            "city": cities,
+            "city_full": city_full,
+            "cbsa_name": cbsa_name,
+            "cbsafp": [f"{10000 + i * 5:05d}" for i in idx],
+            "xmin": xmin,
+            "ymin": ymin,
+            "xmax": xmin + side,
+            "ymax": ymin + side,
+        }
+    )
+
+    k = max(1, math.ceil(math.sqrt(zips_per_metro)))
+    zcell = side / k
+    local = np.arange(zips_per_metro)
+    lx = local % k
+    ly = local // k
+
+    metro_of_zip = np.repeat(idx, zips_per_metro)
+    zxmin = xmin[metro_of_zip] + np.tile(lx, n_metros) * zcell
+    zymin = ymin[metro_of_zip] + np.tile(ly, n_metros) * zcell
+    n_zips = n_metros * zips_per_metro
+    # Representative point strictly inside the cell (not the exact centre)
+    offset = rng.uniform(0.3, 0.7, size=(n_zips, 2)) * zcell
+
+    zips = pd.DataFrame(
+        {
+            "zip_code": 10000 + np.arange(n_zips),
+            "metro_idx": metro_of_zip,
+            "xmin": zxmin,
+            "ymin": zymin,
+            "xmax": zxmin + zcell,
+            "ymax": zymin + zcell,
+            "lon": zxmin + offset[:, 0],
+            "lat": zymin + offset[:, 1],
+        }
+    )
+    return metros, zips
+
+
+# ============================================================
+# 3. Time series
+# ============================================================
+
+def generate_house_ts(
+    n_metros: int = 30,
+    zips_per_metro: int = 200,
+    n_periods: int = 12,
+    start_year: int = 2012,
+    freq: str = "annual",
+    missing_rate: float = 0.02,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Generate a house-price / income panel with the house_ts_agg.csv schema.
+
+    Prices follow a metro-level trend (log random walk with drift) times a
+    persistent ZIP premium plus small idiosyncratic noise; incomes grow more
+    slowly. About `missing_rate` of the price cells are left empty to mimic
+    gaps in the real data.
+
+    freq="annual"  → one row per ZIP per year (n_periods years)
+    freq="monthly" → one row per ZIP per month (n_periods months), with
+                     extra `month` and `date` columns
+    """
+    if freq not in ("annual", "monthly"):
+        raise ValueError("freq must be 'annual' or 'monthly'")
+
+    metros, zips = _layout(n_metros, zips_per_metro, seed)
+    rng = np.random.default_rng(seed + 1)
+    n_zips = len(zips)
+    steps_per_year = 12 if freq == "monthly" else 1
+
+    # Metro-level price path: log random walk with drift
+    drift = rng.normal(0.04, 0.02, size=n_metros) / steps_per_year
+    shocks = rng.normal(0.0, 0.05 / math.sqrt(steps_per_year), size=(n_metros, n_periods))
+    log_path = np.cumsum(drift[:, None] + shocks, axis=1)
+    metro_base = rng.lognormal(mean=np.log(350_000), sigma=0.4, size=n_metros)
+
+    zip_metro = zips["metro_idx"].to_numpy()
+    zip_premium = rng.lognormal(mean=0.0, sigma=0.35, size=n_zips)
+    noise = rng.normal(0.0, 0.03, size=(n_zips, n_periods))
+    price = (
+        metro_base[zip_metro, None]
+        * zip_premium[:, None]
+        * np.exp(log_path[zip_metro] + noise)
+    )
+
+    income_base = rng.lognormal(mean=np.log(42_000), sigma=0.25, size=n_zips)
+    income_growth = rng.normal(0.025, 0.01, size=n_zips) / steps_per_year
+    steps = np.arange(n_periods)
+    income = income_base[:, None] * np.exp(income_growth[:, None] * steps[None, :])
+    income *= np.exp(rng.normal(0.0, 0.01, size=(n_zips, n_periods)))
+
+    price[rng.random(price.shape) < missing_rate] = np.nan
+
+    period_year = start_year + steps // steps_per_year
+    df = pd.DataFrame(
+        {
+            "city": np.repeat(metros["city"].to_numpy()[zip_metro], n_periods),
+            "city_full": np.repeat(metros["city_full"].to_numpy()[zip_metro], n_periods),
+            "zip_code": np.repeat(zips["zip_code"].to_numpy(), n_periods),
+            "year": np.tile(period_year, n_zips),
+            "median_sale_price": price.ravel().round(0),
+            "per_capita_income": income.ravel().round(0),
+            "lat": np.repeat(zips["lat"].to_numpy(), n_periods).round(6),
+            "lon": np.repeat(zips["lon"].to_numpy(), n_periods).round(6),
+        }
+    )
+    if freq == "monthly":
+        month = np.tile(steps % 12 + 1, n_zips)
+        df.insert(4, "month", month)
+        df.insert(
+            5,
+            "date",
+            pd.to_datetime({"year": df["year"], "month": month, "day": 1}).dt.strftime("%Y-%m-%d"),
+        )
+    return df
+
+
+# ============================================================
+# 4. Polygons
+# ============================================================
+
+def _densify(geoms, vertices_per_edge: int):
+    """Add vertices along every edge so shapes cost as much as real ones."""
+    if vertices_per_edge <= 1:
+        return geoms
+    width = shapely.bounds(geoms)
+    edge = np.maximum(width[:, 2] - width[:, 0], width[:, 3] - width[:, 1])
+    return shapely.segmentize(geoms, edge / vertices_per_edge)
+
+
+def generate_shapes(
+    n_metros: int = 30,
+    zips_per_metro: int = 200,
+    seed: int = 0,
+    vertices_per_edge: int = 8,
+    extra_cbsas: int = 0,
+):
+    """
+    Generate CBSA and ZCTA polygons matching generate_house_ts(...) for the
+    same (n_metros, zips_per_metro, seed).
+
+    - CBSAs are one square per metro, named like the Census NAME column
+    - ZCTAs tile each metro square edge to edge (so adjacency is realistic)
+    - extra_cbsas adds decoy CBSAs with no data (real files have ~900 CBSAs
+      but the dataset covers far fewer) to keep the name matcher honest
+
+    Returns (cbsa_gdf, zcta_gdf) in EPSG:4269.
+    """
+    metros, zips = _layout(n_metros, zips_per_metro, seed)
+
+    cbsa_geoms = shapely.box(metros["xmin"], metros["ymin"], metros["xmax"], metros["ymax"])
+    cbsa = gpd.GeoDataFrame(
+        {
+            "CSAFP": "",
+            "CBSAFP": metros["cbsafp"],
+            "AFFGEOID": "310M400US" + metros["cbsafp"],
+            "GEOID": metros["cbsafp"],
+            "NAME": metros["cbsa_name"],
+            "LSAD": "M1",
+            "ALAND": 0,
+            "AWATER": 0,
+        },
+        geometry=_densify(np.asarray(cbsa_geoms), vertices_per_edge),
+        crs=CRS,
+    )
+
+    if extra_cbsas:
+        rng = np.random.default_rng(seed + 2)
+        x = rng.uniform(_WEST, _EAST - 0.3, size=extra_cbsas)
+        y = rng.uniform(_SOUTH, _NORTH - 0.3, size=extra_cbsas)
+        names = [
+            f"{_place_name(n_metros * 13 + i)}, {_STATES[(i * 3) % len(_STATES)]}"
+            for i in range(extra_cbsas)
+        ]
+        codes = [f"{60000 + i:05d}" for i in range(extra_cbsas)]
+        decoys = gpd.GeoDataFrame(
+            {
+                "CSAFP": "",
+                "CBSAFP": codes,
+                "AFFGEOID": ["310M400US" + c for c in codes],
+                "GEOID": codes,
+                "NAME": names,
+                "LSAD": "M2",
+                "ALAND": 0,
+                "AWATER": 0,
+            },
+            geometry=_densify(np.asarray(shapely.box(x, y, x + 0.3, y + 0.3)), vertices_per_edge),
+            crs=CRS,
+        )
+        cbsa = pd.concat([cbsa, decoys], ignore_index=True)
+
+    zip_str = zips["zip_code"].astype(str).str.zfill(5)
+    zcta_geoms = shapely.box(zips["xmin"], zips["ymin"], zips["xmax"], zips["ymax"])
+    zcta = gpd.GeoDataFrame(
+        {
+            "ZCTA5CE10": zip_str,
+            "AFFGEOID10": "8600000US" + zip_str,
+            "GEOID10": zip_str,
+            "ALAND10": 0,
+            "AWATER10": 0,
+        },
+        geometry=_densify(np.asarray(zcta_geoms), vertices_per_edge),
+        crs=CRS,
+    )
+    return cbsa, zcta
+
+
+# ============================================================
+# 5. Writing a full data folder
+# ============================================================
+
+def write_dataset(
+    out_dir: str,
+    n_metros: int = 30,
+    zips_per_metro: int = 200,
+    n_periods: int = 12,
+    start_year: int = 2012,
+    freq: str = "annual",
+    seed: int = 0,
+    vertices_per_edge: int = 8,
+    extra_cbsas: int = 0,
+    house_format: str = "csv",
+) -> dict:
+    """
+    Write a complete data folder (time series + shapefiles) that can be
+    used as DATA511_DATA_DIR. Returns the paths written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    house = generate_house_ts(
+        n_metros, zips_per_metro, n_periods, start_year=start_year, freq=freq, seed=seed
+    )
+    house_path = os.path.join(out_dir, f"house_ts_agg.{house_format}")
+    if house_format == "parquet":
+        house.to_parquet(house_path, index=False)
+    else:
+        house.to_csv(house_path, index=False)
+
+    cbsa, zcta = generate_shapes(
+        n_metros, zips_per_metro, seed=seed,
+        vertices_per_edge=vertices_per_edge, extra_cbsas=extra_cbsas,
+    )
+    cbsa_path = os.path.join(out_dir, "cb_2018_us_cbsa_500k.shp")
+    zcta_path = os.path.join(out_dir, "cb_2018_us_zcta510_500k.shp")
+    cbsa.to_file(cbsa_path)
+    zcta.to_file(zcta_path)
+
+    return {"house": house_path, "cbsa": cbsa_path, "zcta": zcta_path, "rows": len(house)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic data folder.")
+    parser.add_argument("--out", required=True, help="Output folder")
+    parser.add_argument("--preset", choices=sorted(SCALE_PRESETS), default=None)
+    parser.add_argument("--metros", type=int, default=None)
+    parser.add_argument("--zips-per-metro", type=int, default=None)
+    parser.add_argument("--periods", type=int, default=None, help="Years (annual) or months (monthly)")
+    parser.add_argument("--freq", choices=["annual", "monthly"], default=None)
+    parser.add_argument("--start-year", type=int, default=2012)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vertices-per-edge", type=int, default=8)
+    parser.add_argument("--extra-cbsas", type=int, default=0)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args(argv)
+
+    params = dict(SCALE_PRESETS.get(args.preset, SCALE_PRESETS["1x"]))
+    if args.metros is not None:
+        params["n_metros"] = args.metros
+    if args.zips_per_metro is not None:
+        params["zips_per_metro"] = args.zips_per_metro
+    if args.periods is not None:
+        params["n_periods"] = args.periods
+    if args.freq is not None:
+        params["freq"] = args.freq
+
+    paths = write_dataset(
+        args.out,
+        start_year=args.start_year,
+        seed=args.seed,
+        vertices_per_edge=args.vertices_per_edge,
+        extra_cbsas=args.extra_cbsas,
+        house_format=args.format,
+        **params,
+    )
+    print(f"Wrote {paths['rows']:,} rows to {paths['house']}")
+    print(f"Wrote shapes to {paths['cbsa']} and {paths['zcta']}")
+
+
+if __name__ == "__main__":
+    main()
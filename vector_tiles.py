@@ -0,0 +1,628 @@
+# vector_tiles.py
+"""
+Mapbox Vector Tiles (MVT) of every ZCTA for the nationwide ZIP map.
+
+Drawing all ~33k ZCTAs as one GeoJSON choropleth is far too heavy for the
+browser, so the national ZIP view uses vector tiles instead:
+
+  - build   : the ZCTA shapefile is projected to Web Mercator once, then
+              for every zoom simplified (vectorized), clipped per tile and
+              encoded as MVT. Tiles hold geometry + the ZIP only and are
+              stored gzipped in one MBTiles (SQLite) file. No network or
+              external tile tools are needed.
+  - serve   : a small threaded HTTP endpoint serves /zcta/{z}/{x}/{y}.pbf
+              from that file (plus plotly.js from the installed plotly
+              package), so the browser only fetches the tiles in view.
+  - render  : national_zip_map_html() returns a page that draws the tiles
+              with the map bundled in plotly.js and colors them by joining
+              the selected year's {zip: value} in the browser, so changing
+              the year or metric sends new values, never new geometry.
+
+Build once (offline, from ZCTA_SHP_PATH / ZCTA_ZIP_PATH):
+
+    python vector_tiles.py build [--max-zoom 10]
+
+The app starts the endpoint itself; `python vector_tiles.py serve` runs it
+standalone.
+
+The MVT protobuf is small enough to write by hand (no protobuf or
+mapbox-vector-tile dependency): Tile.layers → Layer(name, features, keys,
+values, extent) → Feature(id, tags, type, geometry).
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import plotly.graph_objects as go
+import shapely
+import streamlit as st
+
+from config_data import (
+    ZCTA_TILES_PATH,
+    TILE_SERVER_HOST,
+    TILE_SERVER_PORT,
+    US_CENTER_LAT,
+    US_CENTER_LON,
+    US_ZOOM_LEVEL,
+)
+from instrumentation import timed, track_cache, mark_cache_miss
+from metrics import UNITS
+
+LAYER_NAME = "zcta"
+EXTENT = 4096
+# Geometry outside the tile kept on each side, in tile units (no seams)
+BUFFER = 64
+# Simplification tolerance, in tile units (4096 units ≈ 256 screen px)
+SIMPLIFY_UNITS = 4.0
+MIN_ZOOM = 3
+MAX_ZOOM = 10
+
+# Web Mercator half-width in meters
+_ORIGIN = 20037508.342789244
+
+
+# ============================================================
+# 1. Protobuf / MVT encoding
+# ============================================================
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    value = int(value)
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_array(values: np.ndarray):
+    """
+    Varint-encode a uint array in one pass: (bytes, byte offset of every
+    value + 1 trailing) so slices of the array map to slices of the bytes.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        n_bytes += values >= (np.uint64(1) << np.uint64(shift))
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(n_bytes, out=offsets[1:])
+    out = np.empty(offsets[-1], dtype=np.uint8)
+    for k in range(int(n_bytes.max()) if len(values) else 0):
+        has = n_bytes > k
+        byte = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (n_bytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[:-1][has] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes(), offsets
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Length-delimited field (wire type 2)."""
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _ring_commands(points: np.ndarray, ring_sizes: np.ndarray, feature_starts: np.ndarray) -> np.ndarray:
+    """
+    MVT command stream for consecutive rings: per ring MoveTo(1) + LineTo
+    (n - 1) + ClosePath, coordinates as zigzag deltas from the cursor. The
+    cursor starts at (0, 0) for every feature (`feature_starts` = index of
+    each feature's first point).
+    """
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=points.dtype))
+    deltas[feature_starts] = points[feature_starts]
+    zz = _zigzag(deltas)
+
+    n = ring_sizes.astype(np.int64)
+    ring_offsets = np.zeros(len(n), dtype=np.int64)
+    np.cumsum(2 * n[:-1] + 3, out=ring_offsets[1:])
+    out = np.empty(int((2 * n + 3).sum()), dtype=np.uint64)
+    out[ring_offsets] = 9                                               # MoveTo × 1
+    out[ring_offsets + 3] = (2 | ((n - 1) << 3)).astype(np.uint64)      # LineTo × n-1
+    out[ring_offsets + 2 * n + 2] = 15                                  # ClosePath
+
+    ring_of_point = np.repeat(np.arange(len(n)), n)
+    k = np.arange(len(points)) - np.repeat(np.cumsum(n) - n, n)
+    pos = ring_offsets[ring_of_point] + 1 + 2 * k + (k > 0)
+    out[pos] = zz[:, 0]
+    out[pos + 1] = zz[:, 1]
+    return out
+
+
+def encode_tile(zips, ids, points, ring_sizes, ring_feature, extent: int = EXTENT) -> bytes:
+    """
+    One-layer MVT tile of polygon features. `points` are the tile-unit
+    (int) ring vertices without closing points, `ring_sizes` the vertices
+    per ring and `ring_feature` the feature of each ring (features in
+    order, rings of one feature consecutive).
+    """
+    if len(ring_sizes) == 0:
+        return b""
+    point_feature = np.repeat(ring_feature, ring_sizes)
+    feature_starts = np.flatnonzero(np.r_[True, point_feature[1:] != point_feature[:-1]])
+    commands = _ring_commands(points, ring_sizes, feature_starts)
+    data, offsets = _varint_array(commands)
+
+    # Command index range of every feature
+    ring_len = 2 * ring_sizes.astype(np.int64) + 3
+    ring_end = np.cumsum(ring_len)
+    last_ring = np.flatnonzero(np.r_[ring_feature[1:] != ring_feature[:-1], True])
+    feature_end = ring_end[last_ring]
+    feature_begin = np.r_[0, feature_end[:-1]]
+    used = ring_feature[last_ring]
+
+    layer = [
+        _varint((15 << 3) | 0) + _varint(2),          # version
+        _field(1, LAYER_NAME.encode()),               # name
+    ]
+    for i, (begin, end) in enumerate(zip(feature_begin, feature_end)):
+        f = used[i]
+        geometry = data[offsets[begin]:offsets[end]]
+        feature = (
+            _varint((1 << 3) | 0) + _varint(ids[f])     # id
+            + _field(2, _varint(0) + _varint(i))        # tags: zip = values[i]
+            + _varint((3 << 3) | 0) + _varint(3)        # type: POLYGON
+            + _field(4, geometry)
+        )
+        layer.append(_field(2, feature))
+    layer.append(_field(3, b"zip"))
+    layer.extend(_field(4, _field(1, zips[f].encode())) for f in used)
+    layer.append(_varint((5 << 3) | 0) + _varint(extent))
+    return _field(3, b"".join(layer))
+
+
+# ============================================================
+# 2. Tiling
+# ============================================================
+
+def tile_size(z: int) -> float:
+    """Tile width in Web Mercator meters."""
+    return 2 * _ORIGIN / (1 << z)
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(minx, miny, maxx, maxy) of an XYZ tile in Web Mercator meters."""
+    size = tile_size(z)
+    minx = -_ORIGIN + x * size
+    maxy = _ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _tile_ranges(bounds: np.ndarray, z: int, pad: float):
+    """Per geometry: first / last tile column and row its padded bbox touches."""
+    size = tile_size(z)
+    last = (1 << z) - 1
+    x0 = np.clip(np.floor((bounds[:, 0] - pad + _ORIGIN) / size), 0, last).astype(np.int64)
+    x1 = np.clip(np.floor((bounds[:, 2] + pad + _ORIGIN) / size), 0, last).astype(np.int64)
+    y0 = np.clip(np.floor((_ORIGIN - bounds[:, 3] - pad) / size), 0, last).astype(np.int64)
+    y1 = np.clip(np.floor((_ORIGIN - bounds[:, 1] + pad) / size), 0, last).astype(np.int64)
+    return x0, x1, y0, y1
+
+
+def _tile_pairs(bounds: np.ndarray, z: int, pad: float):
+    """(tile x, tile y, geometry index) for every tile each geometry touches."""
+    x0, x1, y0, y1 = _tile_ranges(bounds, z, pad)
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    count = nx * ny
+    geom = np.repeat(np.arange(len(bounds)), count)
+    local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    tx = x0[geom] + local % nx[geom]
+    ty = y0[geom] + local // nx[geom]
+    return tx, ty, geom
+
+
+def _quantized_rings(clipped: np.ndarray, z: int, x: int, y: int, extent: int):
+    """
+    Clipped polygons → tile-unit rings ready for encode_tile: drops
+    closing / repeated vertices and collapsed rings, and orients rings the
+    MVT way (exterior positive area in y-down tile units, holes negative).
+    Returns (points, ring_sizes, ring_feature).
+    """
+    parts, part_geom = shapely.get_parts(clipped, return_index=True)
+    polygons = shapely.get_type_id(parts) == 3
+    parts, part_geom = parts[polygons], part_geom[polygons]
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+    empty = np.empty((0, 2), dtype=np.int64)
+    if len(coords) == 0:
+        return empty, np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    minx, _, _, maxy = tile_bounds(z, x, y)
+    scale = extent / tile_size(z)
+    pts = np.column_stack([(coords[:, 0] - minx) * scale, (maxy - coords[:, 1]) * scale])
+    pts = np.round(pts).astype(np.int64)
+
+    # Drop each ring's closing vertex and vertices repeated after rounding
+    first = np.r_[True, coord_ring[1:] != coord_ring[:-1]]
+    last = np.r_[coord_ring[1:] != coord_ring[:-1], True]
+    same = np.r_[False, (pts[1:] == pts[:-1]).all(axis=1)] & ~first
+    keep = ~last & ~same
+    pts, coord_ring = pts[keep], coord_ring[keep]
+
+    n_rings = len(rings)
+    sizes = np.bincount(coord_ring, minlength=n_rings)
+    # Shoelace area per ring (y down: positive = clockwise on screen)
+    nxt = np.arange(len(pts)) + 1
+    ring_start = np.cumsum(sizes) - sizes
+    wrap = np.r_[coord_ring[1:] != coord_ring[:-1], True] if len(pts) else np.array([], bool)
+    nxt[wrap] = ring_start[coord_ring[wrap]]
+    cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1] if len(pts) else np.array([])
+    area = np.bincount(coord_ring, weights=cross, minlength=n_rings)
+
+    exterior = np.r_[True, ring_part[1:] != ring_part[:-1]]
+    valid = (sizes >= 3) & (area != 0)
+    # A polygon whose exterior collapsed loses its holes too
+    part_ok = np.zeros(len(parts), dtype=bool)
+    part_ok[ring_part[exterior & valid]] = True
+    valid &= part_ok[ring_part]
+
+    flip = valid & np.where(exterior, area < 0, area > 0)
+    order = np.arange(len(pts))
+    if flip.any():
+        point_flip = flip[coord_ring]
+        start, size = ring_start[coord_ring], sizes[coord_ring]
+        order = np.where(point_flip, start + (size - 1 - (order - start)), order)
+    point_keep = valid[coord_ring[order]]
+    points = pts[order][point_keep]
+    ring_sizes = sizes[valid]
+    ring_feature = part_geom[ring_part[valid]]
+    return points, ring_sizes, ring_feature
+
+
+def iter_tiles(geoms_3857: np.ndarray, zips: np.ndarray, min_zoom: int = MIN_ZOOM,
+               max_zoom: int = MAX_ZOOM, extent: int = EXTENT):
+    """Yield (z, x, y, mvt bytes) for every tile holding at least one ZCTA."""
+    ids = np.array([int(z) if str(z).isdigit() else 0 for z in zips], dtype=np.int64)
+    for z in range(min_zoom, max_zoom + 1):
+        unit = tile_size(z) / extent
+        with timed(f"tiles.simplify.z{z}"):
+            simple = shapely.simplify(geoms_3857, unit * SIMPLIFY_UNITS, preserve_topology=True)
+        ok = ~shapely.is_empty(simple)
+        index = np.flatnonzero(ok)
+        if index.size == 0:
+            continue
+        bounds = shapely.bounds(simple[index])
+        tx, ty, local = _tile_pairs(bounds, z, BUFFER * unit)
+        order = np.lexsort((ty, tx))
+        tx, ty, geom = tx[order], ty[order], index[local[order]]
+        starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+        ends = np.r_[starts[1:], len(tx)]
+        for s, e in zip(starts, ends):
+            x, y = int(tx[s]), int(ty[s])
+            minx, miny, maxx, maxy = tile_bounds(z, x, y)
+            pad = BUFFER * unit
+            members = np.sort(geom[s:e])
+            clipped = shapely.clip_by_rect(simple[members], minx - pad, miny - pad, maxx + pad, maxy + pad)
+            points, sizes, ring_feature = _quantized_rings(clipped, z, x, y, extent)
+            if len(sizes) == 0:
+                continue
+            yield z, x, y, encode_tile(zips[members], ids[members], points, sizes, ring_feature, extent)
+
+
+# ============================================================
+# 3. MBTiles storage + build
+# ============================================================
+
+def _connect(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def tiles_available(path: str = ZCTA_TILES_PATH) -> bool:
+    return os.path.exists(path)
+
+
+def build_tiles(zcta_gdf, path: str, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM) -> dict:
+    """
+    Encode every ZCTA of `zcta_gdf` (needs zip_code_str + geometry) into an
+    MBTiles file at `path` (replaced atomically). Returns tile counts per zoom.
+    """
+    gdf = zcta_gdf[["zip_code_str", "geometry"]]
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+    gdf = gdf.to_crs(epsg=3857)
+    geoms = np.asarray(gdf.geometry.values)
+    zips = gdf["zip_code_str"].astype(str).str.zfill(5).to_numpy()
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.executescript(
+        """
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+        """
+    )
+    counts = {}
+    batch = []
+    for z, x, y, data in iter_tiles(geoms, zips, min_zoom, max_zoom):
+        # MBTiles rows count from the bottom (TMS)
+        batch.append((z, x, (1 << z) - 1 - y, gzip.compress(data, 6)))
+        counts[z] = counts.get(z, 0) + 1
+        if len(batch) >= 1000:
+            conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", batch)
+    conn.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+    lon_lat = zcta_gdf.to_crs(epsg=4326).total_bounds if len(zcta_gdf) else [-180, -85, 180, 85]
+    metadata = {
+        "name": "ZCTA",
+        "format": "pbf",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": ",".join(f"{v:.4f}" for v in lon_lat),
+        "json": json.dumps({"vector_layers": [
+            {"id": LAYER_NAME, "fields": {"zip": "String"}, "minzoom": min_zoom, "maxzoom": max_zoom}
+        ]}),
+    }
+    conn.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    conn.commit()
+    conn.close()
+    os.replace(tmp, path)
+    return counts
+
+
+def read_metadata(path: str) -> dict:
+    conn = _connect(path)
+    try:
+        return dict(conn.execute("SELECT name, value FROM metadata").fetchall())
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 4. Tile endpoint
+# ============================================================
+
+class _TileHandler(BaseHTTPRequestHandler):
+    """GET /zcta/{z}/{x}/{y}.pbf (gzipped MVT) and /plotly.min.js."""
+
+    server_version = "ZctaTiles/1.0"
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["plotly.min.js"]:
+            return self._send(200, self.server.plotly_js(), "application/javascript", cache=86400)
+        if len(parts) == 4 and parts[0] == LAYER_NAME and parts[3].endswith(".pbf"):
+            try:
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+            except ValueError:
+                return self._send(400, b"bad tile address", "text/plain")
+            data = self.server.tile(z, x, y)
+            # A missing tile is an empty tile, not an error
+            return self._send(200, data or b"", "application/x-protobuf",
+                              gzipped=bool(data), cache=3600)
+        self._send(404, b"not found", "text/plain")
+
+    def _send(self, status, body, content_type, gzipped=False, cache=0):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if cache:
+            self.send_header("Cache-Control", f"public, max-age={cache}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(ThreadingHTTPServer):
+    """Threaded HTTP server over one MBTiles file (one SQLite handle per thread)."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, host: str, port: int):
+        super().__init__((host, port), _TileHandler)
+        self.path = path
+        self._local = threading.local()
+        self._plotly_js = None
+
+    def tile(self, z: int, x: int, y: int):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        return row[0] if row else None
+
+    def plotly_js(self) -> bytes:
+        if self._plotly_js is None:
+            from plotly.offline import get_plotlyjs
+            self._plotly_js = get_plotlyjs().encode()
+        return self._plotly_js
+
+    def start(self) -> "TileServer":
+        threading.Thread(target=self.serve_forever, name="tile-server", daemon=True).start()
+        return self
+
+
+@track_cache("tiles.tile_server")
+@st.cache_resource(show_spinner=False)
+def get_tile_server():
+    """
+    Start the tile endpoint once per process. When the port is already
+    taken (another Streamlit worker on this node started it), that
+    server is used and None is returned.
+    """
+    mark_cache_miss()
+    try:
+        return TileServer(ZCTA_TILES_PATH, TILE_SERVER_HOST, TILE_SERVER_PORT).start()
+    except OSError:
+        return None
+
+
+# ============================================================
+# 5. Browser map
+# ============================================================
+
+def _js_number_format(unit_spec) -> dict:
+    """metrics.UNITS entry → options for the page's number formatter."""
+    prefix, fmt, suffix = unit_spec[:3]
+    decimals = int(fmt.split(".")[1][0]) if "." in fmt else 0
+    return dict(prefix=prefix, suffix=suffix, decimals=decimals,
+                grouping="," in fmt, sign="+" in fmt)
+
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<script src="__BASE__/plotly.min.js"></script>
+<style>
+  html, body { margin: 0; font-family: sans-serif; }
+  #map { width: 100%; height: __HEIGHT__px; }
+  #tip { position: absolute; pointer-events: none; display: none; background: rgba(255,255,255,0.95);
+         border: 1px solid #d1d5db; border-radius: 4px; padding: 4px 8px; font-size: 12px; }
+</style></head>
+<body><div id="map"></div><div id="tip"></div>
+<script>
+const CFG = __CONFIG__;
+const tip = document.getElementById("tip");
+function fmt(v) {
+  const f = CFG.format;
+  const text = Math.abs(v).toLocaleString("en-US", {
+    minimumFractionDigits: f.decimals, maximumFractionDigits: f.decimals, useGrouping: f.grouping });
+  return (v < 0 ? "-" : (f.sign ? "+" : "")) + f.prefix + text + f.suffix;
+}
+Plotly.newPlot("map", CFG.figure.data, CFG.figure.layout, {scrollZoom: true, displaylogo: false})
+  .then(function (gd) {
+    const map = gd._fullLayout.mapbox._subplot.map;
+    const value = ["get", ["get", "zip"], ["literal", CFG.values]];
+    const stops = [];
+    CFG.colorscale.forEach(function (s) { stops.push(CFG.vmin + s[0] * (CFG.vmax - CFG.vmin), s[1]); });
+    const color = CFG.vmax > CFG.vmin
+      ? ["interpolate", ["linear"], value].concat(stops)
+      : CFG.colorscale[CFG.colorscale.length - 1][1];
+    map.addSource("zcta", {type: "vector", tiles: [CFG.tiles], minzoom: CFG.minzoom, maxzoom: CFG.maxzoom});
+    const labels = map.getStyle().layers.find(function (l) { return l.type === "symbol"; });
+    const before = labels ? labels.id : undefined;
+    map.addLayer({id: "zcta-fill", type: "fill", source: "zcta", "source-layer": "zcta",
+      filter: ["has", ["get", "zip"], ["literal", CFG.values]],
+      paint: {"fill-color": color, "fill-opacity": 0.8}}, before);
+    map.addLayer({id: "zcta-line", type: "line", source: "zcta", "source-layer": "zcta", minzoom: 7,
+      paint: {"line-color": "#ffffff", "line-width": 0.4}}, before);
+    map.addLayer({id: "zcta-hover", type: "line", source: "zcta", "source-layer": "zcta",
+      filter: ["==", ["get", "zip"], ""], paint: {"line-color": "#111827", "line-width": 1.5}}, before);
+    map.on("mousemove", "zcta-fill", function (e) {
+      const zip = e.features[0].properties.zip;
+      map.setFilter("zcta-hover", ["==", ["get", "zip"], zip]);
+      tip.innerHTML = "<b>ZIP " + zip + "</b><br>" + CFG.label + ": " + fmt(CFG.values[zip]);
+      tip.style.left = (e.point.x + 12) + "px";
+      tip.style.top = (e.point.y + 12) + "px";
+      tip.style.display = "block";
+    });
+    map.on("mouseleave", "zcta-fill", function () {
+      map.setFilter("zcta-hover", ["==", ["get", "zip"], ""]);
+      tip.style.display = "none";
+    });
+  });
+</script></body></html>
+"""
+
+
+def national_zip_map_html(values: dict, spec, colorscale, map_style: str, base_url: str,
+                          min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM,
+                          height: int = 620) -> str:
+    """
+    Self-contained page for st.iframe(): the national ZIP map over
+    the tile endpoint at `base_url`, colored by `values` ({zip: value})
+    with the metric's colorscale. Only `values` change between years.
+    """
+    vals = np.array(list(values.values()), dtype=float)
+    vmin = float(np.nanmin(vals)) if len(vals) else 0.0
+    vmax = float(np.nanmax(vals)) if len(vals) else 1.0
+
+    # Invisible point carrying the colorbar; the map itself is tile layers
+    fig = go.Figure(
+        go.Scattermapbox(
+            lon=[US_CENTER_LON], lat=[US_CENTER_LAT], mode="markers", hoverinfo="skip",
+            marker=dict(
+                size=1, opacity=0, color=[vmin], cmin=vmin, cmax=vmax, colorscale=colorscale,
+                showscale=True,
+                colorbar=dict(title=spec.label, thickness=15, len=0.7, **spec.ticks()),
+            ),
+        )
+    )
+    fig.update_layout(
+        mapbox=dict(style=map_style, center=dict(lat=US_CENTER_LAT, lon=US_CENTER_LON), zoom=US_ZOOM_LEVEL),
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=height,
+        showlegend=False,
+    )
+    config = {
+        "figure": json.loads(fig.to_json()),
+        "values": {str(k): round(float(v), 4) for k, v in values.items() if np.isfinite(v)},
+        "colorscale": colorscale,
+        "vmin": vmin,
+        "vmax": vmax,
+        "label": spec.label,
+        "format": _js_number_format(UNITS[spec.unit]),
+        "tiles": f"{base_url.rstrip('/')}/{LAYER_NAME}/{{z}}/{{x}}/{{y}}.pbf",
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+    }
+    return (
+        _PAGE.replace("__BASE__", base_url.rstrip("/"))
+        .replace("__HEIGHT__", str(height))
+        .replace("__CONFIG__", json.dumps(config))
+    )
+
+
+# ============================================================
+# 6. CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build / serve the ZCTA vector tiles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Encode the ZCTA shapefile into MBTiles")
+    build.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    build.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    build.add_argument("--out", default=None, help="MBTiles path (default: ZCTA_TILES_PATH)")
+    serve = sub.add_parser("serve", help="Serve the tiles over HTTP")
+    serve.add_argument("--host", default=None)
+    serve.add_argument("--port", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        import inspect
+        import time
+        import geo_utils
+
+        out = args.out or ZCTA_TILES_PATH
+        start = time.perf_counter()
+        # Straight from the shapefile, bypassing the Streamlit caches
+        zcta = inspect.unwrap(geo_utils._read_zcta_shapefile)()
+        counts = build_tiles(zcta, out, args.min_zoom, args.max_zoom)
+        for z, n in sorted(counts.items()):
+            print(f"z{z:<3} {n:>8,} tiles")
+        size_mb = os.path.getsize(out) / 1024 / 1024
+        print(f"{len(zcta):,} ZCTAs → {out} ({size_mb:,.1f} MB, {time.perf_counter() - start:.1f}s)")
+    else:
+        host = args.host or TILE_SERVER_HOST
+        port = args.port or TILE_SERVER_PORT
+        server = TileServer(ZCTA_TILES_PATH, host, port)
+        print(f"Serving {ZCTA_TILES_PATH} on http://{host}:{port}/{LAYER_NAME}/{{z}}/{{x}}/{{y}}.pbf")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()